@@ -1,15 +1,20 @@
-
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from ativo.models import Ativo
+from integracao.despacho import despachar_apos_commit
+from integracao.historico_service import to_date
 from integracao.tasks import buscar_cotacoes_task
 
+
+def _despachar_busca(moeda_id):
+    return lambda data_compra: buscar_cotacoes_task.delay(moeda_id, data_compra)
+
 @receiver(post_save, sender=Ativo)
 def iniciar_busca_apos_criacao_ativo(sender, instance, created, **kwargs):
     """
     Dispara a tarefa Celery para buscar cotações ao adicionar um novo ativo.
+    O envio é adiado para o commit da transação e agrupado por moeda (com a menor data
+    de compra), de modo que a importação de vários ativos da mesma moeda gera uma única tarefa.
     """
     if created:
-        moeda = instance.moeda
-        data_compra = instance.data_compra
-        buscar_cotacoes_task.delay(moeda.id, data_compra)
+        despachar_apos_commit(('busca_cotacoes', instance.moeda_id), to_date(instance.data_compra), _despachar_busca(instance.moeda_id))
@@ -7,6 +7,7 @@ from datetime import date
 
 from django.db.models.signals import post_save
 from ativo.signals import iniciar_busca_apos_criacao_ativo
+from django.db import transaction
 
 class TestIniciarBuscaAposCriacaoAtivo(TestCase):
 
@@ -22,14 +23,57 @@ class TestIniciarBuscaAposCriacaoAtivo(TestCase):
 
     @patch('integracao.tasks.buscar_cotacoes_task.delay')
     def test_iniciar_busca_apos_criacao_ativo(self, mock_buscar_cotacoes_task):
-        # Cria um ativo, o que deve disparar o sinal
-        Ativo.objects.create(
-            moeda=self.moeda,
-            valor_compra=40.000,
-            data_compra=date(2023, 10, 1),
-            quantidade=1.0,
-            usuario=self.usuario
-        )
+        # Cria um ativo, o que deve disparar o sinal (a tarefa só é enviada no commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ativo.objects.create(
+                moeda=self.moeda,
+                valor_compra=40.000,
+                data_compra=date(2023, 10, 1),
+                quantidade=1.0,
+                usuario=self.usuario
+            )
 
         # Verifica se a tarefa Celery foi chamada
         mock_buscar_cotacoes_task.assert_called_once_with(self.moeda.id, date(2023, 10, 1))
+
+    @patch('integracao.tasks.buscar_cotacoes_task.delay')
+    def test_busca_nao_enviada_antes_do_commit(self, mock_buscar_cotacoes_task):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Ativo.objects.create(moeda=self.moeda, valor_compra=40, data_compra=date(2023, 10, 1), quantidade=1, usuario=self.usuario)
+
+        mock_buscar_cotacoes_task.assert_not_called()
+
+        # Executados os callbacks do commit, a busca é enviada uma única vez
+        for callback in callbacks:
+            callback()
+        mock_buscar_cotacoes_task.assert_called_once()
+
+    @patch('integracao.tasks.buscar_cotacoes_task.delay')
+    def test_importacao_em_lote_agrupa_por_moeda(self, mock_buscar_cotacoes_task):
+        moeda_eth = Moeda.objects.create(nome='Ethereum', token='ETH', usuario=self.usuario)
+
+        # Importa várias compras das mesmas moedas em uma transação
+        with self.captureOnCommitCallbacks(execute=True):
+            for dia in (10, 3, 20):
+                Ativo.objects.create(moeda=self.moeda, valor_compra=40, data_compra=date(2023, 10, dia), quantidade=1, usuario=self.usuario)
+            for dia in (5, 1):
+                Ativo.objects.create(moeda=moeda_eth, valor_compra=40, data_compra=date(2023, 11, dia), quantidade=1, usuario=self.usuario)
+
+        # Uma tarefa por moeda, com a menor data de compra
+        self.assertEqual(mock_buscar_cotacoes_task.call_count, 2)
+        mock_buscar_cotacoes_task.assert_any_call(self.moeda.id, date(2023, 10, 3))
+        mock_buscar_cotacoes_task.assert_any_call(moeda_eth.id, date(2023, 11, 1))
+
+    @patch('integracao.tasks.buscar_cotacoes_task.delay')
+    def test_compra_desfeita_nao_afeta_a_proxima_busca(self, mock_buscar_cotacoes_task):
+        with self.captureOnCommitCallbacks(execute=True):
+            # A compra mais antiga é desfeita junto com o savepoint
+            try:
+                with transaction.atomic():
+                    Ativo.objects.create(moeda=self.moeda, valor_compra=40, data_compra=date(2020, 1, 1), quantidade=1, usuario=self.usuario)
+                    raise ValueError('importação cancelada')
+            except ValueError:
+                pass
+            Ativo.objects.create(moeda=self.moeda, valor_compra=40, data_compra=date(2023, 10, 1), quantidade=1, usuario=self.usuario)
+
+        mock_buscar_cotacoes_task.assert_called_once_with(self.moeda.id, date(2023, 10, 1))
@@ -1,7 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import celeryd_init
 from django.conf import settings
+from kombu import Queue
 
 # Define o módulo de configuração padrão do Django para o Celery
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crypto_monitor.settings')
@@ -11,6 +13,88 @@ app = Celery('crypto_monitor')
 # Lê as configurações do Django no namespace CELERY
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
+# Filas: buscas disparadas pelo usuário (ex.: nova compra), atualizações agendadas e
+# reprocessamentos em massa. Cada fila deve ter seus próprios workers, por exemplo:
+#   celery -A crypto_monitor worker -Q interativo -n interativo@%h
+#   celery -A crypto_monitor worker -Q agendado,celery -n agendado@%h
+#   celery -A crypto_monitor worker -Q lote -n lote@%h
+FILA_INTERATIVA = 'interativo'
+FILA_AGENDADA = 'agendado'
+FILA_LOTE = 'lote'
+
+# No Redis, a prioridade 0 é a mais alta
+PRIORIDADE_ALTA = 0
+PRIORIDADE_NORMAL = 5
+PRIORIDADE_BAIXA = 9
+
+app.conf.task_queues = (
+    Queue('celery'),
+    Queue(FILA_INTERATIVA),
+    Queue(FILA_AGENDADA),
+    Queue(FILA_LOTE),
+)
+app.conf.task_default_queue = 'celery'
+app.conf.task_default_priority = PRIORIDADE_NORMAL
+
+def rotear_busca_cotacoes(nome, args, kwargs, options, task=None, **kw):
+    """
+    Roteia a busca de cotações de uma moeda pelo tamanho do período: até um bloco do backfill
+    (ex.: uma compra recente) vai para a fila interativa com prioridade alta; uma recarga
+    histórica mais longa vai para a fila de lote com prioridade baixa.
+    """
+    if nome != 'integracao.tasks.buscar_cotacoes_task':
+        return None
+    from datetime import date
+    from integracao.historico_service import INTERVALO_PADRAO, to_date
+    from integracao.paginacao import inicio_periodo, planejar_janelas
+
+    data_compra = args[1] if args and len(args) > 1 else (kwargs or {}).get('data_compra')
+    if data_compra is not None:
+        inicio = inicio_periodo(to_date(data_compra), INTERVALO_PADRAO)
+        candles_por_bloco = getattr(settings, 'INTEGRACAO_BACKFILL_CANDLES_POR_BLOCO', 12)
+        if len(planejar_janelas(inicio, date.today(), INTERVALO_PADRAO, candles_por_bloco)) > 1:
+            return {'queue': FILA_LOTE, 'priority': PRIORIDADE_BAIXA}
+    return {'queue': FILA_INTERATIVA, 'priority': PRIORIDADE_ALTA}
+
+app.conf.task_routes = (rotear_busca_cotacoes, {
+    'patrimonio.tasks.recalcular_snapshots_task': {'queue': FILA_INTERATIVA, 'priority': PRIORIDADE_NORMAL},
+    'integracao.tasks.atualizar_cotacoes_task': {'queue': FILA_AGENDADA},
+    'integracao.tasks.atualizar_bloco_cotacoes_task': {'queue': FILA_AGENDADA},
+    'integracao.tasks.consolidar_atualizacao_task': {'queue': FILA_AGENDADA},
+    'patrimonio.tasks.atualizar_snapshots_task': {'queue': FILA_LOTE, 'priority': PRIORIDADE_BAIXA},
+})
+# Prioridades no Redis: cada fila é dividida em subfilas consultadas em ordem de prioridade
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+
+# Concorrência e prefetch por fila, aplicados a workers que consomem uma única fila.
+# Prefetch 1 nas filas interativa e de lote: uma tarefa longa não segura outras já reservadas.
+CONFIGURACAO_FILAS = {
+    FILA_INTERATIVA: {'concorrencia': 8, 'prefetch': 1},
+    FILA_AGENDADA: {'concorrencia': 4, 'prefetch': 4},
+    FILA_LOTE: {'concorrencia': 2, 'prefetch': 1},
+}
+
+@celeryd_init.connect
+def configurar_worker_por_fila(sender=None, conf=None, options=None, **kwargs):
+    """
+    Ajusta concorrência e prefetch do worker de acordo com a fila que ele consome (-Q).
+    Valores passados explicitamente na linha de comando (-c) prevalecem.
+    """
+    filas = (options or {}).get('queues') or []
+    if isinstance(filas, str):
+        filas = filas.split(',')
+    configuracoes = [CONFIGURACAO_FILAS[fila] for fila in filas if fila in CONFIGURACAO_FILAS]
+    if len(configuracoes) != 1:
+        return
+    configuracao = configuracoes[0]
+    conf.worker_prefetch_multiplier = configuracao['prefetch']
+    if not options.get('concurrency'):
+        conf.worker_concurrency = configuracao['concorrencia']
+
 # Descobre automaticamente as tarefas (tasks) nos apps instalados
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
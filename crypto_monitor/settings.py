@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 from datetime import datetime, timedelta
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -176,3 +177,66 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_TASK_ALWAYS_EAGER = True  # Executa as tarefas de forma síncrona durante os testes
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# Tarefas periódicas (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'atualizar-cotacoes': {
+        'task': 'integracao.tasks.atualizar_cotacoes_task',
+        'schedule': crontab(hour=1, minute=0),  # Antes dos snapshots, com o dia anterior já fechado
+    },
+    'atualizar-snapshots-patrimonio': {
+        'task': 'patrimonio.tasks.atualizar_snapshots_task',
+        'schedule': crontab(hour=3, minute=0),  # Diariamente, após o fechamento do dia anterior
+    },
+}
+
+
+# Configurações da integração com as corretoras
+INTEGRACAO_TIMEOUT = 10  # Timeout (segundos) das requisições às corretoras
+INTEGRACAO_POOL_HOSTS = 4  # Quantidade de hosts mantidos no pool de cada sessão
+INTEGRACAO_POOL_CONEXOES_POR_HOST = 10  # Conexões keep-alive reutilizáveis por host
+INTEGRACAO_POOL_BLOQUEANTE = False  # Se True, aguarda uma conexão livre em vez de abrir uma extra
+INTEGRACAO_TAMANHO_LOTE_GRAVACAO = 500  # Cotações gravadas por INSERT na gravação em lote
+INTEGRACAO_TOLERANCIA_LACUNA_DIAS = 7  # Lacunas separadas por até N dias são buscadas em uma única requisição
+INTEGRACAO_CONCORRENCIA_MAXIMA = 10  # Requisições simultâneas no cliente assíncrono (mantenha <= conexões por host)
+INTEGRACAO_LOCK_TTL = 3600  # Tempo máximo (segundos) de uma busca de cotações com lock por moeda
+INTEGRACAO_ESPERA_LOCK = 30  # Segundos até reagendar uma busca cuja moeda já está sendo sincronizada
+INTEGRACAO_RETENTATIVAS_MAXIMAS = 5  # Novas tentativas de uma tarefa após falhas transitórias da corretora
+INTEGRACAO_RETENTATIVA_ESPERA_MAXIMA = 600  # Limite (segundos) do backoff exponencial entre as tentativas
+INTEGRACAO_ATUALIZACAO_TAMANHO_BLOCO = 20  # Moedas por tarefa na atualização periódica das cotações
+INTEGRACAO_ATUALIZACAO_CONCORRENCIA = 5  # Requisições simultâneas por tarefa da atualização periódica
+INTEGRACAO_BACKFILL_CANDLES_POR_BLOCO = 12  # Candles por bloco (checkpoint) da busca de cotações históricas
+
+# Limite de requisições por corretora e chave de API (token bucket compartilhado via Redis)
+INTEGRACAO_REDIS_URL = CELERY_BROKER_URL
+INTEGRACAO_REDIS_ESPERA_FALHA = 30  # Segundos usando o limitador em memória após uma falha do Redis
+INTEGRACAO_LIMITES_TAXA = {
+    'bybit': {'capacidade': 50, 'reposicao_por_segundo': 10},
+}
+INTEGRACAO_PESOS_ENDPOINT = {
+    'bybit': {
+        'v2/public/kline/list': 1,
+        'v2/public/time': 1,
+    },
+}
+
+# Cache (respostas dos endpoints de patrimônio), compartilhado entre os processos pelo Redis.
+# Com CRYPTO_MONITOR_CACHE_URL=locmem:// usa o cache em memória do processo (ex.: testes sem Redis)
+CACHE_URL = os.environ.get('CRYPTO_MONITOR_CACHE_URL', 'redis://localhost:6379/1')
+if CACHE_URL.startswith('locmem://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+PATRIMONIO_CACHE_TIMEOUT = 3600  # Segundos que uma resposta fica em cache (a versão dos dados já a invalida antes)
+
+# Arquivo colunar das cotações antigas (um .npy por coluna e moeda)
+MOEDA_ARQUIVO_DIR = os.path.join(BASE_DIR, 'arquivo_cotacoes')
+MOEDA_ARQUIVO_IDADE_DIAS = 365  # Cotações com mais de N dias vão para o arquivo
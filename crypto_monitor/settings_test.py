@@ -0,0 +1,9 @@
+# Configurações dos testes: python manage.py test --settings=crypto_monitor.settings_test
+from .settings import *  # noqa: F401,F403
+
+# Cache em memória: cada execução dos testes começa vazia e não depende do Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
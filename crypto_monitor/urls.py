@@ -33,7 +33,8 @@ urlpatterns = [
     path('', include('ativo.urls')),
     path('', include('patrimonio.urls')),
     path('', include('corretora.urls')),
-    path('', include('usuario.urls'))
+    path('', include('usuario.urls')),
+    path('', include('integracao.urls'))
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from integracao.historico_service import INTERVALO_PADRAO, buscar_cotacoes_historicas
+from integracao.models import BlocoBackfill, ProgressoBackfill
+from integracao.paginacao import planejar_janelas
+
+
+def preparar_backfill(moeda, data_inicial, data_final, intervalo=INTERVALO_PADRAO):
+    """
+    Obtém o backfill da moeda a partir de data_inicial, retomando um anterior não concluído
+    que já cubra essa data (com os blocos já concluídos preservados) ou criando um novo, e
+    garante que os blocos cubram todo o período até data_final. Outros backfills não
+    concluídos sobrepostos ao período são cancelados.
+    """
+    abertos = ProgressoBackfill.objects.filter(moeda=moeda, intervalo=intervalo).exclude(
+        status__in=[ProgressoBackfill.STATUS_CONCLUIDO, ProgressoBackfill.STATUS_CANCELADO]
+    )
+    # Depois de uma falha, a nova busca começa após os blocos já gravados, dentro do período anterior
+    progresso = abertos.filter(data_inicial__lte=data_inicial, data_final__gte=data_inicial).order_by('-id').first()
+    if progresso is None:
+        progresso = ProgressoBackfill.objects.create(
+            moeda=moeda, data_inicial=data_inicial, data_final=data_final, intervalo=intervalo
+        )
+    data_final = max(data_final, progresso.data_final)
+    abertos.exclude(pk=progresso.pk).filter(
+        data_inicial__lte=data_final, data_final__gte=progresso.data_inicial
+    ).update(status=ProgressoBackfill.STATUS_CANCELADO, atualizado_em=timezone.now())
+
+    candles_por_bloco = getattr(settings, 'INTEGRACAO_BACKFILL_CANDLES_POR_BLOCO', 12)
+    blocos = {bloco.inicio: bloco for bloco in progresso.blocos.all()}
+    with transaction.atomic():
+        for inicio, fim in planejar_janelas(progresso.data_inicial, data_final, intervalo, candles_por_bloco):
+            bloco = blocos.get(inicio)
+            if bloco is None:
+                BlocoBackfill.objects.create(progresso=progresso, inicio=inicio, fim=fim)
+            elif bloco.fim < fim:
+                # O último bloco cresceu com o novo fim do período: precisa ser buscado de novo
+                if bloco.concluido:
+                    progresso.blocos_concluidos -= 1
+                    progresso.linhas_gravadas -= bloco.linhas
+                bloco.fim, bloco.concluido, bloco.linhas, bloco.concluido_em = fim, False, 0, None
+                bloco.save()
+
+        progresso.data_final = data_final
+        progresso.blocos_total = progresso.blocos.count()
+        progresso.save()
+    return progresso
+
+
+def executar_backfill(progresso):
+    """
+    Busca os blocos pendentes do backfill em ordem, gravando a conclusão de cada um
+    (e o progresso) assim que suas cotações são salvas. Em caso de erro, o backfill fica
+    com status de erro e pode ser retomado do bloco em que parou.
+    """
+    progresso.status = ProgressoBackfill.STATUS_EXECUTANDO
+    progresso.iniciado_em = timezone.now()
+    progresso.blocos_retomados = progresso.blocos_concluidos
+    progresso.erro = ''
+    progresso.save()
+
+    try:
+        for bloco in progresso.blocos.filter(concluido=False).order_by('inicio'):
+            resultado = buscar_cotacoes_historicas(progresso.moeda, bloco.inicio, bloco.fim, intervalo=progresso.intervalo)
+            linhas = resultado['inseridas'] + resultado['atualizadas']
+            with transaction.atomic():
+                BlocoBackfill.objects.filter(pk=bloco.pk).update(concluido=True, linhas=linhas, concluido_em=timezone.now())
+                ProgressoBackfill.objects.filter(pk=progresso.pk).update(
+                    blocos_concluidos=F('blocos_concluidos') + 1,
+                    linhas_gravadas=F('linhas_gravadas') + linhas,
+                    atualizado_em=timezone.now()
+                )
+    except Exception as erro:
+        ProgressoBackfill.objects.filter(pk=progresso.pk).update(
+            status=ProgressoBackfill.STATUS_ERRO, erro=str(erro), atualizado_em=timezone.now()
+        )
+        raise
+
+    ProgressoBackfill.objects.filter(pk=progresso.pk).update(
+        status=ProgressoBackfill.STATUS_CONCLUIDO, concluido_em=timezone.now(), atualizado_em=timezone.now()
+    )
+    progresso.refresh_from_db()
+    return progresso
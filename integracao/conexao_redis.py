@@ -0,0 +1,43 @@
+import threading
+import time
+from django.conf import settings
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - o redis é instalado junto com o broker do Celery
+    redis = None
+
+_cliente = None
+_cliente_lock = threading.Lock()
+_indisponivel_ate = 0.0
+
+
+def obter_cliente_redis():
+    """
+    Retorna o cliente Redis compartilhado (o mesmo servidor usado pelo broker do Celery),
+    ou None se o Redis não estiver disponível no momento. Após uma falha, o Redis é
+    ignorado por INTEGRACAO_REDIS_ESPERA_FALHA segundos para não atrasar cada chamada.
+    """
+    global _cliente
+    if redis is None or time.monotonic() < _indisponivel_ate:
+        return None
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                url = getattr(settings, 'INTEGRACAO_REDIS_URL', None) or settings.CELERY_BROKER_URL
+                _cliente = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _cliente
+
+
+def marcar_redis_indisponivel():
+    global _indisponivel_ate
+    _indisponivel_ate = time.monotonic() + getattr(settings, 'INTEGRACAO_REDIS_ESPERA_FALHA', 30)
+
+
+def erros_redis():
+    """
+    Tupla de exceções que indicam indisponibilidade do Redis (para uso em blocos except).
+    """
+    if redis is None:
+        return (OSError,)
+    return (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, OSError)
@@ -0,0 +1,54 @@
+from django.db import transaction
+
+
+class _DespachoPendente:
+    """
+    Callback de on_commit que acumula os valores de uma chave. Fica registrado na própria
+    lista de callbacks da conexão: um rollback (da transação ou de um savepoint) o descarta
+    junto com os valores acumulados.
+    """
+
+    def __init__(self, chave, valor, despachar):
+        self.chave = chave
+        self.valor = valor
+        self.despachar = despachar
+        self.executado = False
+
+    def __call__(self):
+        self.executado = True
+        self.despachar(self.valor)
+
+
+def despachar_apos_commit(chave, valor, despachar, combinar=min, using=None):
+    """
+    Agenda despachar(valor) para depois do commit da transação. Chamadas com a mesma chave
+    no mesmo escopo (mesma transação e savepoint) são agrupadas em um único despacho, feito
+    pelo primeiro `despachar` registrado, com os valores combinados por `combinar` (por padrão,
+    o menor). A chave deve identificar também o tipo do despacho, por exemplo
+    ('busca_cotacoes', moeda_id). Fora de uma transação, despacha imediatamente.
+    """
+    pendente = _despacho_pendente(chave, using)
+    if pendente is not None:
+        pendente.valor = combinar(pendente.valor, valor)
+        return
+    transaction.on_commit(_DespachoPendente(chave, valor, despachar), using=using)
+
+
+def valor_despacho_pendente(chave, using=None):
+    """
+    Valor acumulado do despacho da chave já agendado no escopo atual da transação, ou None
+    se não houver nenhum.
+    """
+    pendente = _despacho_pendente(chave, using)
+    return pendente.valor if pendente is not None else None
+
+
+def _despacho_pendente(chave, using):
+    conexao = transaction.get_connection(using)
+    if not conexao.in_atomic_block:
+        return None
+    escopo = set(conexao.savepoint_ids)
+    for sids, callback, _ in conexao.run_on_commit:
+        if isinstance(callback, _DespachoPendente) and callback.chave == chave and sids == escopo and not callback.executado:
+            return callback
+    return None
@@ -0,0 +1,37 @@
+class ErroCorretora(Exception):
+    """
+    Erro na comunicação com uma corretora. `repetivel` indica se a mesma requisição
+    pode dar certo em uma nova tentativa (falhas transitórias).
+    """
+    repetivel = False
+
+    def __init__(self, mensagem, status=None, dados=None, retry_after=None):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status = status
+        self.dados = dados
+        self.retry_after = retry_after  # Segundos indicados pela corretora até a próxima tentativa
+
+
+class ErroTimeout(ErroCorretora):
+    repetivel = True
+
+
+class ErroLimiteRequisicoes(ErroCorretora):
+    repetivel = True
+
+
+class ErroServidor(ErroCorretora):
+    repetivel = True
+
+
+class ErroAutenticacao(ErroCorretora):
+    pass
+
+
+class ErroSimboloInvalido(ErroCorretora):
+    pass
+
+
+# Erros que as tarefas tentam de novo automaticamente (com backoff exponencial)
+ERROS_REPETIVEIS = (ErroTimeout, ErroLimiteRequisicoes, ErroServidor)
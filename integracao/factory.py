@@ -1,4 +1,5 @@
 from integracao.services import BybitService
+from integracao.services_async import BybitServiceAsync
 
 class CorretoraServiceFactory:
     """
@@ -11,4 +12,12 @@ class CorretoraServiceFactory:
         if nome_corretora == 'bybit':
             return BybitService(corretora_usuario)
         else:
-            raise ValueError(f"Serviço para a corretora {corretora_usuario.corretora.nome} não é suportado.")
\ No newline at end of file
+            raise ValueError(f"Serviço para a corretora {corretora_usuario.corretora.nome} não é suportado.")
+
+    @staticmethod
+    def criar_servico_async(corretora_usuario, concorrencia=None):
+        nome_corretora = (corretora_usuario.corretora.nome).lower()
+        if nome_corretora == 'bybit':
+            return BybitServiceAsync(corretora_usuario, concorrencia=concorrencia)
+        else:
+            raise ValueError(f"Serviço para a corretora {corretora_usuario.corretora.nome} não é suportado.")
@@ -1,9 +1,22 @@
 
 from datetime import timedelta
+from itertools import islice
+from django.conf import settings
+from django.db import connection, transaction
 from integracao.factory import CorretoraServiceFactory
-from moeda.models import HistoricoCotacao, Moeda
+from integracao.paginacao import avancar_periodo, inicio_periodo
+from integracao.models import SincronizacaoCotacao
+from moeda.arquivo import invalidar_arquivo
+from moeda.models import CotacaoAgregada, HistoricoCotacao, Moeda, UltimaCotacao
+from patrimonio.cache import invalidar_cache_moeda
+from patrimonio.snapshots import invalidar_snapshots_moeda
 from datetime import datetime
 
+CAMPOS_COTACAO = ['abertura', 'fechamento', 'alta', 'baixa', 'volume']
+
+# Intervalo dos candles buscados na corretora
+INTERVALO_PADRAO = '1M'
+
 def salvar_cotacao(moeda, data, abertura, fechamento, alta, baixa, volume):
     # Verifica se já existe uma cotação para essa moeda e data
     historico_existente = HistoricoCotacao.objects.filter(moeda=moeda, data=data).first()
@@ -28,6 +41,64 @@ def salvar_cotacao(moeda, data, abertura, fechamento, alta, baixa, volume):
             volume=volume
         )
 
+def _em_lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+def salvar_cotacoes_em_lote(moeda, cotacoes, tamanho_lote=None):
+    """
+    Grava (insere ou atualiza) as cotações de uma moeda em lotes, usando um único
+    INSERT ... ON CONFLICT/ON DUPLICATE KEY por lote, dentro de uma transação.
+    Aceita qualquer iterável de cotações (inclusive geradores) e retorna a contagem
+    de registros inseridos e atualizados.
+    """
+    tamanho_lote = tamanho_lote or getattr(settings, 'INTEGRACAO_TAMANHO_LOTE_GRAVACAO', 500)
+    resultado = {'inseridas': 0, 'atualizadas': 0}
+
+    # O MySQL não aceita unique_fields: o conflito é resolvido pela chave única (moeda, data)
+    opcoes = {'update_conflicts': True, 'update_fields': CAMPOS_COTACAO}
+    if connection.features.supports_update_conflicts_with_target:
+        opcoes['unique_fields'] = ['moeda', 'data']
+
+    mais_recente = None
+    datas_gravadas = set()
+    with transaction.atomic():
+        for lote in _em_lotes(cotacoes, tamanho_lote):
+            # Indexa por data para descartar candles repetidos dentro do lote
+            objetos = {}
+            for cotacao in lote:
+                data = to_date(cotacao['data'])
+                objetos[data] = HistoricoCotacao(
+                    moeda=moeda,
+                    data=data,
+                    **{campo: cotacao[campo] for campo in CAMPOS_COTACAO}
+                )
+
+            existentes = HistoricoCotacao.objects.filter(moeda=moeda, data__in=list(objetos)).count()
+            HistoricoCotacao.objects.bulk_create(objetos.values(), **opcoes)
+
+            datas_gravadas.update(objetos)
+            data_lote = max(objetos)
+            if mais_recente is None or data_lote >= mais_recente[0]:
+                mais_recente = (data_lote, objetos[data_lote].fechamento)
+
+            resultado['atualizadas'] += existentes
+            resultado['inseridas'] += len(objetos) - existentes
+
+        # O bulk_create não dispara sinais: mantém a última cotação, os candles agregados, os caches, os snapshots e o arquivo manualmente
+        if mais_recente is not None:
+            UltimaCotacao.registrar(moeda.id, *mais_recente)
+            CotacaoAgregada.atualizar(moeda.id, datas_gravadas)
+            invalidar_cache_moeda(moeda.id)
+            invalidar_snapshots_moeda(moeda.id, min(datas_gravadas))
+            invalidar_arquivo(moeda.id, min(datas_gravadas))
+
+    return resultado
+
 def to_date(data):
     if isinstance(data, str):
         return datetime.strptime(data, '%Y-%m-%d').date()
@@ -35,31 +106,105 @@ def to_date(data):
         return data.date()
     return data  # If it's already a date
 
-def obter_datas_faltantes(moeda, data_inicial, data_final):
-    # Convert both dates using the helper function
+def obter_intervalos_faltantes(moeda, data_inicial, data_final, intervalo='1D'):
+    """
+    Retorna os períodos sem cotação entre data_inicial e data_final como uma lista
+    compacta de tuplas (inicio, fim), já unindo períodos consecutivos.
+    O intervalo define a granularidade esperada dos candles: diário ('1D'),
+    semanal ('1W', uma cotação por semana) ou mensal ('1M', uma por mês).
+    """
     data_inicial = to_date(data_inicial)
     data_final = to_date(data_final)
+    # As cotações são gravadas por data: nos intervalos intradiários, cada dia é um período
+    if str(intervalo).isdigit():
+        intervalo = '1D'
+    primeiro_periodo = inicio_periodo(data_inicial, intervalo)
+
+    # Períodos que já possuem ao menos uma cotação
+    periodos_existentes = {
+        inicio_periodo(data, intervalo)
+        for data in HistoricoCotacao.objects.filter(
+            moeda=moeda,
+            data__range=[primeiro_periodo, data_final]
+        ).values_list('data', flat=True).iterator()
+    }
+
+    intervalos = []
+    periodo = primeiro_periodo
+    while periodo <= data_final:
+        proximo = avancar_periodo(periodo, intervalo)
+        if periodo not in periodos_existentes:
+            inicio = max(periodo, data_inicial)
+            fim = min(proximo - timedelta(days=1), data_final)
+            if intervalos and intervalos[-1][1] + timedelta(days=1) == inicio:
+                intervalos[-1] = (intervalos[-1][0], fim)
+            else:
+                intervalos.append((inicio, fim))
+        periodo = proximo
+
+    return intervalos
 
-    # Obtém as datas para as quais já existem cotações
-    datas_existentes = HistoricoCotacao.objects.filter(
-        moeda=moeda,
-        data__range=[data_inicial, data_final]
-    ).values_list('data', flat=True)
 
-    # Gera a lista completa de datas entre data_inicial e data_final
-    todas_as_datas = [data_inicial + timedelta(days=i) for i in range((data_final - data_inicial).days + 1)]
 
-    # Filtra para obter apenas as datas que ainda não estão no banco
-    datas_faltantes = [data for data in todas_as_datas if data not in datas_existentes]
+def coalescer_intervalos(intervalos, tolerancia_dias=None):
+    """
+    Une intervalos (inicio, fim) separados por no máximo `tolerancia_dias` dias,
+    trocando algumas datas já existentes por menos requisições à corretora.
+    """
+    if tolerancia_dias is None:
+        tolerancia_dias = getattr(settings, 'INTEGRACAO_TOLERANCIA_LACUNA_DIAS', 7)
+    coalescidos = []
+    for inicio, fim in sorted(intervalos):
+        if coalescidos and (inicio - coalescidos[-1][1]).days <= tolerancia_dias + 1:
+            coalescidos[-1] = (coalescidos[-1][0], max(fim, coalescidos[-1][1]))
+        else:
+            coalescidos.append((inicio, fim))
+    return coalescidos
+
+def planejar_sincronizacao(moeda, data_compra, data_atual, intervalo=INTERVALO_PADRAO):
+    """
+    Define os intervalos que precisam ser buscados para deixar a moeda atualizada
+    entre data_compra e data_atual. Se a marca d'água da moeda já cobre data_compra,
+    basta buscar o que veio depois de ultima_data; caso contrário, as lacunas são
+    detectadas no banco e coalescidas.
+    """
+    data_compra = to_date(data_compra)
+    data_atual = to_date(data_atual)
+
+    sincronizacao = SincronizacaoCotacao.objects.filter(moeda=moeda).first()
+    if sincronizacao and sincronizacao.data_inicial <= data_compra:
+        if sincronizacao.ultima_data >= data_atual:
+            return []
+        return [(max(sincronizacao.ultima_data + timedelta(days=1), data_compra), data_atual)]
+
+    return coalescer_intervalos(obter_intervalos_faltantes(moeda, data_compra, data_atual, intervalo))
 
-    return datas_faltantes
+def registrar_sincronizacao(moeda, data_inicial, data_final):
+    """
+    Atualiza a marca d'água da moeda após buscar todo o período [data_inicial, data_final].
+    """
+    data_inicial = to_date(data_inicial)
+    data_final = to_date(data_final)
 
+    sincronizacao = SincronizacaoCotacao.objects.filter(moeda=moeda).first()
+    if sincronizacao is None:
+        return SincronizacaoCotacao.objects.create(moeda=moeda, data_inicial=data_inicial, ultima_data=data_final)
 
+    # Só estende o período já coberto se os dois períodos forem contíguos
+    if data_inicial <= sincronizacao.ultima_data + timedelta(days=1) and data_final >= sincronizacao.data_inicial - timedelta(days=1):
+        sincronizacao.data_inicial = min(sincronizacao.data_inicial, data_inicial)
+        sincronizacao.ultima_data = max(sincronizacao.ultima_data, data_final)
+    else:
+        sincronizacao.data_inicial = data_inicial
+        sincronizacao.ultima_data = data_final
+    sincronizacao.save()
+    return sincronizacao
 
-def buscar_cotacoes_historicas(moeda, data_compra, data_atual, intervalo='1M'):
+def buscar_cotacoes_historicas(moeda, data_compra, data_atual, intervalo=INTERVALO_PADRAO):
     """
     Busca cotações históricas para uma moeda no intervalo entre data_compra e data_atual.
     O intervalo padrão é mensal ('1M'), mas pode ser configurado para diário ('1D'), semanal ('1W'), etc.
+    As páginas da corretora são gravadas à medida que chegam, sem carregar a série inteira em memória.
     """
 
     # Converte as datas para datetime.date
@@ -69,18 +214,6 @@ def buscar_cotacoes_historicas(moeda, data_compra, data_atual, intervalo='1M'):
     # Instancia o serviço de integração com a corretora
     servico = CorretoraServiceFactory.criar_servico(moeda.corretora)
 
-    # Faz a requisição para obter as cotações com o intervalo especificado
-    cotacoes = servico.buscar_cotacoes_por_intervalo(moeda.token, data_compra, data_atual, intervalo=intervalo)
-    # Itera sobre as cotações recebidas e salva no banco
-    for cotacao in cotacoes:
-        data = cotacao['data']  # Certifique-se de que a API retorna a data de cada registro
-        salvar_cotacao(
-            moeda=moeda,
-            data=data,
-            abertura=cotacao['abertura'],
-            fechamento=cotacao['fechamento'],
-            alta=cotacao['alta'],
-            baixa=cotacao['baixa'],
-            volume=cotacao['volume']
-        )
-
+    # Itera sobre as cotações do período, página a página, e as grava no banco em lotes
+    cotacoes = servico.iterar_cotacoes_por_intervalo(moeda.token, data_compra, data_atual, intervalo=intervalo)
+    return salvar_cotacoes_em_lote(moeda, cotacoes)
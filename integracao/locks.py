@@ -0,0 +1,56 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from integracao.conexao_redis import obter_cliente_redis, marcar_redis_indisponivel, erros_redis
+
+# Remove a chave apenas se ela ainda pertencer a quem adquiriu o lock
+SCRIPT_LIBERAR = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_locks_locais = {}
+_locks_locais_lock = threading.Lock()
+
+
+def adquirir_lock(chave, ttl=None):
+    """
+    Tenta adquirir um lock exclusivo (Redis SET NX com expiração; em memória se o Redis
+    estiver indisponível). Retorna o token do lock ou None se ele já estiver em uso.
+    """
+    ttl = ttl or getattr(settings, 'INTEGRACAO_LOCK_TTL', 3600)
+    token = uuid.uuid4().hex
+
+    cliente = obter_cliente_redis()
+    if cliente is not None:
+        try:
+            return token if cliente.set(chave, token, nx=True, ex=ttl) else None
+        except erros_redis():
+            marcar_redis_indisponivel()
+
+    with _locks_locais_lock:
+        atual = _locks_locais.get(chave)
+        if atual is not None and atual[1] > time.monotonic():
+            return None
+        _locks_locais[chave] = (token, time.monotonic() + ttl)
+        return token
+
+
+def liberar_lock(chave, token):
+    """
+    Libera o lock se ele ainda pertencer ao token informado.
+    """
+    cliente = obter_cliente_redis()
+    if cliente is not None:
+        try:
+            cliente.eval(SCRIPT_LIBERAR, 1, chave, token)
+        except erros_redis():
+            marcar_redis_indisponivel()
+
+    with _locks_locais_lock:
+        atual = _locks_locais.get(chave)
+        if atual is not None and atual[0] == token:
+            del _locks_locais[chave]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 01:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('moeda', '0003_remove_historicocotacao_preco_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SincronizacaoCotacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicial', models.DateField()),
+                ('ultima_data', models.DateField()),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('moeda', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sincronizacao', to='moeda.moeda')),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-18 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integracao', '0001_initial'),
+        ('moeda', '0006_historicocotacao_historico_moeda_data_fech_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressoBackfill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicial', models.DateField()),
+                ('data_final', models.DateField()),
+                ('intervalo', models.CharField(max_length=5)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=10)),
+                ('blocos_total', models.PositiveIntegerField(default=0)),
+                ('blocos_concluidos', models.PositiveIntegerField(default=0)),
+                ('blocos_retomados', models.PositiveIntegerField(default=0)),
+                ('linhas_gravadas', models.PositiveIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('moeda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backfills', to='moeda.moeda')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BlocoBackfill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateField()),
+                ('fim', models.DateField()),
+                ('concluido', models.BooleanField(default=False)),
+                ('linhas', models.PositiveIntegerField(default=0)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('progresso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocos', to='integracao.progressobackfill')),
+            ],
+            options={
+                'ordering': ['inicio'],
+                'unique_together': {('progresso', 'inicio')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integracao', '0002_progressobackfill_blocobackfill'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='progressobackfill',
+            name='status',
+            field=models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluido', 'Concluído'), ('erro', 'Erro'), ('cancelado', 'Cancelado')], default='pendente', max_length=10),
+        ),
+    ]
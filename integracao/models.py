@@ -1,3 +1,85 @@
 from django.db import models
+from moeda.models import Moeda
 
-# Create your models here.
+
+class SincronizacaoCotacao(models.Model):
+    """
+    Marca d'água da sincronização de cotações de uma moeda: todas as cotações entre
+    data_inicial e ultima_data já foram buscadas na corretora.
+    """
+    moeda = models.OneToOneField(Moeda, on_delete=models.CASCADE, related_name='sincronizacao')
+    data_inicial = models.DateField()
+    ultima_data = models.DateField()
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.moeda.nome} - {self.data_inicial} a {self.ultima_data}'
+
+
+class ProgressoBackfill(models.Model):
+    """
+    Progresso de uma busca de cotações históricas dividida em blocos (janelas de datas).
+    Os blocos concluídos ficam gravados, de modo que uma busca interrompida é retomada a
+    partir do primeiro bloco pendente.
+    """
+    STATUS_PENDENTE = 'pendente'
+    STATUS_EXECUTANDO = 'executando'
+    STATUS_CONCLUIDO = 'concluido'
+    STATUS_ERRO = 'erro'
+    STATUS_CANCELADO = 'cancelado'  # Substituído por outro backfill do mesmo período
+    STATUS_CHOICES = [
+        (STATUS_PENDENTE, 'Pendente'),
+        (STATUS_EXECUTANDO, 'Executando'),
+        (STATUS_CONCLUIDO, 'Concluído'),
+        (STATUS_ERRO, 'Erro'),
+        (STATUS_CANCELADO, 'Cancelado'),
+    ]
+
+    moeda = models.ForeignKey(Moeda, on_delete=models.CASCADE, related_name='backfills')
+    data_inicial = models.DateField()
+    data_final = models.DateField()
+    intervalo = models.CharField(max_length=5)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDENTE)
+    blocos_total = models.PositiveIntegerField(default=0)
+    blocos_concluidos = models.PositiveIntegerField(default=0)
+    blocos_retomados = models.PositiveIntegerField(default=0)  # Já concluídos quando a execução atual começou
+    linhas_gravadas = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True, default='')
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.moeda.nome} - {self.data_inicial} a {self.data_final} - {self.blocos_concluidos}/{self.blocos_total}'
+
+    @property
+    def percentual(self):
+        return round(100 * self.blocos_concluidos / self.blocos_total, 1) if self.blocos_total else 0.0
+
+    @property
+    def eta_segundos(self):
+        """
+        Estimativa do tempo restante (segundos), pela duração média dos blocos concluídos
+        na execução atual.
+        """
+        concluidos_na_execucao = self.blocos_concluidos - self.blocos_retomados
+        if self.status != self.STATUS_EXECUTANDO or concluidos_na_execucao <= 0 or self.iniciado_em is None:
+            return None
+        decorrido = (self.atualizado_em - self.iniciado_em).total_seconds()
+        return round(decorrido / concluidos_na_execucao * (self.blocos_total - self.blocos_concluidos), 1)
+
+
+class BlocoBackfill(models.Model):
+    progresso = models.ForeignKey(ProgressoBackfill, on_delete=models.CASCADE, related_name='blocos')
+    inicio = models.DateField()
+    fim = models.DateField()
+    concluido = models.BooleanField(default=False)
+    linhas = models.PositiveIntegerField(default=0)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('progresso', 'inicio')
+        ordering = ['inicio']
+
+    def __str__(self):
+        return f'{self.inicio} a {self.fim} - {"concluído" if self.concluido else "pendente"}'
@@ -0,0 +1,82 @@
+from datetime import datetime, time, timedelta
+import calendar
+
+# Quantidade máxima de candles que a corretora devolve por requisição
+LIMITE_CANDLES_POR_PAGINA = 200
+
+
+def somar_meses(data, meses):
+    mes = data.month - 1 + meses
+    ano = data.year + mes // 12
+    mes = mes % 12 + 1
+    dia = min(data.day, calendar.monthrange(ano, mes)[1])
+    return data.replace(year=ano, month=mes, day=dia)
+
+
+def avancar_periodo(data, intervalo, quantidade=1):
+    """
+    Avança `quantidade` candles a partir de `data` de acordo com o intervalo
+    ('1D'/'D' diário, '1W'/'W' semanal, '1M'/'M' mensal ou minutos como '5', '60', '240').
+    Nos intervalos intradiários o resultado é um datetime (uma data é tomada à meia-noite).
+    """
+    intervalo = str(intervalo).upper()
+    if intervalo in ('1D', 'D'):
+        return data + timedelta(days=quantidade)
+    if intervalo in ('1W', 'W'):
+        return data + timedelta(weeks=quantidade)
+    if intervalo in ('1M', 'M'):
+        return somar_meses(data, quantidade)
+    if intervalo.isdigit():
+        return _para_datetime(data) + timedelta(minutes=int(intervalo) * quantidade)
+    raise ValueError(f"Intervalo {intervalo} não suportado.")
+
+
+def _para_datetime(data):
+    return data if isinstance(data, datetime) else datetime.combine(data, time.min)
+
+
+def duracao_candle(intervalo):
+    """
+    Menor passo entre o fim de uma janela e o início da seguinte: os minutos do candle
+    nos intervalos intradiários e um dia nos demais.
+    """
+    intervalo = str(intervalo).upper()
+    if intervalo.isdigit():
+        return timedelta(minutes=int(intervalo))
+    return timedelta(days=1)
+
+
+def inicio_periodo(data, intervalo):
+    """
+    Data de abertura do candle que contém `data`: o próprio dia (diário e intradiário),
+    a segunda-feira da semana (semanal) ou o primeiro dia do mês (mensal).
+    """
+    intervalo = str(intervalo).upper()
+    if intervalo in ('1W', 'W'):
+        return data - timedelta(days=data.weekday())
+    if intervalo in ('1M', 'M'):
+        return data.replace(day=1)
+    return data
+
+
+def planejar_janelas(data_inicial, data_final, intervalo, limite=LIMITE_CANDLES_POR_PAGINA):
+    """
+    Divide o período [data_inicial, data_final] em janelas contíguas e sem sobreposição,
+    cada uma com no máximo `limite` candles, para que caibam em uma página da corretora.
+    Retorna uma lista de tuplas (inicio, fim). Nos intervalos intradiários as janelas são
+    datetimes e vão até o último candle do dia de data_final.
+    """
+    passo = duracao_candle(intervalo)
+    inicio = data_inicial
+    if passo < timedelta(days=1):
+        inicio = _para_datetime(data_inicial)
+        if not isinstance(data_final, datetime):
+            data_final = _para_datetime(data_final) + timedelta(days=1) - passo
+
+    janelas = []
+    while inicio <= data_final:
+        proximo = avancar_periodo(inicio, intervalo, limite)
+        fim = min(proximo - passo, data_final)
+        janelas.append((inicio, fim))
+        inicio = fim + passo
+    return janelas
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from integracao.conexao_redis import obter_cliente_redis, marcar_redis_indisponivel, erros_redis
+
+# Balde de tokens atômico no Redis. Retorna (como string) quantos segundos é preciso
+# esperar; "0" significa que os tokens foram consumidos.
+SCRIPT_BALDE = """
+local capacidade = tonumber(ARGV[1])
+local taxa = tonumber(ARGV[2])
+local peso = tonumber(ARGV[3])
+local tempo = redis.call('TIME')
+local agora = tonumber(tempo[1]) + tonumber(tempo[2]) / 1000000
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'atualizado')
+local tokens = tonumber(estado[1]) or capacidade
+local atualizado = tonumber(estado[2]) or agora
+tokens = math.min(capacidade, tokens + math.max(0, agora - atualizado) * taxa)
+local espera = 0
+if tokens >= peso then
+    tokens = tokens - peso
+else
+    espera = (peso - tokens) / taxa
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'atualizado', agora)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidade / taxa) + 1)
+return tostring(espera)
+"""
+
+LIMITE_PADRAO = {'capacidade': 20, 'reposicao_por_segundo': 5}
+
+
+class LimitadorTaxa:
+    """
+    Limitador do tipo token bucket. O estado fica no Redis (compartilhado entre os
+    workers do Celery) e, se o Redis não estiver acessível, em memória no processo.
+    """
+
+    def __init__(self, chave, capacidade, reposicao_por_segundo, relogio=time.monotonic, dormir=time.sleep):
+        self.chave = chave
+        self.capacidade = float(capacidade)
+        self.reposicao_por_segundo = float(reposicao_por_segundo)
+        self._relogio = relogio
+        self._dormir = dormir
+        self._lock = threading.Lock()
+        self._tokens = self.capacidade
+        self._atualizado = relogio()
+        self._script = None
+
+    def _consumir_redis(self, peso):
+        cliente = obter_cliente_redis()
+        if cliente is None:
+            return None
+        try:
+            if self._script is None:
+                self._script = cliente.register_script(SCRIPT_BALDE)
+            espera = self._script(keys=[self.chave], args=[self.capacidade, self.reposicao_por_segundo, peso])
+            return float(espera)
+        except erros_redis():
+            marcar_redis_indisponivel()
+            return None
+
+    def _consumir_local(self, peso):
+        with self._lock:
+            agora = self._relogio()
+            decorrido = max(0.0, agora - self._atualizado)
+            self._tokens = min(self.capacidade, self._tokens + decorrido * self.reposicao_por_segundo)
+            self._atualizado = agora
+            if self._tokens >= peso:
+                self._tokens -= peso
+                return 0.0
+            return (peso - self._tokens) / self.reposicao_por_segundo
+
+    def consumir(self, peso=1):
+        """
+        Tenta consumir `peso` tokens sem bloquear. Retorna 0 em caso de sucesso ou
+        o tempo (em segundos) até haver tokens suficientes.
+        """
+        peso = min(float(peso), self.capacidade)
+        espera = self._consumir_redis(peso)
+        if espera is None:
+            espera = self._consumir_local(peso)
+        return espera
+
+    def adquirir(self, peso=1, timeout=None):
+        """
+        Bloqueia até conseguir consumir `peso` tokens. Retorna False se o tempo de
+        espera ultrapassar `timeout` segundos.
+        """
+        inicio = self._relogio()
+        while True:
+            espera = self.consumir(peso)
+            if espera <= 0:
+                return True
+            if timeout is not None and (self._relogio() - inicio) + espera > timeout:
+                return False
+            self._dormir(espera)
+
+
+_limitadores = {}
+_limitadores_lock = threading.Lock()
+
+
+def obter_limitador(nome_corretora, api_key):
+    """
+    Retorna o limitador da combinação corretora + chave de API, conforme INTEGRACAO_LIMITES_TAXA.
+    """
+    nome = nome_corretora.lower()
+    hash_chave = hashlib.sha1((api_key or '').encode()).hexdigest()[:12]
+    chave = f'integracao:limite:{nome}:{hash_chave}'
+    limitador = _limitadores.get(chave)
+    if limitador is None:
+        with _limitadores_lock:
+            limitador = _limitadores.get(chave)
+            if limitador is None:
+                limite = getattr(settings, 'INTEGRACAO_LIMITES_TAXA', {}).get(nome, LIMITE_PADRAO)
+                limitador = LimitadorTaxa(chave, limite['capacidade'], limite['reposicao_por_segundo'])
+                _limitadores[chave] = limitador
+    return limitador
+
+
+def peso_endpoint(nome_corretora, endpoint):
+    """
+    Peso (custo em tokens) de um endpoint da corretora; endpoints não configurados valem 1.
+    """
+    pesos = getattr(settings, 'INTEGRACAO_PESOS_ENDPOINT', {}).get(nome_corretora.lower(), {})
+    return pesos.get(endpoint, 1)
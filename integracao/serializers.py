@@ -0,0 +1,15 @@
+from rest_framework import serializers
+from integracao.models import ProgressoBackfill
+
+
+class ProgressoBackfillSerializer(serializers.ModelSerializer):
+    percentual = serializers.FloatField(read_only=True)
+    eta_segundos = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = ProgressoBackfill
+        fields = [
+            'id', 'moeda', 'data_inicial', 'data_final', 'intervalo', 'status',
+            'blocos_total', 'blocos_concluidos', 'linhas_gravadas', 'percentual', 'eta_segundos',
+            'erro', 'iniciado_em', 'atualizado_em', 'concluido_em'
+        ]
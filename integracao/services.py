@@ -1,14 +1,121 @@
 from abc import ABC, abstractmethod
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from integracao.exceptions import (
+    ErroAutenticacao,
+    ErroCorretora,
+    ErroLimiteRequisicoes,
+    ErroServidor,
+    ErroSimboloInvalido,
+    ErroTimeout,
+)
+from integracao.rate_limit import obter_limitador, peso_endpoint
+from integracao.paginacao import planejar_janelas
 import time
 import hmac
 import hashlib
+from email.utils import parsedate_to_datetime
+
+
+def segundos_retry_after(valor):
+    """
+    Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos de espera.
+    Retorna None se o cabeçalho estiver ausente ou for inválido.
+    """
+    if not valor:
+        return None
+    try:
+        return max(0, int(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0, int(parsedate_to_datetime(valor).timestamp() - time.time()))
+    except (TypeError, ValueError):
+        return None
 
 class CorretoraService(ABC):
 
+    # Sessões HTTP compartilhadas por corretora dentro do processo (uma por nome de corretora)
+    _sessoes = {}
+    _sessoes_lock = threading.Lock()
+
     def __init__(self, corretoraUsuario):
         self.corretoraUsuario = corretoraUsuario
 
+    @classmethod
+    def obter_sessao(cls, nome_corretora):
+        """
+        Retorna a sessão HTTP com pool de conexões (keep-alive) da corretora,
+        criando-a na primeira chamada. A mesma sessão é reutilizada por todas as
+        instâncias do serviço no processo, evitando um novo handshake TCP/TLS a cada requisição.
+        """
+        chave = nome_corretora.lower()
+        sessao = cls._sessoes.get(chave)
+        if sessao is None:
+            with cls._sessoes_lock:
+                sessao = cls._sessoes.get(chave)
+                if sessao is None:
+                    sessao = cls._criar_sessao()
+                    cls._sessoes[chave] = sessao
+        return sessao
+
+    @staticmethod
+    def _criar_sessao():
+        # pool_connections: quantidade de hosts mantidos em cache
+        # pool_maxsize: conexões abertas por host
+        adaptador = HTTPAdapter(
+            pool_connections=getattr(settings, 'INTEGRACAO_POOL_HOSTS', 4),
+            pool_maxsize=getattr(settings, 'INTEGRACAO_POOL_CONEXOES_POR_HOST', 10),
+            pool_block=getattr(settings, 'INTEGRACAO_POOL_BLOQUEANTE', False),
+        )
+        sessao = requests.Session()
+        sessao.mount('https://', adaptador)
+        sessao.mount('http://', adaptador)
+        sessao.headers.update({'Connection': 'keep-alive'})
+        return sessao
+
+    @classmethod
+    def estatisticas_pool(cls):
+        """
+        Retorna, por corretora, o total de requisições feitas, conexões abertas
+        e a taxa de reuso das conexões do pool.
+        """
+        estatisticas = {}
+        for nome, sessao in list(cls._sessoes.items()):
+            requisicoes = 0
+            conexoes = 0
+            adaptadores = {id(adaptador): adaptador for adaptador in sessao.adapters.values()}
+            for adaptador in adaptadores.values():
+                pools = adaptador.poolmanager.pools
+                for chave in list(pools.keys()):
+                    pool = pools.get(chave)
+                    if pool is None:
+                        continue
+                    requisicoes += pool.num_requests
+                    conexoes += pool.num_connections
+            reuso = (requisicoes - conexoes) / requisicoes if requisicoes else 0.0
+            estatisticas[nome] = {
+                'requisicoes': requisicoes,
+                'conexoes_abertas': conexoes,
+                'taxa_reuso': reuso,
+            }
+        return estatisticas
+
+    @classmethod
+    def fechar_sessoes(cls):
+        """
+        Fecha todas as sessões compartilhadas (útil em testes e no desligamento do worker).
+        """
+        with cls._sessoes_lock:
+            for sessao in cls._sessoes.values():
+                sessao.close()
+            cls._sessoes.clear()
+
     @abstractmethod
     def buscar_preco_ativo(self, ativo):
         pass
@@ -18,36 +125,72 @@ class CorretoraService(ABC):
         pass
 
     def _fazer_requisicao(self, endpoint, params=None, method='GET', data=None):
+        """
+        Faz a requisição assinada à corretora. Retorna {'sucesso': True, 'mensagem', 'dados'}
+        ou lança uma subclasse de ErroCorretora de acordo com a falha.
+        """
+        corretora = self.corretoraUsuario.corretora
+        url = f"{corretora.url_base}/{endpoint}"
+
+        # Aguarda o limite de requisições da corretora/chave de API antes de assinar a requisição
+        obter_limitador(corretora.nome, self.corretoraUsuario.api_key).adquirir(peso_endpoint(corretora.nome, endpoint))
+
+        headers, params = self.autenticar(endpoint, method, params)
+        sessao = self.obter_sessao(corretora.nome)
+        timeout = getattr(settings, 'INTEGRACAO_TIMEOUT', 10)
         try:
-            url = f"{self.corretoraUsuario.corretora.url_base}/{endpoint}"
-            headers, params = self.autenticar(endpoint, method, params)
             if method == 'POST':
-                response = requests.post(url, headers=headers, params=params, json=data)
+                response = sessao.post(url, headers=headers, params=params, json=data, timeout=timeout)
             else:
-                response = requests.get(url, headers=headers, params=params, timeout=10)
-            
+                response = sessao.get(url, headers=headers, params=params, timeout=timeout)
             response.raise_for_status()
+        except requests.exceptions.Timeout:
+            raise ErroTimeout('Erro na requisição: Timeout')
+        except requests.exceptions.HTTPError as e:
+            raise self._erro_http(e)
+        except requests.exceptions.RequestException as e:
+            raise ErroServidor(f'Erro na requisição: {str(e)}')
 
-            # Verifica se há erro de autenticação no corpo da resposta JSON
+        # Um corpo que não é JSON (página HTML de um proxy, resposta truncada) é falha transitória da corretora
+        try:
             resposta_json = response.json()
-            if 'ret_code' in resposta_json and resposta_json['ret_code'] == '10004':
-                return {'sucesso': False, 'mensagem': 'Erro de autenticação: Chave API inválida.', 'dados': resposta_json}
+        except ValueError as e:
+            raise ErroServidor(f'Resposta inválida da corretora: {str(e)}', response.status_code)
 
-            return {'sucesso': True, 'mensagem': 'Requisição realizada com sucesso.', 'dados': resposta_json}
-            
-        except requests.exceptions.Timeout:
-            return {'sucesso': False, 'mensagem': 'Erro na requisição: Timeout', 'dados': None}
-        except requests.exceptions.RequestException as e:
-            return {'sucesso': False, 'mensagem': f'Erro na requisição: {str(e)}', 'dados': None}
+        # Erros também podem vir no corpo da resposta JSON, com status HTTP 200
+        self._verificar_codigo_retorno(resposta_json)
 
+        return {'sucesso': True, 'mensagem': 'Requisição realizada com sucesso.', 'dados': resposta_json}
 
+    @staticmethod
+    def _erro_http(erro):
+        resposta = erro.response
+        status = getattr(resposta, 'status_code', None)
+        mensagem = f'Erro na requisição: {str(erro)}'
+        if status == 429:
+            return ErroLimiteRequisicoes(mensagem, status, retry_after=segundos_retry_after(resposta.headers.get('Retry-After')))
+        if status in (401, 403):
+            return ErroAutenticacao(mensagem, status)
+        if status in (400, 404):
+            return ErroSimboloInvalido(mensagem, status)
+        # 5xx, outros 4xx inesperados e respostas sem status: tratados como falha transitória da corretora
+        return ErroServidor(mensagem, status)
 
+    def _verificar_codigo_retorno(self, resposta_json):
+        # Corretoras que informam erros no corpo da resposta lançam aqui o ErroCorretora correspondente
+        pass
 
     @abstractmethod
     def autenticar(self, endpoint, method, params=None):
         pass
 
 
+# Códigos de retorno (ret_code) da API da Bybit
+CODIGOS_AUTENTICACAO = {'10003', '10004', '10005'}
+CODIGOS_LIMITE_REQUISICOES = {'10006', '10018'}
+CODIGOS_PARAMETROS = {'10001'}
+
+
 class BybitService(CorretoraService):
     
     def buscar_preco_ativo(self, ativo, data, intervalo='1D'):
@@ -75,9 +218,13 @@ class BybitService(CorretoraService):
             print(f"Erro: Nenhum dado de candle retornado para o ativo {ativo} na data {data}")
             return None
 
-    def buscar_cotacoes_por_intervalo(self, ativo, data_inicial, data_final, intervalo='1D'):
+    def _buscar_pagina(self, ativo, data_inicial, data_final, intervalo):
+        """
+        Busca uma única página de candles. Retorna a lista de cotações ordenada por data
+        (vazia se não houver candles); uma resposta sem 'result' lança ErroServidor.
+        """
         endpoint = "v2/public/kline/list"
-        
+
         # Converte as datas para timestamp em milissegundos
         timestamp_inicial = int(time.mktime(data_inicial.timetuple())) * 1000
         timestamp_final = int(time.mktime(data_final.timetuple())) * 1000
@@ -89,29 +236,66 @@ class BybitService(CorretoraService):
             'to': timestamp_final
         }
         resposta = self._fazer_requisicao(endpoint, params)
-        # Verifica se a resposta é válida e contém os dados necessários
-        if resposta['dados'] is not None and isinstance(resposta, dict) and 'dados' in resposta and 'result' in resposta['dados']:
-            candles = resposta['dados']['result']
-            if candles:
-                cotacoes = []
-                for candle in candles:
-                    cotacao = {
-                        'abertura': candle['open'],
-                        'fechamento': candle['close'],
-                        'alta': candle['high'],
-                        'baixa': candle['low'],
-                        'volume': candle['volume'],
-                        'data': time.strftime('%Y-%m-%d', time.gmtime(candle['open_time']))
-                    }
-                    cotacoes.append(cotacao)
-
-                return cotacoes
-            else:
-                print(f"Erro: Nenhum dado de candle retornado para o ativo {ativo} no intervalo de {data_inicial} a {data_final}")
-                return None
-        else:
-            print(f"Erro: Resposta inválida ao buscar cotações para o ativo {ativo} no intervalo de {data_inicial} a {data_final}")
-            return None
+        # Uma resposta sem os candles é tratada como falha transitória da corretora (será tentada de novo)
+        if not isinstance(resposta['dados'], dict) or 'result' not in resposta['dados']:
+            raise ErroServidor(
+                f"Resposta inválida ao buscar cotações para o ativo {ativo} no intervalo de {data_inicial} a {data_final}",
+                dados=resposta['dados']
+            )
+        candles = sorted(resposta['dados']['result'] or [], key=lambda candle: candle['open_time'])
+        return [
+            {
+                'abertura': candle['open'],
+                'fechamento': candle['close'],
+                'alta': candle['high'],
+                'baixa': candle['low'],
+                'volume': candle['volume'],
+                'data': time.strftime('%Y-%m-%d', time.gmtime(candle['open_time']))
+            }
+            for candle in candles
+        ]
+
+    def _paginas(self, ativo, janelas, intervalo, paralelo):
+        if paralelo <= 1 or len(janelas) <= 1:
+            for inicio, fim in janelas:
+                yield self._buscar_pagina(ativo, inicio, fim, intervalo)
+            return
+
+        # Carrega a corretora na thread principal antes de disparar as requisições em paralelo
+        self.corretoraUsuario.corretora
+
+        # Mantém no máximo `paralelo` páginas em andamento e as entrega na ordem das janelas
+        with ThreadPoolExecutor(max_workers=paralelo) as executor:
+            pendentes = deque()
+            janelas = iter(janelas)
+            for inicio, fim in islice(janelas, paralelo):
+                pendentes.append(executor.submit(self._buscar_pagina, ativo, inicio, fim, intervalo))
+            while pendentes:
+                pagina = pendentes.popleft().result()
+                proxima = next(janelas, None)
+                if proxima is not None:
+                    pendentes.append(executor.submit(self._buscar_pagina, ativo, proxima[0], proxima[1], intervalo))
+                yield pagina
+
+    def iterar_cotacoes_por_intervalo(self, ativo, data_inicial, data_final, intervalo='1D', paralelo=1):
+        """
+        Itera sobre as cotações do período, dividindo-o em janelas do tamanho de uma página
+        da corretora. As páginas são buscadas em ordem (ou até `paralelo` ao mesmo tempo),
+        concatenadas e sem datas repetidas. Apenas uma página fica em memória por vez.
+        Uma página inválida interrompe a iteração com ErroCorretora, nunca com uma série truncada.
+        """
+        ultima_data = None
+        for pagina in self._paginas(ativo, planejar_janelas(data_inicial, data_final, intervalo), intervalo, paralelo):
+            for cotacao in pagina:
+                # As janelas são ordenadas: candles repetidos na borda entre páginas são descartados
+                if ultima_data is not None and cotacao['data'] <= ultima_data:
+                    continue
+                ultima_data = cotacao['data']
+                yield cotacao
+
+    def buscar_cotacoes_por_intervalo(self, ativo, data_inicial, data_final, intervalo='1D', paralelo=1):
+        cotacoes = list(self.iterar_cotacoes_por_intervalo(ativo, data_inicial, data_final, intervalo, paralelo))
+        return cotacoes or None
 
 
     def autenticar(self, endpoint, method, params=None):
@@ -125,11 +309,25 @@ class BybitService(CorretoraService):
         params['sign'] = signature
         return {}, params
     
+    def _verificar_codigo_retorno(self, resposta_json):
+        codigo = str(resposta_json.get('ret_code', 0))
+        if codigo == '0':
+            return
+        mensagem = f"Erro da corretora ({codigo}): {resposta_json.get('ret_msg', '')}"
+        if codigo in CODIGOS_AUTENTICACAO:
+            raise ErroAutenticacao('Erro de autenticação: Chave API inválida.', dados=resposta_json)
+        if codigo in CODIGOS_LIMITE_REQUISICOES:
+            raise ErroLimiteRequisicoes(mensagem, dados=resposta_json)
+        if codigo in CODIGOS_PARAMETROS:
+            raise ErroSimboloInvalido(mensagem, dados=resposta_json)
+        raise ErroServidor(mensagem, dados=resposta_json)
+
     def testar_conexao(self):
-        resposta = self._fazer_requisicao('v2/public/time')
-        if resposta['sucesso'] and 'time_now' in resposta['dados']:
-            return True
-        return False
+        try:
+            resposta = self._fazer_requisicao('v2/public/time')
+        except ErroCorretora:
+            return False
+        return 'time_now' in resposta['dados']
 
 
 
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from integracao.exceptions import ErroSimboloInvalido
+from integracao.services import BybitService
+
+
+class CorretoraServiceAsync(ABC):
+    """
+    Contraparte assíncrona de CorretoraService. Expõe a mesma interface
+    (buscar_preco_ativo, buscar_cotacoes_por_intervalo, testar_conexao) como corrotinas
+    e permite buscar vários símbolos de forma concorrente.
+    """
+
+    # Executor compartilhado pelo processo; as requisições usam a sessão com pool de CorretoraService
+    _executor = None
+    _tamanho_executor = 0
+    _executor_lock = threading.Lock()
+
+    def __init__(self, corretoraUsuario, concorrencia=None):
+        self.corretoraUsuario = corretoraUsuario
+        self.concorrencia = concorrencia or getattr(settings, 'INTEGRACAO_CONCORRENCIA_MAXIMA', 10)
+        # Carrega a corretora antes de usar o serviço em outras threads (evita consultas ao banco fora da thread principal)
+        self.corretoraUsuario.corretora
+
+    @classmethod
+    def _obter_executor(cls, tamanho):
+        """
+        Retorna o executor compartilhado com ao menos `tamanho` threads. Ele tem no mínimo
+        INTEGRACAO_CONCORRENCIA_MAXIMA threads e é substituído por um maior quando uma instância
+        pede mais concorrência; o anterior termina as requisições em andamento e é descartado.
+        """
+        if cls._tamanho_executor < tamanho:
+            with cls._executor_lock:
+                if cls._tamanho_executor < tamanho:
+                    tamanho = max(tamanho, getattr(settings, 'INTEGRACAO_CONCORRENCIA_MAXIMA', 10))
+                    cls._executor = ThreadPoolExecutor(max_workers=tamanho, thread_name_prefix='integracao')
+                    cls._tamanho_executor = tamanho
+        return cls._executor
+
+    async def _executar(self, funcao, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._obter_executor(self.concorrencia), lambda: funcao(*args, **kwargs))
+
+    @abstractmethod
+    async def buscar_preco_ativo(self, ativo, data, intervalo='1D'):
+        pass
+
+    @abstractmethod
+    async def buscar_cotacoes_por_intervalo(self, ativo, data_inicial, data_final, intervalo='1D'):
+        pass
+
+    @abstractmethod
+    async def testar_conexao(self):
+        pass
+
+    async def buscar_cotacoes_em_lote(self, simbolos, inicio, fim, intervalo='1D'):
+        """
+        Busca as cotações de vários símbolos concorrentemente, limitando o número de
+        requisições simultâneas por um semáforo. Retorna um dicionário {simbolo: cotacoes}.
+        Um símbolo inválido resulta em None sem interromper os demais; os outros erros
+        da corretora são propagados.
+        """
+        semaforo = asyncio.Semaphore(self.concorrencia)
+
+        async def buscar(simbolo):
+            async with semaforo:
+                try:
+                    cotacoes = await self.buscar_cotacoes_por_intervalo(simbolo, inicio, fim, intervalo=intervalo)
+                except ErroSimboloInvalido:
+                    cotacoes = None
+                return simbolo, cotacoes
+
+        resultados = await asyncio.gather(*(buscar(simbolo) for simbolo in dict.fromkeys(simbolos)))
+        return dict(resultados)
+
+
+class BybitServiceAsync(CorretoraServiceAsync):
+
+    def __init__(self, corretoraUsuario, concorrencia=None):
+        super().__init__(corretoraUsuario, concorrencia)
+        self._servico = BybitService(corretoraUsuario)
+
+    async def buscar_preco_ativo(self, ativo, data, intervalo='1D'):
+        return await self._executar(self._servico.buscar_preco_ativo, ativo, data, intervalo=intervalo)
+
+    async def buscar_cotacoes_por_intervalo(self, ativo, data_inicial, data_final, intervalo='1D'):
+        return await self._executar(
+            self._servico.buscar_cotacoes_por_intervalo, ativo, data_inicial, data_final, intervalo=intervalo
+        )
+
+    async def testar_conexao(self):
+        return await self._executar(self._servico.testar_conexao)
@@ -1,24 +1,261 @@
 # integracao/tasks.py
-from celery import shared_task
+import asyncio
+from collections import defaultdict
+from itertools import islice
+from celery import Task, chord, group, shared_task
+from celery.utils.log import get_task_logger
+from celery.utils.time import get_exponential_backoff_interval
 from datetime import date
-from .historico_service import buscar_cotacoes_historicas, obter_datas_faltantes
+from django.conf import settings
+from .backfill import executar_backfill, preparar_backfill
+from .exceptions import ERROS_REPETIVEIS, ErroAutenticacao, ErroCorretora
+from .factory import CorretoraServiceFactory
+from .historico_service import (
+    INTERVALO_PADRAO,
+    planejar_sincronizacao,
+    registrar_sincronizacao,
+    salvar_cotacoes_em_lote,
+    to_date,
+)
+from .locks import adquirir_lock, liberar_lock
+from .paginacao import inicio_periodo
+from patrimonio.tasks import agendar_recalculo
 
-@shared_task
-def buscar_cotacoes_task(moeda_id, data_compra):
+logger = get_task_logger(__name__)
+
+def chave_lock_cotacoes(moeda_id):
+    return f'integracao:lock:cotacoes:{moeda_id}'
+
+class TarefaCorretora(Task):
+    """
+    Base das tarefas que consultam as corretoras: falhas transitórias (timeout, limite de
+    requisições, erro do servidor) são tentadas de novo com backoff exponencial e jitter;
+    erros de autenticação ou de símbolo inválido falham na hora, sem ocupar o worker.
+    """
+    autoretry_for = ERROS_REPETIVEIS
+    retry_backoff = True
+    retry_backoff_max = getattr(settings, 'INTEGRACAO_RETENTATIVA_ESPERA_MAXIMA', 600)
+    retry_jitter = True
+    max_retries = getattr(settings, 'INTEGRACAO_RETENTATIVAS_MAXIMAS', 5)
+
+    def retry(self, args=None, kwargs=None, exc=None, throw=True, eta=None, countdown=None, max_retries=None, **options):
+        # Se a corretora informou quando tentar de novo (Retry-After), espera ao menos esse tempo
+        retry_after = getattr(exc, 'retry_after', None)
+        if retry_after is not None and eta is None:
+            countdown = max(countdown or 0, retry_after)
+        return super().retry(
+            args=args, kwargs=kwargs, exc=exc, throw=throw, eta=eta, countdown=countdown, max_retries=max_retries, **options
+        )
+
+@shared_task(bind=True, base=TarefaCorretora)
+def buscar_cotacoes_task(self, moeda_id, data_compra):
     """
     Tarefa Celery para buscar cotações em segundo plano.
+    Busca apenas os intervalos que ainda faltam (ou o que veio depois da última
+    sincronização) e atualiza a marca d'água da moeda. Apenas uma busca por moeda
+    é executada por vez. Uma nova tentativa retoma o backfill do último bloco concluído.
     """
+    chave_lock = chave_lock_cotacoes(moeda_id)
+    token = adquirir_lock(chave_lock)
+    if token is None:
+        if self.request.is_eager:
+            # Em modo síncrono, reagendar executaria a tarefa de novo imediatamente (recursão)
+            return "Busca de cotações já em andamento."
+        # Outra busca da mesma moeda está em andamento: reagenda; ao rodar, buscará só o que ainda faltar
+        self.apply_async(args=(moeda_id, data_compra), countdown=getattr(settings, 'INTEGRACAO_ESPERA_LOCK', 30))
+        return "Busca de cotações já em andamento."
+
+    try:
+        return _sincronizar_cotacoes(moeda_id, data_compra)
+    finally:
+        liberar_lock(chave_lock, token)
+
+def _sincronizar_cotacoes(moeda_id, data_compra):
     from moeda.models import Moeda
 
     moeda = Moeda.objects.get(id=moeda_id)
+    data_compra = to_date(data_compra)
     data_atual = date.today()
 
-    # Verifica as datas faltantes
-    datas_para_buscar = obter_datas_faltantes(moeda, data_compra, data_atual)
+    # Verifica os intervalos faltantes
+    intervalos = planejar_sincronizacao(moeda, data_compra, data_atual, INTERVALO_PADRAO)
 
-    if not datas_para_buscar:
+    if not intervalos:
         return "Cotações já atualizadas."
 
-    # Busca as cotações
-    buscar_cotacoes_historicas(moeda, data_compra, data_atual)
+    # Busca as cotações em blocos retomáveis; o início é alinhado à abertura do candle para que a corretora o inclua
+    for inicio, fim in intervalos:
+        progresso = preparar_backfill(moeda, inicio_periodo(inicio, INTERVALO_PADRAO), fim, INTERVALO_PADRAO)
+        executar_backfill(progresso)
+
+    registrar_sincronizacao(moeda, data_compra, data_atual)
+
+    # Os snapshots do patrimônio a partir das novas cotações ficaram desatualizados
+    agendar_recalculo(moeda.usuario_id, inicio_periodo(intervalos[0][0], INTERVALO_PADRAO))
     return "Cotações atualizadas com sucesso."
+
+@shared_task
+def atualizar_cotacoes_task():
+    """
+    Tarefa periódica (celery beat): atualiza as cotações de todas as moedas já sincronizadas.
+    Agrupa as moedas por corretora e conta, distribui blocos de símbolos de cada conta entre
+    tarefas paralelas (chord) e, ao final de todas, consolida a última cotação e os snapshots.
+    As outras contas do mesmo usuário na mesma corretora ficam de reserva caso as credenciais
+    da conta sejam recusadas.
+    """
+    from corretora.models import CorretoraUsuario
+    from moeda.models import Moeda
+
+    moedas = Moeda.objects.filter(
+        sincronizacao__isnull=False,
+        corretora_object_id__isnull=False
+    ).order_by('token').values_list('id', 'corretora_object_id')
+    # Reservas de cada conta: as outras contas do mesmo usuário na mesma corretora (nunca as de outro usuário)
+    contas_por_usuario = defaultdict(list)
+    for corretora_usuario_id, nome_corretora, usuario_id in CorretoraUsuario.objects.filter(
+        usuario_id__in=CorretoraUsuario.objects.filter(pk__in=moedas.values('corretora_object_id')).values('usuario_id')
+    ).order_by('pk').values_list('pk', 'corretora__nome', 'usuario_id'):
+        contas_por_usuario[(nome_corretora.lower(), usuario_id)].append(corretora_usuario_id)
+    reservas = {
+        conta: [outra for outra in contas if outra != conta]
+        for contas in contas_por_usuario.values()
+        for conta in contas
+    }
+
+    # Moedas de cada conta, em ordem de símbolo
+    moedas_por_conta = defaultdict(list)
+    for moeda_id, corretora_usuario_id in moedas:
+        if corretora_usuario_id in reservas:
+            moedas_por_conta[corretora_usuario_id].append(moeda_id)
+
+    tamanho_bloco = getattr(settings, 'INTEGRACAO_ATUALIZACAO_TAMANHO_BLOCO', 20)
+    tarefas = [
+        atualizar_bloco_cotacoes_task.s(corretora_usuario_id, bloco, reservas[corretora_usuario_id])
+        for corretora_usuario_id, moeda_ids in moedas_por_conta.items()
+        for bloco in _em_blocos(moeda_ids, tamanho_bloco)
+    ]
+    if not tarefas:
+        return "Nenhuma moeda para atualizar."
+
+    chord(group(tarefas))(consolidar_atualizacao_task.s())
+    return f"{len(tarefas)} bloco(s) de cotações agendado(s)."
+
+def _em_blocos(itens, tamanho):
+    iterador = iter(itens)
+    while bloco := list(islice(iterador, tamanho)):
+        yield bloco
+
+@shared_task(bind=True, base=TarefaCorretora)
+def atualizar_bloco_cotacoes_task(self, corretora_usuario_id, moeda_ids, contas_reserva=(), atualizadas=None):
+    """
+    Busca concorrentemente as cotações recentes de um bloco de moedas de uma mesma conta
+    (a partir do último candle já sincronizado de cada uma) e as grava em lote. Se as
+    credenciais da conta forem recusadas, a busca segue com as contas_reserva (do mesmo usuário).
+    Moedas com outra busca em andamento são ignoradas. Retorna [(moeda_id, data_inicial)]
+    das moedas atualizadas.
+
+    Um erro da corretora não derruba o bloco: as moedas já gravadas continuam no resultado
+    (para que a consolidação ocorra), as de erros transitórios são tentadas de novo nesta
+    mesma tarefa (levando junto as já atualizadas) e as demais são descartadas até a
+    próxima atualização.
+    """
+    from moeda.models import Moeda
+
+    contas = [corretora_usuario_id, *contas_reserva]
+    servicos = {}
+    data_atual = date.today()
+
+    # Reserva as moedas do bloco; o candle mais recente é sempre buscado de novo (pode estar incompleto)
+    tokens = {}
+    moedas_por_inicio = defaultdict(list)
+    for moeda in Moeda.objects.filter(pk__in=moeda_ids).select_related('sincronizacao'):
+        token = adquirir_lock(chave_lock_cotacoes(moeda.id))
+        if token is None:
+            continue
+        tokens[moeda.id] = token
+        moedas_por_inicio[inicio_periodo(moeda.sincronizacao.ultima_data, INTERVALO_PADRAO)].append(moeda)
+
+    atualizadas = list(atualizadas or [])
+    pendentes, erro_repetivel = [], None
+    try:
+        for inicio, moedas in moedas_por_inicio.items():
+            try:
+                cotacoes = _buscar_em_lote(contas, servicos, [moeda.token for moeda in moedas], inicio, data_atual)
+            except ErroCorretora as erro:
+                logger.warning('Falha ao atualizar as cotações de %s: %s', [moeda.token for moeda in moedas], erro)
+                if erro.repetivel:
+                    pendentes.extend(moeda.id for moeda in moedas)
+                    erro_repetivel = erro
+                continue
+            for moeda in moedas:
+                if cotacoes.get(moeda.token):
+                    salvar_cotacoes_em_lote(moeda, cotacoes[moeda.token])
+                    registrar_sincronizacao(moeda, inicio, data_atual)
+                    atualizadas.append((moeda.id, inicio.isoformat()))
+    finally:
+        for moeda_id, token in tokens.items():
+            liberar_lock(chave_lock_cotacoes(moeda_id), token)
+
+    if pendentes and self.request.retries < self.max_retries:
+        espera = get_exponential_backoff_interval(
+            factor=1, retries=self.request.retries, maximum=self.retry_backoff_max, full_jitter=True
+        )
+        raise self.retry(
+            # As contas com credenciais recusadas já foram descartadas de `contas`
+            args=(contas[0], pendentes, contas[1:]), kwargs={'atualizadas': atualizadas},
+            exc=erro_repetivel, countdown=espera
+        )
+    return atualizadas
+
+def _buscar_em_lote(contas, servicos, simbolos, inicio, fim):
+    """
+    Busca os símbolos com a primeira conta de `contas`. Uma conta com credenciais recusadas
+    é descartada da lista (também para os próximos grupos do bloco) e a busca é repetida com
+    a seguinte; sem contas restantes, o erro é propagado.
+    """
+    from corretora.models import CorretoraUsuario
+
+    while True:
+        conta = contas[0]
+        if conta not in servicos:
+            servicos[conta] = CorretoraServiceFactory.criar_servico_async(
+                CorretoraUsuario.objects.select_related('corretora').get(pk=conta),
+                concorrencia=getattr(settings, 'INTEGRACAO_ATUALIZACAO_CONCORRENCIA', 5)
+            )
+        try:
+            return asyncio.run(servicos[conta].buscar_cotacoes_em_lote(simbolos, inicio, fim, intervalo=INTERVALO_PADRAO))
+        except ErroAutenticacao:
+            if len(contas) == 1:
+                raise
+            contas.pop(0)
+
+@shared_task
+def consolidar_atualizacao_task(resultados):
+    """
+    Etapa final da atualização periódica: reconstrói a última cotação das moedas atualizadas
+    e recalcula os snapshots dos usuários afetados a partir da primeira data alterada.
+    """
+    from ativo.models import Ativo
+    from moeda.models import Moeda, UltimaCotacao
+
+    inicio_por_moeda = {}
+    for bloco in resultados:
+        for moeda_id, inicio in bloco:
+            inicio_por_moeda[moeda_id] = to_date(inicio)
+    if not inicio_por_moeda:
+        return {'moedas': 0, 'usuarios': 0}
+
+    # A gravação em lote já mantém a última cotação; a reconstrução garante o estado final
+    UltimaCotacao.reconstruir(list(inicio_por_moeda))
+
+    # Usuários afetados: donos das moedas e quem possui ativos delas
+    inicio_por_usuario = {}
+    afetados = list(Ativo.objects.filter(moeda_id__in=inicio_por_moeda).values_list('usuario_id', 'moeda_id').distinct())
+    afetados += Moeda.objects.filter(pk__in=inicio_por_moeda).values_list('usuario_id', 'pk')
+    for usuario_id, moeda_id in afetados:
+        inicio = inicio_por_moeda[moeda_id]
+        inicio_por_usuario[usuario_id] = min(inicio_por_usuario.get(usuario_id, inicio), inicio)
+    for usuario_id, inicio in inicio_por_usuario.items():
+        agendar_recalculo(usuario_id, inicio)
+
+    return {'moedas': len(inicio_por_moeda), 'usuarios': len(inicio_por_usuario)}
@@ -0,0 +1,190 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from corretora.models import CorretoraConfig, CorretoraUsuario
+from integracao.backfill import executar_backfill, preparar_backfill
+from integracao.exceptions import ErroServidor
+from integracao.models import ProgressoBackfill
+from moeda.models import Moeda
+from usuario.models import Usuario
+
+RESULTADO_BLOCO = {'inseridas': 3, 'atualizadas': 0}
+
+
+def criar_moeda(usuario, token='BTC'):
+    corretora_usuario = CorretoraUsuario.objects.create(
+        corretora=CorretoraConfig.objects.get_or_create(nome='Bybit', url_base='https://api.bybit.com')[0],
+        api_key='key',
+        api_secret='secret',
+        usuario=usuario
+    )
+    return Moeda.objects.create(
+        nome=token,
+        token=token,
+        usuario=usuario,
+        corretora_content_type=ContentType.objects.get_for_model(CorretoraUsuario),
+        corretora_object_id=corretora_usuario.id
+    )
+
+
+@override_settings(INTEGRACAO_BACKFILL_CANDLES_POR_BLOCO=3)
+class BackfillTestCase(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='12345')
+        self.moeda = criar_moeda(self.usuario)
+
+    def test_divide_periodo_em_blocos(self):
+        progresso = preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M')
+
+        self.assertEqual(progresso.blocos_total, 4)
+        self.assertEqual(
+            [(bloco.inicio, bloco.fim) for bloco in progresso.blocos.all()][:2],
+            [(date(2024, 1, 1), date(2024, 3, 31)), (date(2024, 4, 1), date(2024, 6, 30))]
+        )
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', return_value=RESULTADO_BLOCO)
+    def test_executa_blocos_e_registra_progresso(self, mock_buscar):
+        progresso = executar_backfill(preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M'))
+
+        self.assertEqual(mock_buscar.call_count, 4)
+        self.assertEqual(progresso.status, ProgressoBackfill.STATUS_CONCLUIDO)
+        self.assertEqual(progresso.blocos_concluidos, 4)
+        self.assertEqual(progresso.linhas_gravadas, 12)
+        self.assertEqual(progresso.percentual, 100.0)
+        self.assertIsNotNone(progresso.concluido_em)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas')
+    def test_retoma_do_ultimo_bloco_concluido(self, mock_buscar):
+        # O terceiro bloco falha (timeout da corretora, queda do worker...)
+        mock_buscar.side_effect = [RESULTADO_BLOCO, RESULTADO_BLOCO, TimeoutError('timeout')]
+        with self.assertRaises(TimeoutError):
+            executar_backfill(preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M'))
+
+        progresso = ProgressoBackfill.objects.get(moeda=self.moeda)
+        self.assertEqual(progresso.status, ProgressoBackfill.STATUS_ERRO)
+        self.assertEqual(progresso.blocos_concluidos, 2)
+        self.assertEqual(progresso.erro, 'timeout')
+
+        # A nova execução reaproveita o mesmo progresso e busca apenas os blocos pendentes
+        mock_buscar.reset_mock(side_effect=True)
+        mock_buscar.return_value = RESULTADO_BLOCO
+        retomado = executar_backfill(preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M'))
+
+        self.assertEqual(retomado.pk, progresso.pk)
+        self.assertEqual(
+            [chamada.args[1] for chamada in mock_buscar.call_args_list],
+            [date(2024, 7, 1), date(2024, 10, 1)]
+        )
+        self.assertEqual(retomado.status, ProgressoBackfill.STATUS_CONCLUIDO)
+        self.assertEqual(retomado.blocos_retomados, 2)
+        self.assertEqual(retomado.linhas_gravadas, 12)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', return_value=RESULTADO_BLOCO)
+    def test_retomada_com_periodo_maior_refaz_o_ultimo_bloco(self, mock_buscar):
+        mock_buscar.side_effect = [RESULTADO_BLOCO, TimeoutError('timeout')]
+        with self.assertRaises(TimeoutError):
+            executar_backfill(preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 4, 30), '1M'))
+
+        mock_buscar.side_effect = None
+        mock_buscar.reset_mock()
+        progresso = preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 6, 30), '1M')
+
+        self.assertEqual(progresso.blocos_total, 2)
+        self.assertEqual(progresso.blocos.get(inicio=date(2024, 4, 1)).fim, date(2024, 6, 30))
+        executar_backfill(progresso)
+        mock_buscar.assert_called_once_with(self.moeda, date(2024, 4, 1), date(2024, 6, 30), intervalo='1M')
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas')
+    def test_retomada_a_partir_do_primeiro_bloco_pendente_usa_o_mesmo_backfill(self, mock_buscar):
+        mock_buscar.side_effect = [RESULTADO_BLOCO, RESULTADO_BLOCO, TimeoutError('timeout')]
+        with self.assertRaises(TimeoutError):
+            executar_backfill(preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M'))
+
+        # A nova detecção de lacunas começa depois dos blocos já gravados
+        mock_buscar.reset_mock(side_effect=True)
+        mock_buscar.return_value = RESULTADO_BLOCO
+        retomado = executar_backfill(preparar_backfill(self.moeda, date(2024, 7, 1), date(2024, 12, 31), '1M'))
+
+        self.assertEqual(ProgressoBackfill.objects.filter(moeda=self.moeda).count(), 1)
+        self.assertEqual(retomado.status, ProgressoBackfill.STATUS_CONCLUIDO)
+        self.assertEqual(retomado.blocos_concluidos, 4)
+        self.assertEqual(mock_buscar.call_count, 2)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', side_effect=TimeoutError('timeout'))
+    def test_backfill_sobreposto_cancela_o_anterior(self, mock_buscar):
+        with self.assertRaises(TimeoutError):
+            executar_backfill(preparar_backfill(self.moeda, date(2024, 4, 1), date(2024, 12, 31), '1M'))
+        anterior = ProgressoBackfill.objects.get(moeda=self.moeda)
+
+        progresso = preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M')
+
+        self.assertNotEqual(progresso.pk, anterior.pk)
+        anterior.refresh_from_db()
+        self.assertEqual(anterior.status, ProgressoBackfill.STATUS_CANCELADO)
+
+    def test_pagina_invalida_nao_conclui_o_bloco(self):
+        respostas = [
+            {'sucesso': True, 'mensagem': '', 'dados': {'ret_code': 0, 'result': []}},
+            {'sucesso': True, 'mensagem': '', 'dados': {'ret_code': 0, 'ret_msg': 'OK'}},
+        ]
+        with patch('integracao.services.BybitService._fazer_requisicao', side_effect=respostas), \
+                self.assertRaises(ErroServidor):
+            executar_backfill(preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M'))
+
+        progresso = ProgressoBackfill.objects.get(moeda=self.moeda)
+        self.assertEqual(progresso.status, ProgressoBackfill.STATUS_ERRO)
+        self.assertEqual(progresso.blocos_concluidos, 1)
+        self.assertFalse(progresso.blocos.get(inicio=date(2024, 4, 1)).concluido)
+
+    def test_eta_pela_media_dos_blocos_da_execucao(self):
+        progresso = preparar_backfill(self.moeda, date(2024, 1, 1), date(2024, 12, 31), '1M')
+        progresso.status = ProgressoBackfill.STATUS_EXECUTANDO
+        progresso.blocos_concluidos = 2
+        progresso.blocos_retomados = 1
+        progresso.save()
+        progresso.iniciado_em = progresso.atualizado_em - timedelta(seconds=10)
+
+        # Um bloco concluído em 10 segundos, dois blocos restantes
+        self.assertEqual(progresso.percentual, 50.0)
+        self.assertEqual(progresso.eta_segundos, 20.0)
+
+
+class ProgressoBackfillApiTests(APITestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='12345')
+        self.client.force_authenticate(user=self.usuario)
+        self.moeda = criar_moeda(self.usuario)
+        self.progresso = ProgressoBackfill.objects.create(
+            moeda=self.moeda, data_inicial=date(2024, 1, 1), data_final=date(2024, 12, 31), intervalo='1M',
+            blocos_total=4, blocos_concluidos=1, linhas_gravadas=3
+        )
+        outro = Usuario.objects.create_user(username='outro', password='12345')
+        ProgressoBackfill.objects.create(
+            moeda=criar_moeda(outro, 'ETH'), data_inicial=date(2024, 1, 1), data_final=date(2024, 12, 31), intervalo='1M'
+        )
+
+    def test_lista_apenas_backfills_do_usuario(self):
+        response = self.client.get(reverse('backfill-list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['id'], self.progresso.id)
+        self.assertEqual(response.data[0]['percentual'], 25.0)
+        self.assertEqual(response.data[0]['linhas_gravadas'], 3)
+        self.assertIsNone(response.data[0]['eta_segundos'])
+
+    def test_filtro_por_moeda(self):
+        response = self.client.get(reverse('backfill-list'), {'moeda': self.moeda.id + 1000})
+
+        self.assertEqual(response.data, [])
+
+    def test_filtro_por_moeda_invalido(self):
+        response = self.client.get(reverse('backfill-list'), {'moeda': 'abc'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
@@ -0,0 +1,45 @@
+from datetime import date
+from django.test import SimpleTestCase
+from crypto_monitor.celery import app, configurar_worker_por_fila
+
+
+class FilasCeleryTests(SimpleTestCase):
+
+    def rota(self, tarefa, args=()):
+        return app.amqp.router.route({}, tarefa, args)
+
+    def test_roteamento_das_tarefas(self):
+        self.assertEqual(self.rota('patrimonio.tasks.recalcular_snapshots_task')['queue'].name, 'interativo')
+        self.assertEqual(self.rota('integracao.tasks.atualizar_bloco_cotacoes_task')['queue'].name, 'agendado')
+        self.assertEqual(self.rota('patrimonio.tasks.atualizar_snapshots_task')['queue'].name, 'lote')
+        self.assertEqual(self.rota('crypto_monitor.celery.debug_task')['queue'].name, 'celery')
+
+    def test_busca_recente_vai_para_a_fila_interativa(self):
+        rota = self.rota('integracao.tasks.buscar_cotacoes_task', (1, date.today().replace(day=1).isoformat()))
+
+        self.assertEqual(rota['queue'].name, 'interativo')
+        self.assertEqual(rota['priority'], 0)
+
+    def test_recarga_historica_vai_para_a_fila_de_lote(self):
+        # Mais de um bloco do backfill (12 candles mensais): recarga histórica longa
+        rota = self.rota('integracao.tasks.buscar_cotacoes_task', (1, date(2015, 1, 1)))
+
+        self.assertEqual(rota['queue'].name, 'lote')
+        self.assertEqual(rota['priority'], 9)
+
+    def test_configuracao_do_worker_por_fila(self):
+        conf = type('Conf', (), {})()
+
+        configurar_worker_por_fila(conf=conf, options={'queues': ['interativo']})
+        self.assertEqual(conf.worker_prefetch_multiplier, 1)
+        self.assertEqual(conf.worker_concurrency, 8)
+
+        conf = type('Conf', (), {})()
+        configurar_worker_por_fila(conf=conf, options={'queues': 'lote', 'concurrency': 3})
+        self.assertEqual(conf.worker_prefetch_multiplier, 1)
+        self.assertFalse(hasattr(conf, 'worker_concurrency'))
+
+    def test_worker_com_varias_filas_mantem_o_padrao(self):
+        conf = type('Conf', (), {})()
+        configurar_worker_por_fila(conf=conf, options={'queues': ['interativo', 'lote']})
+        self.assertFalse(hasattr(conf, 'worker_prefetch_multiplier'))
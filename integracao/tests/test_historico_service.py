@@ -2,8 +2,8 @@ from django.test import TestCase
 from django.contrib.contenttypes.models import ContentType
 from unittest.mock import patch, MagicMock
 from moeda.models import HistoricoCotacao, Moeda
-from datetime import date
-from integracao.historico_service import salvar_cotacao, obter_datas_faltantes, buscar_cotacoes_historicas
+from datetime import date, timedelta
+from integracao.historico_service import salvar_cotacao, salvar_cotacoes_em_lote, obter_intervalos_faltantes, buscar_cotacoes_historicas
 from usuario.models import Usuario
 from corretora.models import CorretoraConfig, CorretoraUsuario, TipoOperacao
 
@@ -104,33 +104,10 @@ class HistoricoServiceTestCase(TestCase):
         self.assertEqual(historico.baixa, 39500)
         self.assertEqual(historico.volume, 1200)
 
-    def test_obter_datas_faltantes(self):
-        # Cria uma cotação existente no intervalo
-        HistoricoCotacao.objects.create(
-            moeda=self.moeda,
-            data=date(2024, 3, 5),
-            abertura=39000,
-            fechamento=39500,
-            alta=40000,
-            baixa=38500,
-            volume=1000
-        )
-
-        # Testa obter datas faltantes entre a data de compra e a data atual
-        datas_faltantes = obter_datas_faltantes(self.moeda, self.data_compra, self.data_atual)
-        
-
-        # Verifica se a lista de datas faltantes não inclui a data com cotação existente
-        self.assertNotIn(date(2024, 3, 5), datas_faltantes)
-
-        # Verifica se outras datas estão presentes na lista
-        self.assertIn(date(2024, 3, 1), datas_faltantes)
-        self.assertIn(date(2024, 3, 2), datas_faltantes)
-
-    @patch('integracao.services.BybitService.buscar_cotacoes_por_intervalo')
-    def test_buscar_cotacoes_historicas(self, mock_buscar_cotacoes_por_intervalo):
-        # Mocka a resposta do método buscar_cotacoes_por_intervalo para retornar dados de cotações
-        mock_buscar_cotacoes_por_intervalo.return_value = [
+    @patch('integracao.services.BybitService.iterar_cotacoes_por_intervalo')
+    def test_buscar_cotacoes_historicas(self, mock_iterar_cotacoes_por_intervalo):
+        # Mocka o iterador de cotações para devolver as cotações de forma preguiçosa (gerador)
+        mock_iterar_cotacoes_por_intervalo.return_value = iter([
             {
                 'abertura': 40000,
                 'fechamento': 40500,
@@ -155,13 +132,13 @@ class HistoricoServiceTestCase(TestCase):
                 'volume': 1400,
                 'data': '2024-03-03'
             }
-        ]
+        ])
 
         # Executa a função para buscar cotações históricas
         buscar_cotacoes_historicas(self.moeda, self.data_compra, self.data_atual)
 
         # Verifica se o serviço de integração foi chamado para o intervalo fornecido
-        mock_buscar_cotacoes_por_intervalo.assert_called_once_with(
+        mock_iterar_cotacoes_por_intervalo.assert_called_once_with(
             'BTC',
             self.data_compra,
             self.data_atual,
@@ -179,3 +156,81 @@ class HistoricoServiceTestCase(TestCase):
         self.assertEqual(historico.baixa, 39500)
         self.assertEqual(historico.volume, 1200)
 
+    def test_salvar_cotacoes_em_lote_insere_e_atualiza(self):
+        # Cria uma cotação existente que será atualizada pelo lote
+        HistoricoCotacao.objects.create(
+            moeda=self.moeda,
+            data=date(2024, 3, 1),
+            abertura=39000,
+            fechamento=39500,
+            alta=40000,
+            baixa=38500,
+            volume=1000
+        )
+        cotacoes = [
+            {'abertura': '40000', 'fechamento': '40500', 'alta': '41000', 'baixa': '39500', 'volume': '1200', 'data': f'2024-03-0{dia}'}
+            for dia in range(1, 6)
+        ]
+
+        resultado = salvar_cotacoes_em_lote(self.moeda, iter(cotacoes), tamanho_lote=2)
+
+        self.assertEqual(resultado, {'inseridas': 4, 'atualizadas': 1})
+        self.assertEqual(HistoricoCotacao.objects.filter(moeda=self.moeda).count(), 5)
+        historico = HistoricoCotacao.objects.get(moeda=self.moeda, data=date(2024, 3, 1))
+        self.assertEqual(historico.fechamento, 40500)
+        self.assertEqual(historico.volume, 1200)
+
+    def test_salvar_cotacoes_em_lote_numero_de_consultas(self):
+        cotacoes = [
+            {'abertura': 1, 'fechamento': 1, 'alta': 1, 'baixa': 1, 'volume': 1, 'data': date(2024, 1, 1) + timedelta(days=dia)}
+            for dia in range(300)
+        ]
+
+        # Uma contagem e um INSERT por lote, mais o savepoint da transação
+        # e a criação da última cotação da moeda (update, exists e insert com savepoint)
+        # a atualização dos candles agregados (select, delete e insert com savepoint)
+        # a consulta dos usuários cujo cache de patrimônio é invalidado
+        # e a remoção dos snapshots de patrimônio desatualizados
+        with self.assertNumQueries(2 * 3 + 2 + 5 + 5 + 1 + 1):
+            resultado = salvar_cotacoes_em_lote(self.moeda, cotacoes, tamanho_lote=100)
+
+        self.assertEqual(resultado, {'inseridas': 300, 'atualizadas': 0})
+
+    def _criar_cotacoes(self, *datas):
+        for data in datas:
+            HistoricoCotacao.objects.create(moeda=self.moeda, data=data, abertura=1, fechamento=1, alta=1, baixa=1, volume=1)
+
+    def test_obter_intervalos_faltantes_diario(self):
+        self._criar_cotacoes(date(2024, 3, 3), date(2024, 3, 4), date(2024, 3, 8))
+
+        intervalos = obter_intervalos_faltantes(self.moeda, date(2024, 3, 1), date(2024, 3, 10))
+
+        self.assertEqual(intervalos, [
+            (date(2024, 3, 1), date(2024, 3, 2)),
+            (date(2024, 3, 5), date(2024, 3, 7)),
+            (date(2024, 3, 9), date(2024, 3, 10)),
+        ])
+
+    def test_obter_intervalos_faltantes_sem_lacunas(self):
+        self._criar_cotacoes(*[date(2024, 3, dia) for dia in range(1, 6)])
+
+        self.assertEqual(obter_intervalos_faltantes(self.moeda, '2024-03-01', '2024-03-05'), [])
+
+    def test_obter_intervalos_faltantes_mensal(self):
+        # Candles mensais são gravados no primeiro dia do mês
+        self._criar_cotacoes(date(2024, 3, 1), date(2024, 5, 1))
+
+        intervalos = obter_intervalos_faltantes(self.moeda, self.data_compra, self.data_atual, intervalo='1M')
+
+        self.assertEqual(intervalos, [
+            (date(2024, 4, 1), date(2024, 4, 30)),
+            (date(2024, 6, 1), date(2024, 10, 22)),
+        ])
+
+    def test_obter_intervalos_faltantes_semanal(self):
+        # 2024-03-04 é uma segunda-feira; o período inicial (2024-03-01) pertence à semana de 2024-02-26
+        self._criar_cotacoes(date(2024, 2, 27), date(2024, 3, 6))
+
+        intervalos = obter_intervalos_faltantes(self.moeda, date(2024, 3, 1), date(2024, 3, 24), intervalo='1W')
+
+        self.assertEqual(intervalos, [(date(2024, 3, 11), date(2024, 3, 24))])
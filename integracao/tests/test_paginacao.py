@@ -0,0 +1,129 @@
+import time
+from django.test import TestCase
+from unittest.mock import patch, MagicMock
+from datetime import date, datetime, timedelta, timezone
+from integracao.exceptions import ErroServidor
+from integracao.paginacao import planejar_janelas, avancar_periodo
+from integracao.services import BybitService
+from corretora.models import CorretoraConfig, CorretoraUsuario
+from usuario.models import Usuario
+
+
+class TestPlanejarJanelas(TestCase):
+
+    def test_periodo_menor_que_uma_pagina(self):
+        janelas = planejar_janelas(date(2023, 10, 1), date(2023, 10, 5), '1D')
+        self.assertEqual(janelas, [(date(2023, 10, 1), date(2023, 10, 5))])
+
+    def test_janelas_diarias_contiguas(self):
+        janelas = planejar_janelas(date(2020, 1, 1), date(2020, 12, 31), '1D', limite=100)
+
+        self.assertEqual(len(janelas), 4)
+        self.assertEqual(janelas[0], (date(2020, 1, 1), date(2020, 4, 9)))
+        self.assertEqual(janelas[-1][1], date(2020, 12, 31))
+        # Cada janela começa no dia seguinte ao fim da anterior
+        for (_, fim), (inicio, _) in zip(janelas, janelas[1:]):
+            self.assertEqual((inicio - fim).days, 1)
+
+    def test_janelas_mensais(self):
+        janelas = planejar_janelas(date(2015, 1, 1), date(2024, 12, 31), '1M', limite=24)
+
+        self.assertEqual(len(janelas), 5)
+        self.assertEqual(janelas[1], (date(2017, 1, 1), date(2018, 12, 31)))
+
+    def test_janelas_intradiarias_em_minutos(self):
+        for intervalo, candles_no_dia in (('1', 1440), ('5', 288)):
+            passo = timedelta(minutes=int(intervalo))
+            janelas = planejar_janelas(date(2024, 1, 1), date(2024, 1, 1), intervalo)
+
+            self.assertEqual(janelas[0][0], datetime(2024, 1, 1))
+            self.assertEqual(janelas[-1][1], datetime(2024, 1, 2) - passo)
+            # Nenhuma janela passa do limite de uma página e juntas cobrem todos os candles do dia
+            tamanhos = [(fim - inicio) // passo + 1 for inicio, fim in janelas]
+            self.assertTrue(all(tamanho <= 200 for tamanho in tamanhos))
+            self.assertEqual(sum(tamanhos), candles_no_dia)
+            for (_, fim), (inicio, _) in zip(janelas, janelas[1:]):
+                self.assertEqual(inicio - fim, passo)
+
+    def test_avancar_periodo(self):
+        self.assertEqual(avancar_periodo(date(2024, 1, 31), '1M'), date(2024, 2, 29))
+        self.assertEqual(avancar_periodo(date(2024, 1, 1), '1W', 2), date(2024, 1, 15))
+        self.assertEqual(avancar_periodo(date(2024, 1, 1), '60', 200), datetime(2024, 1, 9, 8, 0))
+        with self.assertRaises(ValueError):
+            avancar_periodo(date(2024, 1, 1), 'X')
+
+
+def candle(data, preco):
+    open_time = int(datetime(data.year, data.month, data.day, tzinfo=timezone.utc).timestamp())
+    return {'open': preco, 'close': preco, 'high': preco, 'low': preco, 'volume': '1', 'open_time': open_time}
+
+
+class TestPaginacaoBybitService(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(username='testuser', password='12345')
+        cls.corretora_config = CorretoraConfig.objects.create(
+            nome="Bybit",
+            url_base="https://api.bybit.com",
+            exige_passphrase=False
+        )
+        cls.corretora = CorretoraUsuario.objects.create(
+            corretora=cls.corretora_config,
+            api_key="test_api_key",
+            api_secret="test_api_secret",
+            usuario=cls.usuario
+        )
+
+    def setUp(self):
+        self.service = BybitService(self.corretora)
+        # Três páginas; a segunda repete o último candle da primeira
+        self.paginas = [
+            [candle(date(2024, 1, 2), '2'), candle(date(2024, 1, 1), '1')],
+            [candle(date(2024, 1, 2), '2'), candle(date(2024, 1, 3), '3')],
+            [candle(date(2024, 1, 5), '5')],
+        ]
+
+    def _respostas(self):
+        respostas = []
+        for pagina in self.paginas:
+            resposta = MagicMock()
+            resposta.json.return_value = {'result': pagina}
+            respostas.append(resposta)
+        return respostas
+
+    @patch('integracao.services.planejar_janelas')
+    @patch('integracao.services.requests.Session.get')
+    def test_iterar_concatena_paginas_sem_repeticao(self, mock_get, mock_planejar):
+        mock_planejar.return_value = [(date(2024, 1, 1), date(2024, 1, 2)), (date(2024, 1, 3), date(2024, 1, 4)), (date(2024, 1, 5), date(2024, 1, 6))]
+        mock_get.side_effect = self._respostas()
+
+        cotacoes = list(self.service.iterar_cotacoes_por_intervalo('BTCUSDT', date(2024, 1, 1), date(2024, 1, 6)))
+
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual([c['data'] for c in cotacoes], ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-05'])
+
+    @patch('integracao.services.planejar_janelas')
+    @patch('integracao.services.requests.Session.get')
+    def test_pagina_invalida_nao_trunca_a_serie(self, mock_get, mock_planejar):
+        mock_planejar.return_value = [(date(2024, 1, 1), date(2024, 1, 2)), (date(2024, 1, 3), date(2024, 1, 4)), (date(2024, 1, 5), date(2024, 1, 6))]
+        respostas = self._respostas()
+        respostas[1].json.return_value = {'ret_code': 0}
+        mock_get.side_effect = respostas
+
+        with self.assertRaises(ErroServidor):
+            self.service.buscar_cotacoes_por_intervalo('BTCUSDT', date(2024, 1, 1), date(2024, 1, 6))
+
+    @patch('integracao.services.requests.Session.get')
+    def test_buscar_periodo_longo_em_varias_paginas(self, mock_get):
+        # Em paralelo a ordem das chamadas varia: a resposta é escolhida pelo início da janela
+        janelas = planejar_janelas(date(2023, 1, 1), date(2024, 6, 1), '1D')
+        inicios = [int(time.mktime(inicio.timetuple())) * 1000 for inicio, _ in janelas]
+        respostas = dict(zip(inicios, self._respostas()))
+        mock_get.side_effect = lambda url, params=None, **kwargs: respostas[params['from']]
+
+        cotacoes = self.service.buscar_cotacoes_por_intervalo('BTCUSDT', date(2023, 1, 1), date(2024, 6, 1), paralelo=3)
+
+        # 518 dias em páginas de 200 candles
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual([c['fechamento'] for c in cotacoes], ['1', '2', '3', '5'])
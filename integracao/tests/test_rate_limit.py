@@ -0,0 +1,92 @@
+from django.test import TestCase, override_settings
+from unittest.mock import patch, MagicMock
+from integracao.rate_limit import LimitadorTaxa, obter_limitador, peso_endpoint
+
+
+class RelogioFalso:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.agora += segundos
+
+
+@patch('integracao.rate_limit.obter_cliente_redis', return_value=None)
+class TestLimitadorLocal(TestCase):
+
+    def setUp(self):
+        self.relogio = RelogioFalso()
+        self.limitador = LimitadorTaxa('teste', capacidade=2, reposicao_por_segundo=1,
+                                       relogio=self.relogio, dormir=self.relogio.dormir)
+
+    def test_consome_ate_a_capacidade(self, mock_redis):
+        self.assertEqual(self.limitador.consumir(), 0)
+        self.assertEqual(self.limitador.consumir(), 0)
+
+        # Sem tokens: informa quanto tempo falta para a reposição
+        self.assertAlmostEqual(self.limitador.consumir(), 1.0)
+
+    def test_reposicao_com_o_tempo(self, mock_redis):
+        self.limitador.consumir(2)
+        self.relogio.agora += 1.5
+
+        self.assertEqual(self.limitador.consumir(), 0)
+        self.assertAlmostEqual(self.limitador.consumir(), 0.5)
+
+    def test_adquirir_aguarda_reposicao(self, mock_redis):
+        self.limitador.consumir(2)
+
+        self.assertTrue(self.limitador.adquirir())
+        self.assertAlmostEqual(self.relogio.agora, 1.0)
+
+    def test_adquirir_respeita_timeout(self, mock_redis):
+        self.limitador.consumir(2)
+
+        self.assertFalse(self.limitador.adquirir(peso=2, timeout=1))
+        self.assertEqual(self.relogio.agora, 0.0)
+
+
+class TestLimitadorRedis(TestCase):
+
+    def test_usa_script_no_redis(self):
+        cliente = MagicMock()
+        script = MagicMock(return_value=b'0')
+        cliente.register_script.return_value = script
+
+        limitador = LimitadorTaxa('teste', capacidade=2, reposicao_por_segundo=1)
+        with patch('integracao.rate_limit.obter_cliente_redis', return_value=cliente):
+            self.assertEqual(limitador.consumir(), 0)
+
+        script.assert_called_once_with(keys=['teste'], args=[2.0, 1.0, 1.0])
+
+    def test_fallback_local_quando_redis_falha(self):
+        cliente = MagicMock()
+        cliente.register_script.return_value = MagicMock(side_effect=ConnectionError('Redis fora do ar'))
+
+        limitador = LimitadorTaxa('teste', capacidade=1, reposicao_por_segundo=1)
+        with patch('integracao.rate_limit.obter_cliente_redis', return_value=cliente), \
+                patch('integracao.rate_limit.marcar_redis_indisponivel') as mock_marcar:
+            self.assertEqual(limitador.consumir(), 0)
+            self.assertGreater(limitador.consumir(), 0)
+
+        mock_marcar.assert_called()
+
+
+class TestConfiguracaoLimitador(TestCase):
+
+    @override_settings(INTEGRACAO_LIMITES_TAXA={'bybit': {'capacidade': 7, 'reposicao_por_segundo': 3}})
+    def test_limitador_por_corretora_e_chave(self):
+        limitador = obter_limitador('Bybit', 'chave_config')
+
+        self.assertEqual(limitador.capacidade, 7)
+        self.assertEqual(limitador.reposicao_por_segundo, 3)
+        self.assertIs(limitador, obter_limitador('bybit', 'chave_config'))
+        self.assertIsNot(limitador, obter_limitador('bybit', 'outra_chave'))
+
+    @override_settings(INTEGRACAO_PESOS_ENDPOINT={'bybit': {'v2/public/kline/list': 5}})
+    def test_peso_endpoint(self):
+        self.assertEqual(peso_endpoint('Bybit', 'v2/public/kline/list'), 5)
+        self.assertEqual(peso_endpoint('Bybit', 'v2/public/time'), 1)
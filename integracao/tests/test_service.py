@@ -1,6 +1,8 @@
 from django.test import TestCase
 from unittest.mock import patch, MagicMock
-from integracao.services import BybitService
+from integracao.exceptions import ErroAutenticacao, ErroLimiteRequisicoes, ErroServidor, ErroSimboloInvalido, ErroTimeout
+from integracao.services import BybitService, CorretoraService, segundos_retry_after
+from integracao.factory import CorretoraServiceFactory
 from corretora.models import CorretoraUsuario, CorretoraConfig
 import requests
 from usuario.models import Usuario
@@ -35,7 +37,7 @@ class TestBybitService(TestCase):
         self.data_inicial = "2023-10-01"
         self.data_final = "2023-10-05"
 
-    @patch('integracao.services.requests.get')
+    @patch('integracao.services.requests.Session.get')
     def test_buscar_cotacoes_por_intervalo_sucesso(self, mock_get):
         # Simula uma resposta da API com dados para várias datas
         mock_response = MagicMock()
@@ -71,7 +73,7 @@ class TestBybitService(TestCase):
         self.assertEqual(cotacoes[1]['volume'], '1300')
         self.assertEqual(cotacoes[1]['data'], '2023-10-03')
 
-    @patch('integracao.services.requests.get')
+    @patch('integracao.services.requests.Session.get')
     def test_buscar_cotacoes_por_intervalo_vazio(self, mock_get):
         # Simula uma resposta vazia da API
         mock_response = MagicMock()
@@ -89,7 +91,7 @@ class TestBybitService(TestCase):
         # Verifica se o retorno é None para resultado vazio
         self.assertIsNone(cotacoes)
 
-    @patch('integracao.services.requests.get')
+    @patch('integracao.services.requests.Session.get')
     def test_buscar_cotacoes_por_intervalo_falha(self, mock_get):
         # Simula uma falha na requisição
         mock_response = MagicMock()
@@ -100,13 +102,11 @@ class TestBybitService(TestCase):
         data_inicial = datetime.strptime(self.data_inicial, '%Y-%m-%d').date()
         data_final = datetime.strptime(self.data_final, '%Y-%m-%d').date()
 
-        # Chama o método do serviço
-        cotacoes = self.service.buscar_cotacoes_por_intervalo(self.ativo, data_inicial, data_final)
-
-        # Verifica se o retorno é None para falha na requisição
-        self.assertIsNone(cotacoes)
+        # A falha é propagada como erro transitório da corretora
+        with self.assertRaises(ErroServidor):
+            self.service.buscar_cotacoes_por_intervalo(self.ativo, data_inicial, data_final)
 
-    @patch('integracao.services.requests.get')
+    @patch('integracao.services.requests.Session.get')
     def test_buscar_cotacoes_por_intervalo_erro_autenticacao(self, mock_get):
         # Simula um erro de autenticação
         mock_response = MagicMock()
@@ -118,13 +118,119 @@ class TestBybitService(TestCase):
         data_inicial = datetime.strptime(self.data_inicial, '%Y-%m-%d').date()
         data_final = datetime.strptime(self.data_final, '%Y-%m-%d').date()
 
+        # O erro de autenticação no corpo da resposta não deve ser tentado de novo
+        with self.assertRaises(ErroAutenticacao) as contexto:
+            self.service.buscar_cotacoes_por_intervalo(self.ativo, data_inicial, data_final)
+        self.assertFalse(contexto.exception.repetivel)
 
-        # Chama o método do serviço
-        cotacoes = self.service.buscar_cotacoes_por_intervalo(self.ativo, data_inicial, data_final)
+    def test_sessao_compartilhada_entre_instancias(self):
+        # Instâncias criadas pela factory devem reutilizar a mesma sessão da corretora
+        CorretoraService.fechar_sessoes()
+        servico_1 = CorretoraServiceFactory.criar_servico(self.corretora)
+        servico_2 = CorretoraServiceFactory.criar_servico(self.corretora)
 
-        # Verifica se o retorno é None para erro de autenticação
-        self.assertIsNone(cotacoes)
+        sessao_1 = servico_1.obter_sessao(self.corretora_config.nome)
+        sessao_2 = servico_2.obter_sessao(self.corretora_config.nome)
+
+        self.assertIs(sessao_1, sessao_2)
+        self.assertIsInstance(sessao_1, requests.Session)
+
+    @patch('integracao.services.requests.Session.get')
+    def test_requisicao_usa_sessao_do_pool(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'time_now': '1696204800'}
+        mock_get.return_value = mock_response
+
+        self.assertTrue(self.service.testar_conexao())
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertIn('timeout', mock_get.call_args.kwargs)
+
+    def test_estatisticas_pool(self):
+        CorretoraService.fechar_sessoes()
+        CorretoraService.obter_sessao('Bybit')
 
+        estatisticas = CorretoraService.estatisticas_pool()
 
+        self.assertIn('bybit', estatisticas)
+        self.assertEqual(estatisticas['bybit']['requisicoes'], 0)
+        self.assertEqual(estatisticas['bybit']['conexoes_abertas'], 0)
+        self.assertEqual(estatisticas['bybit']['taxa_reuso'], 0.0)
+
+    def _resposta_http(self, status, headers=None):
+        mock_response = MagicMock()
+        mock_response.status_code = status
+        mock_response.headers = headers or {}
+        mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError(f"{status}", response=mock_response)
+        return mock_response
+
+    @patch('integracao.services.requests.Session.get')
+    def test_classifica_erros_http(self, mock_get):
+        casos = [
+            (429, ErroLimiteRequisicoes, True),
+            (401, ErroAutenticacao, False),
+            (404, ErroSimboloInvalido, False),
+            (503, ErroServidor, True),
+        ]
+        for status, erro, repetivel in casos:
+            with self.subTest(status=status):
+                mock_get.return_value = self._resposta_http(status)
+                with self.assertRaises(erro) as contexto:
+                    self.service._fazer_requisicao('v2/public/kline/list', {'symbol': self.ativo})
+                self.assertEqual(contexto.exception.status, status)
+                self.assertEqual(contexto.exception.repetivel, repetivel)
+
+    @patch('integracao.services.requests.Session.get')
+    def test_limite_requisicoes_informa_retry_after(self, mock_get):
+        mock_get.return_value = self._resposta_http(429, {'Retry-After': '30'})
+
+        with self.assertRaises(ErroLimiteRequisicoes) as contexto:
+            self.service._fazer_requisicao('v2/public/kline/list', {'symbol': self.ativo})
+
+        self.assertEqual(contexto.exception.retry_after, 30)
+
+    @patch('integracao.services.requests.Session.get', side_effect=requests.exceptions.Timeout())
+    def test_timeout(self, mock_get):
+        with self.assertRaises(ErroTimeout):
+            self.service._fazer_requisicao('v2/public/time')
+
+        # Um timeout em testar_conexao apenas indica que a conexão falhou
+        self.assertFalse(self.service.testar_conexao())
+
+    @patch('integracao.services.requests.Session.get')
+    def test_simbolo_invalido_no_corpo_da_resposta(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'ret_code': 10001, 'ret_msg': 'params error: symbol invalid'}
+        mock_get.return_value = mock_response
+
+        with self.assertRaises(ErroSimboloInvalido):
+            self.service._fazer_requisicao('v2/public/kline/list', {'symbol': 'XYZ'})
+
+    def test_segundos_retry_after(self):
+        self.assertEqual(segundos_retry_after('12'), 12)
+        self.assertIsNone(segundos_retry_after(None))
+        self.assertIsNone(segundos_retry_after('amanhã'))
+        self.assertEqual(segundos_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+
+    @patch('integracao.services.requests.Session.get')
+    def test_pagina_sem_result_e_erro_repetivel(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'ret_code': 0, 'ret_msg': 'OK'}
+        mock_get.return_value = mock_response
+
+        with self.assertRaises(ErroServidor) as contexto:
+            self.service.buscar_cotacoes_por_intervalo(
+                self.ativo, datetime(2023, 10, 1).date(), datetime(2023, 10, 5).date()
+            )
+        self.assertTrue(contexto.exception.repetivel)
+
+    @patch('integracao.services.requests.Session.get')
+    def test_corpo_que_nao_e_json_e_erro_repetivel(self, mock_get):
+        mock_response = MagicMock(status_code=200)
+        mock_response.json.side_effect = requests.exceptions.JSONDecodeError('Expecting value', '<html>', 0)
+        mock_get.return_value = mock_response
 
-    
+        with self.assertRaises(ErroServidor) as contexto:
+            self.service.buscar_cotacoes_por_intervalo(
+                self.ativo, datetime(2023, 10, 1).date(), datetime(2023, 10, 5).date()
+            )
+        self.assertTrue(contexto.exception.repetivel)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from corretora.models import CorretoraConfig, CorretoraUsuario
+from integracao.factory import CorretoraServiceFactory
+from integracao.services import CorretoraService
+from integracao.services_async import BybitServiceAsync
+from usuario.models import Usuario
+
+
+class CorretoraFalsaHandler(BaseHTTPRequestHandler):
+    """
+    Servidor local que simula a API de klines da corretora, registrando
+    quantas requisições estão sendo atendidas ao mesmo tempo.
+    """
+    lock = threading.Lock()
+    em_andamento = 0
+    maximo_simultaneo = 0
+    atraso = 0.1
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.em_andamento += 1
+            cls.maximo_simultaneo = max(cls.maximo_simultaneo, cls.em_andamento)
+        try:
+            time.sleep(cls.atraso)
+            consulta = parse_qs(urlparse(self.path).query)
+            if urlparse(self.path).path.endswith('v2/public/time'):
+                corpo = {'time_now': '1696204800'}
+            elif consulta['symbol'][0] == 'INVALIDOUSDT':
+                corpo = {'ret_code': 10001, 'ret_msg': 'params error: symbol invalid', 'result': None}
+            else:
+                simbolo = consulta['symbol'][0]
+                preco = str(len(simbolo) * 1000)
+                corpo = {'result': [
+                    {'open': preco, 'close': preco, 'high': preco, 'low': preco, 'volume': '10', 'open_time': 1696204800},
+                ]}
+            dados = json.dumps(corpo).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+        finally:
+            with cls.lock:
+                cls.em_andamento -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestBybitServiceAsync(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ThreadingHTTPServer(('127.0.0.1', 0), CorretoraFalsaHandler)
+        cls.thread_servidor = threading.Thread(target=cls.servidor.serve_forever, daemon=True)
+        cls.thread_servidor.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        CorretoraService.fechar_sessoes()
+        super().tearDownClass()
+
+    def setUp(self):
+        CorretoraFalsaHandler.maximo_simultaneo = 0
+        self.usuario = Usuario.objects.create_user(username='testuser', password='12345')
+        host, porta = self.servidor.server_address
+        self.corretora_config = CorretoraConfig.objects.create(
+            nome="Bybit",
+            url_base=f"http://{host}:{porta}",
+            exige_passphrase=False
+        )
+        self.corretora = CorretoraUsuario.objects.create(
+            corretora=self.corretora_config,
+            api_key="test_api_key",
+            api_secret="test_api_secret",
+            usuario=self.usuario
+        )
+        self.data_inicial = date(2023, 10, 1)
+        self.data_final = date(2023, 10, 5)
+
+    def test_factory_cria_servico_async(self):
+        servico = CorretoraServiceFactory.criar_servico_async(self.corretora)
+        self.assertIsInstance(servico, BybitServiceAsync)
+
+    def test_testar_conexao(self):
+        servico = BybitServiceAsync(self.corretora)
+        self.assertTrue(asyncio.run(servico.testar_conexao()))
+
+    def test_buscar_cotacoes_por_intervalo(self):
+        servico = BybitServiceAsync(self.corretora)
+        cotacoes = asyncio.run(servico.buscar_cotacoes_por_intervalo('BTCUSDT', self.data_inicial, self.data_final))
+
+        self.assertEqual(len(cotacoes), 1)
+        self.assertEqual(cotacoes[0]['fechamento'], '7000')
+        self.assertEqual(cotacoes[0]['data'], '2023-10-02')
+
+    def test_buscar_cotacoes_em_lote_concorrente(self):
+        servico = BybitServiceAsync(self.corretora, concorrencia=4)
+        simbolos = [f'MOEDA{i}USDT' for i in range(8)]
+
+        resultado = asyncio.run(servico.buscar_cotacoes_em_lote(simbolos, self.data_inicial, self.data_final))
+
+        # Todos os símbolos são retornados
+        self.assertEqual(set(resultado), set(simbolos))
+        for simbolo in simbolos:
+            self.assertEqual(resultado[simbolo][0]['fechamento'], str(len(simbolo) * 1000))
+
+        # As requisições foram feitas em paralelo, respeitando o limite do semáforo
+        self.assertGreater(CorretoraFalsaHandler.maximo_simultaneo, 1)
+        self.assertLessEqual(CorretoraFalsaHandler.maximo_simultaneo, 4)
+
+    @override_settings(INTEGRACAO_CONCORRENCIA_MAXIMA=2)
+    def test_concorrencia_acima_do_padrao_amplia_o_executor(self):
+        servico = BybitServiceAsync(self.corretora, concorrencia=4)
+        simbolos = [f'MOEDA{i}USDT' for i in range(8)]
+
+        with patch.object(BybitServiceAsync, '_executor', None), patch.object(BybitServiceAsync, '_tamanho_executor', 0):
+            asyncio.run(servico.buscar_cotacoes_em_lote(simbolos, self.data_inicial, self.data_final))
+            self.assertEqual(BybitServiceAsync._tamanho_executor, 4)
+
+        # A concorrência pedida não fica limitada ao tamanho padrão do executor
+        self.assertGreater(CorretoraFalsaHandler.maximo_simultaneo, 2)
+        self.assertLessEqual(CorretoraFalsaHandler.maximo_simultaneo, 4)
+
+    def test_simbolo_invalido_nao_interrompe_o_lote(self):
+        servico = BybitServiceAsync(self.corretora)
+
+        resultado = asyncio.run(servico.buscar_cotacoes_em_lote(['BTCUSDT', 'INVALIDOUSDT'], self.data_inicial, self.data_final))
+
+        self.assertIsNone(resultado['INVALIDOUSDT'])
+        self.assertEqual(resultado['BTCUSDT'][0]['fechamento'], '7000')
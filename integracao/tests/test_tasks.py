@@ -0,0 +1,410 @@
+from django.test import TestCase
+from django.contrib.contenttypes.models import ContentType
+from unittest.mock import MagicMock, patch
+from datetime import date, timedelta
+from corretora.models import CorretoraConfig, CorretoraUsuario
+from integracao.historico_service import coalescer_intervalos
+from integracao.locks import adquirir_lock, liberar_lock
+from integracao.exceptions import ErroAutenticacao, ErroLimiteRequisicoes, ErroServidor, ErroTimeout
+from integracao.models import ProgressoBackfill, SincronizacaoCotacao
+from integracao.tasks import (
+    atualizar_bloco_cotacoes_task, atualizar_cotacoes_task, buscar_cotacoes_task, chave_lock_cotacoes
+)
+from moeda.models import Moeda, HistoricoCotacao, UltimaCotacao
+from usuario.models import Usuario
+
+
+class BuscarCotacoesTaskTestCase(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='12345')
+        self.corretora_config = CorretoraConfig.objects.create(
+            nome="Bybit",
+            url_base="https://api.bybit.com",
+            exige_passphrase=False
+        )
+        self.corretora_usuario = CorretoraUsuario.objects.create(
+            corretora=self.corretora_config,
+            api_key="test_api_key",
+            api_secret="test_api_secret",
+            usuario=self.usuario
+        )
+        self.moeda = Moeda.objects.create(
+            nome='Bitcoin',
+            token='BTC',
+            usuario=self.usuario,
+            corretora_content_type=ContentType.objects.get_for_model(CorretoraUsuario),
+            corretora_object_id=self.corretora_usuario.id
+        )
+        self.hoje = date.today()
+
+    def _criar_cotacao_mensal(self, ano, mes):
+        HistoricoCotacao.objects.create(moeda=self.moeda, data=date(ano, mes, 1), abertura=1, fechamento=1, alta=1, baixa=1, volume=1)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', return_value={'inseridas': 0, 'atualizadas': 0})
+    def test_busca_apenas_intervalos_faltantes(self, mock_buscar):
+        data_compra = date(self.hoje.year - 1, 1, 15)
+        # Todos os meses já existem, exceto março e abril do ano da compra
+        mes = date(data_compra.year, 1, 1)
+        while mes <= self.hoje:
+            if mes.month not in (3, 4) or mes.year != data_compra.year:
+                self._criar_cotacao_mensal(mes.year, mes.month)
+            mes = (mes + timedelta(days=32)).replace(day=1)
+
+        resultado = buscar_cotacoes_task(self.moeda.id, data_compra.isoformat())
+
+        self.assertEqual(resultado, "Cotações atualizadas com sucesso.")
+        mock_buscar.assert_called_once_with(
+            self.moeda, date(data_compra.year, 3, 1), date(data_compra.year, 4, 30), intervalo='1M'
+        )
+
+        # A marca d'água passa a cobrir todo o período
+        sincronizacao = SincronizacaoCotacao.objects.get(moeda=self.moeda)
+        self.assertEqual(sincronizacao.data_inicial, data_compra)
+        self.assertEqual(sincronizacao.ultima_data, self.hoje)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', return_value={'inseridas': 0, 'atualizadas': 0})
+    def test_atualizacao_incremental_pela_marca_dagua(self, mock_buscar):
+        SincronizacaoCotacao.objects.create(moeda=self.moeda, data_inicial=date(2020, 1, 1), ultima_data=self.hoje - timedelta(days=1))
+
+        buscar_cotacoes_task(self.moeda.id, date(2022, 5, 10))
+
+        # Apenas uma requisição, a partir do candle que contém o dia novo
+        mock_buscar.assert_called_once_with(self.moeda, self.hoje.replace(day=1), self.hoje, intervalo='1M')
+        self.assertEqual(SincronizacaoCotacao.objects.get(moeda=self.moeda).ultima_data, self.hoje)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', return_value={'inseridas': 0, 'atualizadas': 0})
+    def test_cotacoes_ja_atualizadas(self, mock_buscar):
+        SincronizacaoCotacao.objects.create(moeda=self.moeda, data_inicial=date(2020, 1, 1), ultima_data=self.hoje)
+
+        resultado = buscar_cotacoes_task(self.moeda.id, date(2022, 5, 10))
+
+        self.assertEqual(resultado, "Cotações já atualizadas.")
+        mock_buscar.assert_not_called()
+
+    @patch('integracao.tasks.buscar_cotacoes_task.apply_async')
+    @patch('integracao.backfill.buscar_cotacoes_historicas', return_value={'inseridas': 0, 'atualizadas': 0})
+    def test_busca_em_andamento_reagenda(self, mock_buscar, mock_apply_async):
+        chave = f'integracao:lock:cotacoes:{self.moeda.id}'
+        token = adquirir_lock(chave)
+        try:
+            resultado = buscar_cotacoes_task(self.moeda.id, '2022-05-10')
+        finally:
+            liberar_lock(chave, token)
+
+        self.assertEqual(resultado, "Busca de cotações já em andamento.")
+        mock_buscar.assert_not_called()
+        mock_apply_async.assert_called_once()
+        self.assertEqual(mock_apply_async.call_args.kwargs['args'], (self.moeda.id, '2022-05-10'))
+
+        # Com o lock liberado, a busca é executada normalmente
+        buscar_cotacoes_task(self.moeda.id, '2022-05-10')
+        mock_buscar.assert_called()
+
+    @patch('integracao.tasks.buscar_cotacoes_task.apply_async')
+    @patch('integracao.backfill.buscar_cotacoes_historicas')
+    def test_busca_em_andamento_nao_reagenda_em_modo_sincrono(self, mock_buscar, mock_apply_async):
+        chave = chave_lock_cotacoes(self.moeda.id)
+        token = adquirir_lock(chave)
+        try:
+            resultado = buscar_cotacoes_task.apply(args=(self.moeda.id, '2022-05-10'))
+        finally:
+            liberar_lock(chave, token)
+
+        self.assertEqual(resultado.get(), "Busca de cotações já em andamento.")
+        mock_apply_async.assert_not_called()
+        mock_buscar.assert_not_called()
+
+    def test_lock_exclusivo(self):
+        token = adquirir_lock('teste:lock', ttl=60)
+
+        self.assertIsNotNone(token)
+        self.assertIsNone(adquirir_lock('teste:lock', ttl=60))
+
+        liberar_lock('teste:lock', 'outro_token')
+        self.assertIsNone(adquirir_lock('teste:lock', ttl=60))
+
+        liberar_lock('teste:lock', token)
+        self.assertIsNotNone(adquirir_lock('teste:lock', ttl=60))
+
+    def test_coalescer_intervalos(self):
+        intervalos = [
+            (date(2024, 1, 1), date(2024, 1, 2)),
+            (date(2024, 1, 5), date(2024, 1, 6)),
+            (date(2024, 2, 1), date(2024, 2, 3)),
+        ]
+
+        self.assertEqual(coalescer_intervalos(intervalos, tolerancia_dias=3), [
+            (date(2024, 1, 1), date(2024, 1, 6)),
+            (date(2024, 2, 1), date(2024, 2, 3)),
+        ])
+        self.assertEqual(coalescer_intervalos(intervalos, tolerancia_dias=0), intervalos)
+
+
+@patch('integracao.tasks.agendar_recalculo')
+class RetentativasTestCase(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='12345')
+        corretora_usuario = CorretoraUsuario.objects.create(
+            corretora=CorretoraConfig.objects.create(nome="Bybit", url_base="https://api.bybit.com", exige_passphrase=False),
+            api_key="test_api_key",
+            api_secret="test_api_secret",
+            usuario=self.usuario
+        )
+        self.moeda = Moeda.objects.create(
+            nome='Bitcoin', token='BTC', usuario=self.usuario,
+            corretora_content_type=ContentType.objects.get_for_model(CorretoraUsuario),
+            corretora_object_id=corretora_usuario.id
+        )
+        self.data_compra = date.today().replace(day=1).isoformat()
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas')
+    def test_erro_transitorio_e_tentado_de_novo(self, mock_buscar, mock_recalculo):
+        mock_buscar.side_effect = [ErroTimeout('Timeout'), {'inseridas': 1, 'atualizadas': 0}]
+
+        resultado = buscar_cotacoes_task.apply(args=(self.moeda.id, self.data_compra), throw=False)
+
+        self.assertEqual(resultado.get(), "Cotações atualizadas com sucesso.")
+        self.assertEqual(mock_buscar.call_count, 2)
+        # A nova tentativa retoma o mesmo backfill, que termina concluído
+        progresso = ProgressoBackfill.objects.get(moeda=self.moeda)
+        self.assertEqual(progresso.status, ProgressoBackfill.STATUS_CONCLUIDO)
+        # O lock da moeda foi liberado ao final da tarefa
+        chave = chave_lock_cotacoes(self.moeda.id)
+        token = adquirir_lock(chave, ttl=1)
+        self.assertIsNotNone(token)
+        liberar_lock(chave, token)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', side_effect=ErroAutenticacao('Chave API inválida.'))
+    def test_erro_nao_repetivel_falha_sem_nova_tentativa(self, mock_buscar, mock_recalculo):
+        resultado = buscar_cotacoes_task.apply(args=(self.moeda.id, self.data_compra), throw=False)
+
+        self.assertEqual(resultado.state, 'FAILURE')
+        self.assertIsInstance(resultado.result, ErroAutenticacao)
+        mock_buscar.assert_called_once()
+        self.assertEqual(ProgressoBackfill.objects.get(moeda=self.moeda).status, ProgressoBackfill.STATUS_ERRO)
+
+    @patch('integracao.backfill.buscar_cotacoes_historicas', side_effect=ErroServidor('Erro 503'))
+    def test_limite_de_tentativas(self, mock_buscar, mock_recalculo):
+        # Na última tentativa permitida, o erro é propagado sem reagendar a tarefa
+        resultado = buscar_cotacoes_task.apply(
+            args=(self.moeda.id, self.data_compra), retries=buscar_cotacoes_task.max_retries, throw=False
+        )
+
+        self.assertEqual(resultado.state, 'FAILURE')
+        self.assertIsInstance(resultado.result, ErroServidor)
+        mock_buscar.assert_called_once()
+
+    @patch('celery.app.task.Task.retry')
+    def test_espera_respeita_retry_after(self, mock_retry, mock_recalculo):
+        erro = ErroLimiteRequisicoes('Limite de requisições', 429, retry_after=120)
+
+        buscar_cotacoes_task.retry(exc=erro, countdown=4)
+        self.assertEqual(mock_retry.call_args.kwargs['countdown'], 120)
+
+        # O backoff prevalece quando já é maior que o Retry-After
+        buscar_cotacoes_task.retry(exc=erro, countdown=300)
+        self.assertEqual(mock_retry.call_args.kwargs['countdown'], 300)
+
+        buscar_cotacoes_task.retry(exc=ErroTimeout('Timeout'), countdown=4)
+        self.assertEqual(mock_retry.call_args.kwargs['countdown'], 4)
+
+
+class AtualizacaoPeriodicaTestCase(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='12345')
+        corretora_config = CorretoraConfig.objects.create(nome="Bybit", url_base="https://api.bybit.com", exige_passphrase=False)
+        self.corretora_usuario = CorretoraUsuario.objects.create(
+            corretora=corretora_config, api_key="test_api_key", api_secret="test_api_secret", usuario=self.usuario
+        )
+        self.hoje = date.today()
+        self.moedas = []
+        for token in ('BTC', 'ETH', 'SOL'):
+            moeda = Moeda.objects.create(
+                nome=token, token=token, usuario=self.usuario,
+                corretora_content_type=ContentType.objects.get_for_model(CorretoraUsuario),
+                corretora_object_id=self.corretora_usuario.id
+            )
+            SincronizacaoCotacao.objects.create(moeda=moeda, data_inicial=date(2020, 1, 1), ultima_data=self.hoje - timedelta(days=1))
+            self.moedas.append(moeda)
+        self.corretora_config = corretora_config
+        # Moeda nunca sincronizada: fica fora da atualização periódica
+        Moeda.objects.create(nome='Cardano', token='ADA', usuario=self.usuario)
+
+    def _servico_falso(self):
+        servico = MagicMock()
+        inicio_mes = self.hoje.replace(day=1)
+
+        async def buscar_cotacoes_em_lote(simbolos, inicio, fim, intervalo='1D'):
+            return {
+                simbolo: [{'data': inicio_mes, 'abertura': 1, 'fechamento': 10 + indice, 'alta': 1, 'baixa': 1, 'volume': 1}]
+                for indice, simbolo in enumerate(simbolos)
+            }
+
+        servico.buscar_cotacoes_em_lote.side_effect = buscar_cotacoes_em_lote
+        return servico
+
+    @patch('integracao.tasks.agendar_recalculo')
+    def test_fan_out_por_blocos_e_consolidacao(self, mock_recalculo):
+        servico = self._servico_falso()
+        with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async', return_value=servico) as mock_criar, \
+                self.settings(INTEGRACAO_ATUALIZACAO_TAMANHO_BLOCO=2, INTEGRACAO_ATUALIZACAO_CONCORRENCIA=3):
+            resultado = atualizar_cotacoes_task()
+
+        self.assertEqual(resultado, "2 bloco(s) de cotações agendado(s).")
+        self.assertEqual(servico.buscar_cotacoes_em_lote.call_count, 2)
+        self.assertEqual(mock_criar.call_args.kwargs['concorrencia'], 3)
+        # O candle do mês corrente é buscado novamente a partir do seu início
+        simbolos, inicio, fim = servico.buscar_cotacoes_em_lote.call_args_list[0].args
+        self.assertEqual((simbolos, inicio, fim), (['BTC', 'ETH'], self.hoje.replace(day=1), self.hoje))
+
+        for moeda in self.moedas:
+            self.assertTrue(HistoricoCotacao.objects.filter(moeda=moeda, data=self.hoje.replace(day=1)).exists())
+            self.assertEqual(SincronizacaoCotacao.objects.get(moeda=moeda).ultima_data, self.hoje)
+            self.assertTrue(UltimaCotacao.objects.filter(moeda=moeda).exists())
+        mock_recalculo.assert_called_once_with(self.usuario.id, self.hoje.replace(day=1))
+
+    @patch('integracao.tasks.agendar_recalculo')
+    def test_moeda_com_busca_em_andamento_e_ignorada(self, mock_recalculo):
+        servico = self._servico_falso()
+        chave = chave_lock_cotacoes(self.moedas[0].id)
+        token = adquirir_lock(chave)
+        try:
+            with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async', return_value=servico):
+                atualizar_cotacoes_task()
+        finally:
+            liberar_lock(chave, token)
+
+        self.assertFalse(HistoricoCotacao.objects.filter(moeda=self.moedas[0]).exists())
+        self.assertTrue(HistoricoCotacao.objects.filter(moeda=self.moedas[1]).exists())
+
+    @patch('integracao.tasks.agendar_recalculo')
+    def test_falha_de_um_bloco_nao_impede_a_consolidacao(self, mock_recalculo):
+        servico = self._servico_falso()
+        buscar = servico.buscar_cotacoes_em_lote.side_effect
+
+        async def buscar_com_falha(simbolos, inicio, fim, intervalo='1D'):
+            if 'SOL' in simbolos:
+                raise ErroAutenticacao("Chave revogada", status=401)
+            return await buscar(simbolos, inicio, fim, intervalo)
+
+        servico.buscar_cotacoes_em_lote.side_effect = buscar_com_falha
+        with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async', return_value=servico), \
+                self.settings(INTEGRACAO_ATUALIZACAO_TAMANHO_BLOCO=2):
+            atualizar_cotacoes_task()
+
+        self.assertEqual(servico.buscar_cotacoes_em_lote.call_count, 2)
+        self.assertTrue(HistoricoCotacao.objects.filter(moeda=self.moedas[0]).exists())
+        self.assertFalse(HistoricoCotacao.objects.filter(moeda=self.moedas[2]).exists())
+        mock_recalculo.assert_called_once_with(self.usuario.id, self.hoje.replace(day=1))
+
+    def test_erro_transitorio_repete_apenas_as_moedas_que_falharam(self):
+        servico = self._servico_falso()
+        buscar = servico.buscar_cotacoes_em_lote.side_effect
+        falhas = [ErroTimeout("Tempo esgotado")]
+
+        async def buscar_com_falha(simbolos, inicio, fim, intervalo='1D'):
+            if 'SOL' in simbolos and falhas:
+                raise falhas.pop()
+            return await buscar(simbolos, inicio, fim, intervalo)
+
+        servico.buscar_cotacoes_em_lote.side_effect = buscar_com_falha
+        # As moedas de cada início de período formam um grupo buscado separadamente
+        SincronizacaoCotacao.objects.filter(moeda=self.moedas[2]).update(ultima_data=date(2020, 1, 1))
+        with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async', return_value=servico):
+            resultado = atualizar_bloco_cotacoes_task.apply(
+                args=(self.corretora_usuario.id, [moeda.id for moeda in self.moedas]), throw=False
+            )
+
+        simbolos_buscados = [chamada.args[0] for chamada in servico.buscar_cotacoes_em_lote.call_args_list]
+        self.assertEqual(simbolos_buscados, [['BTC', 'ETH'], ['SOL'], ['SOL']])
+        # A nova tentativa devolve também as moedas atualizadas antes da falha
+        self.assertEqual(sorted(moeda_id for moeda_id, _ in resultado.get()), sorted(moeda.id for moeda in self.moedas))
+        for moeda in self.moedas:
+            self.assertTrue(HistoricoCotacao.objects.filter(moeda=moeda).exists())
+
+    def _mover_para_outra_conta(self, moeda):
+        outro_usuario = Usuario.objects.create_user(username='outro', password='12345')
+        outra_conta = CorretoraUsuario.objects.create(
+            corretora=self.corretora_config, api_key="outra_key", api_secret="outro_secret", usuario=outro_usuario
+        )
+        Moeda.objects.filter(pk=moeda.pk).update(usuario=outro_usuario, corretora_object_id=outra_conta.id)
+        return outra_conta
+
+    @patch('integracao.tasks.agendar_recalculo')
+    def test_cada_conta_busca_as_proprias_moedas(self, mock_recalculo):
+        outra_conta = self._mover_para_outra_conta(self.moedas[2])
+        servicos = {self.corretora_usuario.id: self._servico_falso(), outra_conta.id: self._servico_falso()}
+
+        with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async',
+                   side_effect=lambda conta, concorrencia: servicos[conta.id]):
+            resultado = atualizar_cotacoes_task()
+
+        self.assertEqual(resultado, "2 bloco(s) de cotações agendado(s).")
+        self.assertEqual(servicos[self.corretora_usuario.id].buscar_cotacoes_em_lote.call_args.args[0], ['BTC', 'ETH'])
+        self.assertEqual(servicos[outra_conta.id].buscar_cotacoes_em_lote.call_args.args[0], ['SOL'])
+        self.assertEqual(mock_recalculo.call_count, 2)
+
+    def _servico_revogado(self):
+        servico = MagicMock()
+        servico.buscar_cotacoes_em_lote.side_effect = ErroAutenticacao("Chave revogada", status=401)
+        return servico
+
+    @patch('integracao.tasks.agendar_recalculo')
+    def test_credenciais_recusadas_usam_outra_conta_do_mesmo_usuario(self, mock_recalculo):
+        conta_reserva = CorretoraUsuario.objects.create(
+            corretora=self.corretora_config, api_key="reserva_key", api_secret="reserva_secret", usuario=self.usuario
+        )
+        servicos = {self.corretora_usuario.id: self._servico_revogado(), conta_reserva.id: self._servico_falso()}
+
+        with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async',
+                   side_effect=lambda conta, concorrencia: servicos[conta.id]):
+            atualizar_cotacoes_task()
+
+        servicos[self.corretora_usuario.id].buscar_cotacoes_em_lote.assert_called_once()
+        self.assertEqual(servicos[conta_reserva.id].buscar_cotacoes_em_lote.call_args.args[0], ['BTC', 'ETH', 'SOL'])
+        for moeda in self.moedas:
+            self.assertTrue(HistoricoCotacao.objects.filter(moeda=moeda).exists())
+
+    @patch('integracao.tasks.agendar_recalculo')
+    def test_credenciais_recusadas_nao_usam_conta_de_outro_usuario(self, mock_recalculo):
+        outra_conta = self._mover_para_outra_conta(self.moedas[2])
+        servicos = {self.corretora_usuario.id: self._servico_revogado(), outra_conta.id: self._servico_falso()}
+
+        with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async',
+                   side_effect=lambda conta, concorrencia: servicos[conta.id]):
+            atualizar_cotacoes_task()
+
+        self.assertEqual(
+            [chamada.args[0] for chamada in servicos[outra_conta.id].buscar_cotacoes_em_lote.call_args_list], [['SOL']]
+        )
+        self.assertFalse(HistoricoCotacao.objects.filter(moeda__in=self.moedas[:2]).exists())
+        self.assertTrue(HistoricoCotacao.objects.filter(moeda=self.moedas[2]).exists())
+
+    def test_nova_tentativa_nao_repete_a_conta_recusada(self):
+        conta_reserva = CorretoraUsuario.objects.create(
+            corretora=self.corretora_config, api_key="reserva_key", api_secret="reserva_secret", usuario=self.usuario
+        )
+        servico_reserva = self._servico_falso()
+        buscar = servico_reserva.buscar_cotacoes_em_lote.side_effect
+        falhas = [ErroTimeout("Tempo esgotado")]
+
+        async def buscar_com_falha(simbolos, inicio, fim, intervalo='1D'):
+            if falhas:
+                raise falhas.pop()
+            return await buscar(simbolos, inicio, fim, intervalo)
+
+        servico_reserva.buscar_cotacoes_em_lote.side_effect = buscar_com_falha
+        servicos = {self.corretora_usuario.id: self._servico_revogado(), conta_reserva.id: servico_reserva}
+        with patch('integracao.tasks.CorretoraServiceFactory.criar_servico_async',
+                   side_effect=lambda conta, concorrencia: servicos[conta.id]):
+            resultado = atualizar_bloco_cotacoes_task.apply(
+                args=(self.corretora_usuario.id, [moeda.id for moeda in self.moedas], [conta_reserva.id]), throw=False
+            )
+
+        # A conta recusada não é usada de novo na nova tentativa
+        servicos[self.corretora_usuario.id].buscar_cotacoes_em_lote.assert_called_once()
+        self.assertEqual(servico_reserva.buscar_cotacoes_em_lote.call_count, 2)
+        self.assertEqual(len(resultado.get()), 3)
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import ProgressoBackfillViewSet
+
+router = DefaultRouter()
+router.register(r'backfills', ProgressoBackfillViewSet, basename='backfill')
+
+urlpatterns = [
+    path('api/v1/', include(router.urls)),
+]
@@ -1,3 +1,27 @@
-from django.shortcuts import render
+from rest_framework import viewsets
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .models import ProgressoBackfill
+from .serializers import ProgressoBackfillSerializer
 
-# Create your views here.
+
+class ProgressoBackfillViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Progresso das buscas de cotações históricas das moedas do usuário autenticado,
+    da mais recente para a mais antiga. Aceita o filtro opcional ?moeda=<id>.
+    """
+    serializer_class = ProgressoBackfillSerializer
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        moeda_id = request.query_params.get('moeda')
+        if moeda_id and not moeda_id.isdigit():
+            return Response({"error": "Moeda inválida. Informe o id numérico da moeda."}, status=400)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = ProgressoBackfill.objects.filter(moeda__usuario=self.request.user).order_by('-id')
+        moeda_id = self.request.query_params.get('moeda')
+        if moeda_id and moeda_id.isdigit():
+            queryset = queryset.filter(moeda_id=moeda_id)
+        return queryset
@@ -0,0 +1,63 @@
+import calendar
+from datetime import timedelta
+from decimal import Decimal
+
+PERIODICIDADES = ('semanal', 'quinzenal', 'mensal')
+CASAS_DECIMAIS = Decimal('1e-10')
+
+
+def inicio_periodo_agregado(data, periodicidade):
+    """
+    Primeiro dia do período que contém a data: a segunda-feira (semanal), o dia 1 ou 16
+    (quinzenal) ou o primeiro dia do mês (mensal).
+    """
+    if periodicidade == 'semanal':
+        return data - timedelta(days=data.weekday())
+    if periodicidade == 'quinzenal':
+        return data.replace(day=1 if data.day <= 15 else 16)
+    return data.replace(day=1)
+
+
+def fim_periodo_agregado(inicio, periodicidade):
+    """
+    Último dia do período iniciado em `inicio`.
+    """
+    if periodicidade == 'semanal':
+        return inicio + timedelta(days=6)
+    ultimo_dia = calendar.monthrange(inicio.year, inicio.month)[1]
+    if periodicidade == 'quinzenal' and inicio.day == 1:
+        return inicio.replace(day=15)
+    return inicio.replace(day=ultimo_dia)
+
+
+def quinzena(inicio):
+    return 1 if inicio.day == 1 else 2
+
+
+def agregar_cotacoes(cotacoes):
+    """
+    Agrega cotações diárias (data, abertura, fechamento, alta, baixa, volume), em ordem
+    de data, em um único candle do período.
+    """
+    cotacoes = list(cotacoes)
+    soma_fechamento = sum((cotacao[2] for cotacao in cotacoes), Decimal('0'))
+    return {
+        'abertura': cotacoes[0][1],
+        'fechamento': cotacoes[-1][2],
+        'alta': max(cotacao[3] for cotacao in cotacoes),
+        'baixa': min(cotacao[4] for cotacao in cotacoes),
+        'volume': sum((cotacao[5] for cotacao in cotacoes), Decimal('0')),
+        'fechamento_medio': (soma_fechamento / len(cotacoes)).quantize(CASAS_DECIMAIS),
+        'quantidade': len(cotacoes),
+    }
+
+
+def agregar_por_periodo(cotacoes, periodicidade):
+    """
+    Agrupa cotações diárias ordenadas por data nos períodos da periodicidade.
+    Retorna {inicio_periodo: candle} em ordem cronológica.
+    """
+    periodos = {}
+    for cotacao in cotacoes:
+        periodos.setdefault(inicio_periodo_agregado(cotacao[0], periodicidade), []).append(cotacao)
+    return {inicio: agregar_cotacoes(linhas) for inicio, linhas in periodos.items()}
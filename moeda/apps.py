@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class MoedaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'moeda'
\ No newline at end of file
+    name = 'moeda'
+
+    def ready(self):
+        import moeda.signals
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+from datetime import date, timedelta
+from typing import NamedTuple
+import numpy as np
+from django.conf import settings
+from moeda.compactacao import COLUNAS, escalar_coluna, inteiros_para_decimal, inteiros_para_float
+from moeda.models import HistoricoCotacao
+
+ARQUIVO_METADADOS = 'metadados.json'
+
+
+class SerieArquivada(NamedTuple):
+    ate: date  # Última data coberta pelo arquivo
+    datas: np.ndarray  # datetime64[D], mapeado em memória
+    colunas: dict  # {coluna: ndarray int64 mapeado em memória, com o valor * 10 ** escala}
+    escalas: dict  # {coluna: escala}
+
+    def fatia(self, data_inicio, data_fim):
+        """
+        Intervalo [data_inicio, data_fim] da série como fatias (sem cópia) dos arrays
+        mapeados: (datas, {coluna: inteiros escalados}).
+        """
+        inicio = np.searchsorted(self.datas, np.datetime64(data_inicio, 'D'), side='left')
+        fim = np.searchsorted(self.datas, np.datetime64(data_fim, 'D'), side='right')
+        return self.datas[inicio:fim], {coluna: valores[inicio:fim] for coluna, valores in self.colunas.items()}
+
+    def valores_float(self, coluna, inteiros):
+        return inteiros_para_float(inteiros, self.escalas[coluna])
+
+    def valores_decimal(self, coluna, inteiros):
+        """
+        Valores exatos (Decimal), iguais aos do banco.
+        """
+        return inteiros_para_decimal(inteiros, self.escalas[coluna])
+
+
+def diretorio_arquivo():
+    return getattr(settings, 'MOEDA_ARQUIVO_DIR', os.path.join(settings.BASE_DIR, 'arquivo_cotacoes'))
+
+
+def _diretorio_moeda(moeda_id):
+    return os.path.join(diretorio_arquivo(), str(moeda_id))
+
+
+def data_limite_arquivo(hoje=None):
+    """
+    Data até a qual as cotações são consideradas frias e podem ir para o arquivo.
+    """
+    hoje = hoje or date.today()
+    return hoje - timedelta(days=getattr(settings, 'MOEDA_ARQUIVO_IDADE_DIAS', 365))
+
+
+def arquivar_moeda(moeda_id, ate):
+    """
+    Exporta as cotações da moeda até a data para o arquivo colunar: um .npy por coluna
+    (datas em datetime64[D] e OHLCV como inteiros de 64 bits com uma escala por coluna, sem
+    perdas). Uma coluna que não caiba exatamente em 64 bits fica fora do arquivo e continua
+    sendo lida do banco. O diretório da moeda é trocado por inteiro ao final, para que
+    leitores nunca vejam um arquivo pela metade.
+    Retorna a quantidade de cotações arquivadas.
+    """
+    linhas = list(HistoricoCotacao.objects.filter(
+        moeda_id=moeda_id,
+        data__lte=ate
+    ).order_by('data').values_list('data', *COLUNAS))
+    if not linhas:
+        return 0
+
+    destino = _diretorio_moeda(moeda_id)
+    temporario = f'{destino}.tmp'
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    np.save(os.path.join(temporario, 'data.npy'), np.array([linha[0] for linha in linhas], dtype='datetime64[D]'))
+    escalas = {}
+    for indice, coluna in enumerate(COLUNAS, start=1):
+        escalada = escalar_coluna(linha[indice] for linha in linhas)
+        if escalada is None:
+            continue
+        escalas[coluna], inteiros = escalada
+        np.save(os.path.join(temporario, f'{coluna}.npy'), inteiros)
+    with open(os.path.join(temporario, ARQUIVO_METADADOS), 'w') as arquivo:
+        json.dump({'ate': ate.isoformat(), 'linhas': len(linhas), 'escalas': escalas}, arquivo)
+
+    antigo = f'{destino}.old'
+    if os.path.isdir(destino):
+        os.replace(destino, antigo)
+    os.replace(temporario, destino)
+    shutil.rmtree(antigo, ignore_errors=True)
+    return len(linhas)
+
+
+def _ler_metadados(moeda_id):
+    try:
+        with open(os.path.join(_diretorio_moeda(moeda_id), ARQUIVO_METADADOS)) as arquivo:
+            metadados = json.load(arquivo)
+    except FileNotFoundError:
+        return None
+    # Arquivos do formato anterior (float64, sem escalas) são ignorados até serem regerados
+    return metadados if 'escalas' in metadados else None
+
+
+def ler_arquivo(moeda_id):
+    """
+    Abre o arquivo colunar da moeda com os arrays mapeados em memória (np.load com
+    mmap_mode='r'). Retorna None se a moeda não tiver arquivo.
+    """
+    metadados = _ler_metadados(moeda_id)
+    if metadados is None:
+        return None
+
+    diretorio = _diretorio_moeda(moeda_id)
+    return SerieArquivada(
+        ate=date.fromisoformat(metadados['ate']),
+        datas=np.load(os.path.join(diretorio, 'data.npy'), mmap_mode='r'),
+        colunas={coluna: np.load(os.path.join(diretorio, f'{coluna}.npy'), mmap_mode='r') for coluna in metadados['escalas']},
+        escalas=metadados['escalas'],
+    )
+
+
+def invalidar_arquivo(moeda_id, data):
+    """
+    Remove o arquivo da moeda se ele cobrir a data de uma cotação gravada ou removida no
+    banco, para que a leitura volte ao banco até o arquivo ser regerado (arquivar_cotacoes).
+    """
+    metadados = _ler_metadados(moeda_id)
+    # Datas ISO comparadas como texto: aceita date ou 'AAAA-MM-DD'
+    if metadados is not None and str(data)[:10] <= metadados['ate']:
+        remover_arquivo(moeda_id)
+
+
+def remover_arquivo(moeda_id):
+    shutil.rmtree(_diretorio_moeda(moeda_id), ignore_errors=True)
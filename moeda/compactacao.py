@@ -0,0 +1,40 @@
+from decimal import Decimal
+import numpy as np
+
+# Colunas de HistoricoCotacao guardadas como inteiros escalados (arquivo colunar), nesta ordem
+COLUNAS = ('abertura', 'fechamento', 'alta', 'baixa', 'volume')
+# Casas decimais de HistoricoCotacao: a escala nunca passa disso
+ESCALA_MAXIMA = 10
+# Dígitos que cabem com folga em um inteiro de 64 bits com sinal
+DIGITOS_INT64 = 18
+
+
+def escala_coluna(valores):
+    """
+    Maior escala (casas decimais, até ESCALA_MAXIMA) com a qual todos os valores da coluna,
+    multiplicados por 10 ** escala, cabem em um inteiro de 64 bits.
+    """
+    maior = max((abs(valor) for valor in valores), default=Decimal('0'))
+    digitos_inteiros = len(str(int(maior))) if maior >= 1 else 0
+    return max(0, min(ESCALA_MAXIMA, DIGITOS_INT64 - digitos_inteiros))
+
+
+def escalar_coluna(valores):
+    """
+    Coluna de valores Decimal como inteiros de 64 bits (valor * 10 ** escala), sem perdas.
+    Retorna (escala, ndarray int64) ou None se algum valor não couber exatamente.
+    """
+    valores = [Decimal(valor) for valor in valores]
+    escala = escala_coluna(valores)
+    escalados = [valor.scaleb(escala) for valor in valores]
+    if any(valor != valor.to_integral_value() for valor in escalados):
+        return None
+    return escala, np.array([int(valor) for valor in escalados], dtype=np.int64)
+
+
+def inteiros_para_float(inteiros, escala):
+    return np.asarray(inteiros) / 10.0 ** escala
+
+
+def inteiros_para_decimal(inteiros, escala):
+    return [Decimal(valor).scaleb(-escala) for valor in np.asarray(inteiros).tolist()]
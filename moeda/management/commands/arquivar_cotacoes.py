@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from moeda.arquivo import arquivar_moeda, data_limite_arquivo
+from moeda.models import Moeda
+
+
+class Command(BaseCommand):
+    help = 'Exporta as cotações antigas de cada moeda para o arquivo colunar (.npy por coluna).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('moedas', nargs='*', type=int, help='IDs das moedas (padrão: todas)')
+
+    def handle(self, *args, **options):
+        moedas = Moeda.objects.all()
+        if options['moedas']:
+            moedas = moedas.filter(pk__in=options['moedas'])
+
+        ate = data_limite_arquivo()
+        total = 0
+        for moeda_id in moedas.values_list('pk', flat=True):
+            total += arquivar_moeda(moeda_id, ate)
+        self.stdout.write(self.style.SUCCESS(f'{total} cotação(ões) arquivada(s) até {ate:%d/%m/%Y}.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from moeda.models import CotacaoAgregada
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os candles semanais, quinzenais e mensais a partir do histórico de cotações.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('moedas', nargs='*', type=int, help='IDs das moedas (padrão: todas)')
+
+    def handle(self, *args, **options):
+        moeda_ids = options['moedas'] or None
+        total = CotacaoAgregada.reconstruir(moeda_ids)
+        self.stdout.write(self.style.SUCCESS(f'{total} candle(s) agregado(s) reconstruído(s).'))
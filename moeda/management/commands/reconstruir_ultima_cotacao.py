@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from moeda.models import UltimaCotacao
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a tabela de última cotação de cada moeda a partir do histórico de cotações.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('moedas', nargs='*', type=int, help='IDs das moedas (padrão: todas)')
+
+    def handle(self, *args, **options):
+        moeda_ids = options['moedas'] or None
+        total = UltimaCotacao.reconstruir(moeda_ids)
+        self.stdout.write(self.style.SUCCESS(f'Última cotação reconstruída para {total} moeda(s).'))
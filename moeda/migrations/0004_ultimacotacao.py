@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 01:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def popular_ultima_cotacao(apps, schema_editor):
+    # Preenche a tabela a partir do histórico já existente
+    Moeda = apps.get_model('moeda', 'Moeda')
+    HistoricoCotacao = apps.get_model('moeda', 'HistoricoCotacao')
+    UltimaCotacao = apps.get_model('moeda', 'UltimaCotacao')
+
+    cotacao_recente = HistoricoCotacao.objects.filter(moeda=models.OuterRef('pk')).order_by('-data')
+    moedas = Moeda.objects.annotate(
+        ultima_data=models.Subquery(cotacao_recente.values('data')[:1]),
+        ultimo_fechamento=models.Subquery(cotacao_recente.values('fechamento')[:1])
+    ).filter(ultima_data__isnull=False)
+    UltimaCotacao.objects.bulk_create(
+        UltimaCotacao(moeda_id=moeda.pk, data=moeda.ultima_data, fechamento=moeda.ultimo_fechamento)
+        for moeda in moedas
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moeda', '0003_remove_historicocotacao_preco_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UltimaCotacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('fechamento', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('moeda', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ultima_cotacao', to='moeda.moeda')),
+            ],
+        ),
+        migrations.RunPython(popular_ultima_cotacao, migrations.RunPython.noop),
+    ]
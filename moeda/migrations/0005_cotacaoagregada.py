@@ -0,0 +1,56 @@
+# Generated by Django 5.1.1 on 2026-10-18 01:49
+
+import django.db.models.deletion
+from itertools import groupby
+from django.db import migrations, models
+from moeda.agregacao import PERIODICIDADES, agregar_por_periodo
+
+
+def popular_cotacoes_agregadas(apps, schema_editor):
+    # Agrega o histórico já existente, uma moeda por vez
+    HistoricoCotacao = apps.get_model('moeda', 'HistoricoCotacao')
+    CotacaoAgregada = apps.get_model('moeda', 'CotacaoAgregada')
+
+    linhas = HistoricoCotacao.objects.filter(data__isnull=False).order_by('moeda_id', 'data').values_list(
+        'moeda_id', 'data', 'abertura', 'fechamento', 'alta', 'baixa', 'volume'
+    )
+    for moeda_id, cotacoes in groupby(linhas.iterator(), key=lambda linha: linha[0]):
+        cotacoes = [linha[1:] for linha in cotacoes]
+        CotacaoAgregada.objects.bulk_create(
+            (
+                CotacaoAgregada(moeda_id=moeda_id, periodicidade=periodicidade, inicio=inicio, **candle)
+                for periodicidade in PERIODICIDADES
+                for inicio, candle in agregar_por_periodo(cotacoes, periodicidade).items()
+            ),
+            batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moeda', '0004_ultimacotacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotacaoAgregada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodicidade', models.CharField(choices=[('semanal', 'semanal'), ('quinzenal', 'quinzenal'), ('mensal', 'mensal')], max_length=10)),
+                ('inicio', models.DateField()),
+                ('abertura', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('fechamento', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('alta', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('baixa', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('volume', models.DecimalField(decimal_places=10, default=0, max_digits=30)),
+                ('fechamento_medio', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('moeda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cotacoes_agregadas', to='moeda.moeda')),
+            ],
+            options={
+                'unique_together': {('moeda', 'periodicidade', 'inicio')},
+            },
+        ),
+        migrations.RunPython(popular_cotacoes_agregadas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moeda', '0005_cotacaoagregada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicocotacao',
+            index=models.Index(fields=['moeda', '-data', 'fechamento'], name='historico_moeda_data_fech_idx'),
+        ),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+from datetime import timedelta
+from itertools import groupby
+from django.db import models, transaction, IntegrityError
 from usuario.models import Usuario
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from moeda.agregacao import PERIODICIDADES, agregar_por_periodo, fim_periodo_agregado, inicio_periodo_agregado
+
 
 class Moeda(models.Model):
     nome = models.CharField(max_length=100)
@@ -30,8 +34,200 @@ class HistoricoCotacao(models.Model):
 
     class Meta:
         unique_together = ('moeda', 'data')  # Garante que só haverá uma cotação por moeda por dia
+        indexes = [
+            # Cobre as leituras por moeda e período (séries de fechamento) e a da cotação mais
+            # recente (ordem decrescente de data) sem acessar a tabela
+            models.Index(fields=['moeda', '-data', 'fechamento'], name='historico_moeda_data_fech_idx'),
+        ]
 
     def __str__(self):
         return f'{self.moeda.nome} - {self.data} - Abertura: {self.abertura} - Fechamento: {self.fechamento}'
 
 
+class UltimaCotacao(models.Model):
+    """
+    Última cotação conhecida de cada moeda (desnormalizada a partir de HistoricoCotacao),
+    para que as telas consultem o preço atual sem ordenar o histórico.
+    """
+    moeda = models.OneToOneField(Moeda, on_delete=models.CASCADE, related_name='ultima_cotacao')
+    data = models.DateField()
+    fechamento = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+
+    def __str__(self):
+        return f'{self.moeda.nome} - {self.data} - Fechamento: {self.fechamento}'
+
+    @classmethod
+    def registrar(cls, moeda_id, data, fechamento):
+        """
+        Registra uma cotação como a última da moeda, se ela for tão ou mais recente que a atual.
+        """
+        if cls.objects.filter(moeda_id=moeda_id, data__lte=data).update(data=data, fechamento=fechamento):
+            return
+        if cls.objects.filter(moeda_id=moeda_id).exists():
+            return  # Já existe uma cotação mais recente
+        try:
+            with transaction.atomic():
+                cls.objects.create(moeda_id=moeda_id, data=data, fechamento=fechamento)
+        except IntegrityError:
+            # Outro processo criou o registro ao mesmo tempo
+            cls.objects.filter(moeda_id=moeda_id, data__lte=data).update(data=data, fechamento=fechamento)
+
+    @classmethod
+    def reconstruir(cls, moeda_ids=None):
+        """
+        Recalcula a última cotação a partir do histórico, para todas as moedas ou apenas
+        para as informadas. Retorna a quantidade de moedas com cotação.
+        """
+        cotacao_recente = HistoricoCotacao.objects.filter(moeda=models.OuterRef('pk')).order_by('-data')
+        moedas = Moeda.objects.all()
+        if moeda_ids is not None:
+            moedas = moedas.filter(pk__in=moeda_ids)
+        moedas = moedas.annotate(
+            ultima_data=models.Subquery(cotacao_recente.values('data')[:1]),
+            ultimo_fechamento=models.Subquery(cotacao_recente.values('fechamento')[:1])
+        ).filter(ultima_data__isnull=False).values_list('pk', 'ultima_data', 'ultimo_fechamento')
+
+        with transaction.atomic():
+            existentes = cls.objects.all()
+            if moeda_ids is not None:
+                existentes = existentes.filter(moeda_id__in=moeda_ids)
+            existentes.delete()
+            criadas = cls.objects.bulk_create(
+                cls(moeda_id=moeda_id, data=data, fechamento=fechamento)
+                for moeda_id, data, fechamento in moedas.iterator()
+            )
+        return len(criadas)
+
+
+class CotacaoAgregada(models.Model):
+    """
+    Candle semanal, quinzenal ou mensal de cada moeda, agregado a partir de HistoricoCotacao
+    e mantido conforme as cotações diárias são gravadas, para que os gráficos por período
+    leiam poucas linhas em vez de agrupar todo o histórico.
+    """
+    PERIODICIDADE_CHOICES = [(periodicidade, periodicidade) for periodicidade in PERIODICIDADES]
+
+    moeda = models.ForeignKey(Moeda, on_delete=models.CASCADE, related_name='cotacoes_agregadas')
+    periodicidade = models.CharField(max_length=10, choices=PERIODICIDADE_CHOICES)
+    inicio = models.DateField()  # Primeiro dia do período
+    abertura = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    fechamento = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    alta = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    baixa = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    volume = models.DecimalField(max_digits=30, decimal_places=10, default=0)
+    fechamento_medio = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    quantidade = models.PositiveIntegerField(default=0)  # Dias com cotação no período
+
+    class Meta:
+        unique_together = ('moeda', 'periodicidade', 'inicio')
+
+    def __str__(self):
+        return f'{self.moeda.nome} - {self.periodicidade} {self.inicio} - Fechamento: {self.fechamento}'
+
+    @classmethod
+    def atualizar(cls, moeda_id, datas):
+        """
+        Recalcula, a partir do histórico, apenas os períodos que contêm as datas informadas
+        (todas as periodicidades), com uma consulta ao histórico.
+        """
+        campo_data = cls._meta.get_field('inicio')
+        datas = {campo_data.to_python(data) for data in datas if data is not None}
+        if not datas:
+            return
+        afetados = {
+            periodicidade: {inicio_periodo_agregado(data, periodicidade) for data in datas}
+            for periodicidade in PERIODICIDADES
+        }
+        inicio = min(min(inicios) for inicios in afetados.values())
+        fim = max(fim_periodo_agregado(max(inicios), periodicidade) for periodicidade, inicios in afetados.items())
+        cotacoes = list(HistoricoCotacao.objects.filter(
+            moeda_id=moeda_id,
+            data__range=[inicio, fim]
+        ).order_by('data').values_list('data', 'abertura', 'fechamento', 'alta', 'baixa', 'volume'))
+
+        filtro = models.Q()
+        novos = []
+        for periodicidade, inicios in afetados.items():
+            filtro |= models.Q(periodicidade=periodicidade, inicio__in=inicios)
+            periodos = agregar_por_periodo(cotacoes, periodicidade)
+            novos.extend(
+                cls(moeda_id=moeda_id, periodicidade=periodicidade, inicio=inicio_periodo, **periodos[inicio_periodo])
+                for inicio_periodo in inicios if inicio_periodo in periodos
+            )
+
+        with transaction.atomic():
+            cls.objects.filter(models.Q(moeda_id=moeda_id) & filtro).delete()
+            cls.objects.bulk_create(novos)
+
+    @classmethod
+    def reconstruir(cls, moeda_ids=None):
+        """
+        Recalcula todos os candles agregados a partir do histórico, para todas as moedas ou
+        apenas para as informadas. Retorna a quantidade de candles gravados.
+        """
+        cotacoes = HistoricoCotacao.objects.filter(data__isnull=False).order_by('moeda_id', 'data')
+        existentes = cls.objects.all()
+        if moeda_ids is not None:
+            cotacoes = cotacoes.filter(moeda_id__in=moeda_ids)
+            existentes = existentes.filter(moeda_id__in=moeda_ids)
+
+        total = 0
+        with transaction.atomic():
+            existentes.delete()
+            linhas = cotacoes.values_list('moeda_id', 'data', 'abertura', 'fechamento', 'alta', 'baixa', 'volume')
+            for moeda_id, cotacoes_moeda in groupby(linhas.iterator(), key=lambda linha: linha[0]):
+                cotacoes_moeda = [linha[1:] for linha in cotacoes_moeda]
+                novos = [
+                    cls(moeda_id=moeda_id, periodicidade=periodicidade, inicio=inicio, **candle)
+                    for periodicidade in PERIODICIDADES
+                    for inicio, candle in agregar_por_periodo(cotacoes_moeda, periodicidade).items()
+                ]
+                cls.objects.bulk_create(novos, batch_size=500)
+                total += len(novos)
+        return total
+
+    @classmethod
+    def serie(cls, moeda_id, periodicidade, data_inicio=None, data_fim=None):
+        """
+        Candles da moeda na periodicidade, em ordem cronológica, como uma lista de
+        (inicio, candle). Com um intervalo de datas, os períodos inteiramente contidos
+        nele vêm da tabela agregada; os das bordas, parcialmente cobertos, são agregados
+        apenas com as cotações dentro do intervalo.
+        """
+        agregados = cls.objects.filter(moeda_id=moeda_id, periodicidade=periodicidade).order_by('inicio')
+        if data_inicio is None or data_fim is None:
+            return [(agregado.inicio, agregado.candle()) for agregado in agregados]
+
+        primeiro = inicio_periodo_agregado(data_inicio, periodicidade)
+        ultimo = inicio_periodo_agregado(data_fim, periodicidade)
+        # Períodos inteiros: começam no início do intervalo (ou depois) e terminam até o fim dele
+        inicio_inteiros = primeiro if primeiro == data_inicio else fim_periodo_agregado(primeiro, periodicidade) + timedelta(days=1)
+        fim_inteiros = ultimo if fim_periodo_agregado(ultimo, periodicidade) == data_fim else ultimo - timedelta(days=1)
+
+        serie = {
+            agregado.inicio: agregado.candle()
+            for agregado in agregados.filter(inicio__range=[inicio_inteiros, fim_inteiros])
+        }
+        bordas = []
+        if primeiro < data_inicio:
+            bordas.append((data_inicio, min(fim_periodo_agregado(primeiro, periodicidade), data_fim)))
+        if fim_periodo_agregado(ultimo, periodicidade) > data_fim and (ultimo != primeiro or not bordas):
+            bordas.append((max(ultimo, data_inicio), data_fim))
+        for inicio, fim in bordas:
+            cotacoes = HistoricoCotacao.objects.filter(
+                moeda_id=moeda_id,
+                data__range=[inicio, fim]
+            ).order_by('data').values_list('data', 'abertura', 'fechamento', 'alta', 'baixa', 'volume')
+            serie.update(agregar_por_periodo(cotacoes, periodicidade))
+        return sorted(serie.items())
+
+    def candle(self):
+        return {
+            'abertura': self.abertura,
+            'fechamento': self.fechamento,
+            'alta': self.alta,
+            'baixa': self.baixa,
+            'volume': self.volume,
+            'fechamento_medio': self.fechamento_medio,
+            'quantidade': self.quantidade,
+        }
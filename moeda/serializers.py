@@ -13,7 +13,7 @@ class HistoricoCotacaoSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = HistoricoCotacao
-        fields = ['moeda', 'data', 'preco']  # Campos que serão serializados
+        fields = ['moeda', 'data', 'abertura', 'fechamento', 'alta', 'baixa', 'volume']  # Campos que serão serializados
         
         # Se quiser que 'data' seja apenas leitura (por ser auto-gerada), pode adicionar:
         read_only_fields = ['data']
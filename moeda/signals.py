@@ -0,0 +1,94 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from integracao.despacho import despachar_apos_commit
+from moeda.arquivo import invalidar_arquivo, remover_arquivo
+from moeda.models import CotacaoAgregada, HistoricoCotacao, Moeda, UltimaCotacao
+
+EXCLUSAO_UNITARIA = 'unitaria'
+EXCLUSAO_EM_LOTE = 'lote'
+EXCLUSAO_EM_CASCATA = 'cascata'
+
+
+def tipo_exclusao_cotacao(origin):
+    """
+    Classifica a exclusão de uma cotação pela origem informada no post_delete: a própria
+    cotação, um queryset de cotações (exclusão em lote) ou a exclusão da moeda (ou do seu
+    dono), que leva em cascata as cotações e os dados derivados delas.
+    """
+    if origin is None or isinstance(origin, HistoricoCotacao):
+        return EXCLUSAO_UNITARIA
+    if isinstance(origin, QuerySet) and origin.model is HistoricoCotacao:
+        return EXCLUSAO_EM_LOTE
+    return EXCLUSAO_EM_CASCATA
+
+
+def _unir(datas, novas):
+    datas.update(novas)
+    return datas
+
+@receiver(post_save, sender=HistoricoCotacao)
+def atualizar_ultima_cotacao(sender, instance, **kwargs):
+    """
+    Mantém a última cotação da moeda ao gravar um registro do histórico.
+    """
+    if instance.data is not None:
+        UltimaCotacao.registrar(instance.moeda_id, instance.data, instance.fechamento)
+
+@receiver(post_delete, sender=HistoricoCotacao)
+def recalcular_ultima_cotacao(sender, instance, origin=None, **kwargs):
+    """
+    Recalcula a última cotação se o registro removido era o mais recente da moeda. Em uma
+    exclusão em lote, a última cotação é reconstruída uma única vez por moeda, após o commit.
+    """
+    tipo = tipo_exclusao_cotacao(origin)
+    if tipo == EXCLUSAO_EM_LOTE:
+        moeda_id = instance.moeda_id
+        despachar_apos_commit(
+            ('ultima_cotacao', moeda_id), None,
+            lambda _: UltimaCotacao.reconstruir([moeda_id]), combinar=lambda atual, _: atual
+        )
+    elif tipo == EXCLUSAO_UNITARIA:
+        if UltimaCotacao.objects.filter(moeda_id=instance.moeda_id, data=instance.data).exists():
+            UltimaCotacao.reconstruir([instance.moeda_id])
+
+@receiver(post_save, sender=HistoricoCotacao)
+def atualizar_cotacoes_agregadas(sender, instance, **kwargs):
+    """
+    Recalcula os candles semanal, quinzenal e mensal que contêm a cotação gravada.
+    """
+    if instance.data is not None:
+        CotacaoAgregada.atualizar(instance.moeda_id, [instance.data])
+
+@receiver(post_delete, sender=HistoricoCotacao)
+def atualizar_cotacoes_agregadas_apos_exclusao(sender, instance, origin=None, **kwargs):
+    """
+    Recalcula os candles que continham a cotação removida. Em uma exclusão em lote, as datas
+    são reunidas e os candles de cada moeda recalculados de uma vez, após o commit; na exclusão
+    da moeda, os candles saem em cascata com ela.
+    """
+    if instance.data is None:
+        return
+    tipo = tipo_exclusao_cotacao(origin)
+    if tipo == EXCLUSAO_EM_LOTE:
+        moeda_id = instance.moeda_id
+        despachar_apos_commit(
+            ('cotacoes_agregadas', moeda_id), {instance.data},
+            lambda datas: CotacaoAgregada.atualizar(moeda_id, datas), combinar=_unir
+        )
+    elif tipo == EXCLUSAO_UNITARIA:
+        CotacaoAgregada.atualizar(instance.moeda_id, [instance.data])
+
+@receiver(post_save, sender=HistoricoCotacao)
+@receiver(post_delete, sender=HistoricoCotacao)
+def invalidar_arquivo_cotacoes(sender, instance, origin=None, **kwargs):
+    """
+    Descarta o arquivo colunar da moeda quando uma cotação do período arquivado muda.
+    """
+    if instance.data is not None and tipo_exclusao_cotacao(origin) != EXCLUSAO_EM_CASCATA:
+        invalidar_arquivo(instance.moeda_id, instance.data)
+
+@receiver(post_delete, sender=Moeda)
+def remover_arquivo_moeda(sender, instance, **kwargs):
+    # O arquivo colunar não é um registro do banco: sai junto com a moeda
+    remover_arquivo(instance.id)
@@ -0,0 +1,106 @@
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+import numpy as np
+from integracao.historico_service import salvar_cotacoes_em_lote
+from moeda.arquivo import arquivar_moeda, ler_arquivo
+from moeda.models import HistoricoCotacao, Moeda
+from patrimonio.valorizacao import carregar_matriz_precos
+from usuario.models import Usuario
+
+
+class ArquivoCotacoesTests(TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio, ignore_errors=True)
+        configuracao = override_settings(MOEDA_ARQUIVO_DIR=self.diretorio)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.usuario = Usuario.objects.create_user(username='testuser', password='testpass')
+        self.moeda = Moeda.objects.create(nome='Bitcoin', token='BTC', usuario=self.usuario)
+        for data, fechamento in [(date(2022, 1, 1), '40000.5'), (date(2022, 1, 3), '41000.1234567891'),
+                                 (date(2022, 1, 5), '42000'), (date(2022, 1, 8), '43000.25')]:
+            HistoricoCotacao.objects.create(moeda=self.moeda, data=data, abertura=1, fechamento=Decimal(fechamento),
+                                            alta=1, baixa=1, volume=10)
+
+    def test_arquivar_e_ler_mapeado_em_memoria(self):
+        self.assertEqual(arquivar_moeda(self.moeda.id, date(2022, 1, 5)), 3)
+
+        arquivo = ler_arquivo(self.moeda.id)
+        self.assertEqual(arquivo.ate, date(2022, 1, 5))
+        self.assertIsInstance(arquivo.colunas['fechamento'], np.memmap)
+        datas, colunas = arquivo.fatia(date(2022, 1, 2), date(2022, 1, 10))
+        self.assertEqual([str(data) for data in datas], ['2022-01-03', '2022-01-05'])
+        self.assertTrue(np.array_equal(arquivo.valores_float('fechamento', colunas['fechamento']), [41000.1234567891, 42000]))
+        self.assertEqual(arquivo.valores_decimal('fechamento', colunas['fechamento']), [Decimal('41000.1234567891'), Decimal('42000')])
+        # Fatia sem cópia dos dados mapeados
+        self.assertTrue(np.shares_memory(colunas['fechamento'], arquivo.colunas['fechamento']))
+
+    def test_moeda_sem_arquivo(self):
+        self.assertIsNone(ler_arquivo(self.moeda.id))
+
+    def test_matriz_de_precos_le_o_trecho_arquivado(self):
+        esperado = carregar_matriz_precos([self.moeda.id], date(2022, 1, 2), date(2022, 1, 8))
+        arquivar_moeda(self.moeda.id, date(2022, 1, 5))
+
+        # Cotações arquivadas não são mais lidas do banco
+        HistoricoCotacao.objects.filter(data__gt=date(2022, 1, 1), data__lte=date(2022, 1, 5)).update(fechamento=0)
+        matriz = carregar_matriz_precos([self.moeda.id], date(2022, 1, 2), date(2022, 1, 8))
+
+        self.assertTrue(np.array_equal(matriz.precos, esperado.precos))
+        self.assertEqual(matriz.cotacoes, esperado.cotacoes)
+
+    def test_decimais_exatos_no_trecho_arquivado(self):
+        arquivar_moeda(self.moeda.id, date(2022, 1, 5))
+
+        matriz = carregar_matriz_precos([self.moeda.id], date(2022, 1, 1), date(2022, 1, 8))
+
+        # Os mesmos Decimal do banco, com ou sem arquivo
+        self.assertEqual(matriz.cotacoes[self.moeda.id][1], list(
+            HistoricoCotacao.objects.filter(moeda=self.moeda).order_by('data').values_list('fechamento', flat=True)
+        ))
+
+    def test_cotacao_gravada_no_periodo_arquivado_descarta_o_arquivo(self):
+        arquivar_moeda(self.moeda.id, date(2022, 1, 5))
+
+        # Cotação posterior ao arquivo: ele continua válido
+        HistoricoCotacao.objects.create(moeda=self.moeda, data=date(2022, 1, 9), abertura=1, fechamento=44000, alta=1, baixa=1, volume=1)
+        self.assertIsNotNone(ler_arquivo(self.moeda.id))
+
+        # Correção de preço dentro do período arquivado
+        cotacao = HistoricoCotacao.objects.get(moeda=self.moeda, data=date(2022, 1, 3))
+        cotacao.fechamento = Decimal('39999.5')
+        cotacao.save()
+
+        self.assertIsNone(ler_arquivo(self.moeda.id))
+        matriz = carregar_matriz_precos([self.moeda.id], date(2022, 1, 3), date(2022, 1, 3))
+        self.assertEqual(matriz.precos[0, 0], 39999.5)
+        self.assertEqual(matriz.cotacoes[self.moeda.id][1][-1], Decimal('39999.5'))
+
+    def test_remocao_e_gravacao_em_lote_no_periodo_arquivado(self):
+        arquivar_moeda(self.moeda.id, date(2022, 1, 5))
+        HistoricoCotacao.objects.get(moeda=self.moeda, data=date(2022, 1, 5)).delete()
+        self.assertIsNone(ler_arquivo(self.moeda.id))
+
+        # Backfill de uma lacuna antiga (gravação em lote, sem sinais)
+        arquivar_moeda(self.moeda.id, date(2022, 1, 5))
+        salvar_cotacoes_em_lote(self.moeda, [
+            {'data': '2022-01-02', 'abertura': 1, 'fechamento': '40500', 'alta': 1, 'baixa': 1, 'volume': 1},
+        ])
+
+        self.assertIsNone(ler_arquivo(self.moeda.id))
+        matriz = carregar_matriz_precos([self.moeda.id], date(2022, 1, 2), date(2022, 1, 2))
+        self.assertEqual(matriz.precos[0, 0], 40500)
+
+    def test_comando(self):
+        saida = StringIO()
+        call_command('arquivar_cotacoes', stdout=saida)
+
+        self.assertIn('4 cotação(ões) arquivada(s)', saida.getvalue())
+        self.assertIsNotNone(ler_arquivo(self.moeda.id))
@@ -0,0 +1,27 @@
+from decimal import Decimal
+from django.test import SimpleTestCase
+import numpy as np
+from moeda.compactacao import escala_coluna, escalar_coluna, inteiros_para_decimal, inteiros_para_float
+
+
+class CompactacaoTests(SimpleTestCase):
+
+    def test_escala_respeita_o_limite_de_64_bits(self):
+        self.assertEqual(escala_coluna([Decimal('42000.5')]), 10)
+        self.assertEqual(escala_coluna([Decimal('1234567890.5')]), 8)
+        self.assertEqual(escala_coluna([]), 10)
+
+    def test_escalar_sem_perdas(self):
+        valores = [Decimal('42000.1234567891'), Decimal('43150.25'), Decimal('0')]
+
+        escala, inteiros = escalar_coluna(valores)
+
+        self.assertEqual(escala, 10)
+        self.assertEqual(inteiros.dtype, np.int64)
+        self.assertEqual(inteiros_para_decimal(inteiros, escala), valores)
+        self.assertTrue(np.allclose(inteiros_para_float(inteiros, escala), [42000.1234567891, 43150.25, 0]))
+
+    def test_valor_que_nao_cabe_em_64_bits(self):
+        # 10 dígitos inteiros deixam só 8 casas decimais
+        self.assertIsNone(escalar_coluna([Decimal('1234567890.1234567891')]))
+        self.assertEqual(escalar_coluna([Decimal('1234567890.5')])[0], 8)
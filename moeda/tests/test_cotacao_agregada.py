@@ -0,0 +1,103 @@
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase
+from moeda.agregacao import fim_periodo_agregado, inicio_periodo_agregado
+from moeda.models import CotacaoAgregada, HistoricoCotacao, Moeda, UltimaCotacao
+from usuario.models import Usuario
+
+
+class CotacaoAgregadaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='testpass')
+        self.moeda = Moeda.objects.create(nome='Bitcoin', token='BTC', usuario=self.usuario)
+
+    def criar_cotacao(self, data, fechamento, volume=10):
+        return HistoricoCotacao.objects.create(
+            moeda=self.moeda, data=data, abertura=Decimal(fechamento) - 1, fechamento=Decimal(fechamento),
+            alta=Decimal(fechamento) + 5, baixa=Decimal(fechamento) - 5, volume=volume
+        )
+
+    def test_periodos(self):
+        self.assertEqual(inicio_periodo_agregado(date(2024, 1, 31), 'semanal'), date(2024, 1, 29))
+        self.assertEqual(inicio_periodo_agregado(date(2024, 1, 31), 'quinzenal'), date(2024, 1, 16))
+        self.assertEqual(inicio_periodo_agregado(date(2024, 1, 15), 'quinzenal'), date(2024, 1, 1))
+        self.assertEqual(fim_periodo_agregado(date(2024, 2, 16), 'quinzenal'), date(2024, 2, 29))
+        self.assertEqual(fim_periodo_agregado(date(2024, 2, 1), 'mensal'), date(2024, 2, 29))
+
+    def test_candle_mantido_ao_gravar_cotacoes(self):
+        self.criar_cotacao(date(2024, 1, 2), '100', volume=10)
+        self.criar_cotacao(date(2024, 1, 20), '130', volume=5)
+        self.criar_cotacao(date(2024, 1, 10), '110', volume=1)
+
+        mensal = CotacaoAgregada.objects.get(moeda=self.moeda, periodicidade='mensal', inicio=date(2024, 1, 1))
+        self.assertEqual(mensal.abertura, Decimal('99'))
+        self.assertEqual(mensal.fechamento, Decimal('130'))
+        self.assertEqual(mensal.alta, Decimal('135'))
+        self.assertEqual(mensal.baixa, Decimal('95'))
+        self.assertEqual(mensal.volume, Decimal('16'))
+        self.assertEqual(mensal.fechamento_medio, Decimal('113.3333333333'))
+        self.assertEqual(mensal.quantidade, 3)
+        self.assertEqual(CotacaoAgregada.objects.filter(periodicidade='quinzenal').count(), 2)
+        self.assertEqual(CotacaoAgregada.objects.filter(periodicidade='semanal').count(), 3)
+
+    def test_remocao_de_cotacao(self):
+        self.criar_cotacao(date(2024, 1, 2), '100')
+        cotacao = self.criar_cotacao(date(2024, 1, 20), '130')
+
+        cotacao.delete()
+
+        mensal = CotacaoAgregada.objects.get(periodicidade='mensal')
+        self.assertEqual(mensal.fechamento, Decimal('100'))
+        self.assertFalse(CotacaoAgregada.objects.filter(periodicidade='quinzenal', inicio=date(2024, 1, 16)).exists())
+
+    def test_remocao_em_lote_atualiza_candles_uma_vez_por_moeda(self):
+        for dia in range(1, 21):
+            self.criar_cotacao(date(2024, 1, dia), str(100 + dia))
+
+        with patch.object(CotacaoAgregada, 'atualizar', wraps=CotacaoAgregada.atualizar) as atualizar:
+            with self.captureOnCommitCallbacks(execute=True):
+                HistoricoCotacao.objects.filter(moeda=self.moeda, data__gte=date(2024, 1, 11)).delete()
+
+        atualizar.assert_called_once()
+        self.assertEqual(atualizar.call_args.args[1], {date(2024, 1, dia) for dia in range(11, 21)})
+        mensal = CotacaoAgregada.objects.get(periodicidade='mensal')
+        self.assertEqual(mensal.fechamento, Decimal('110'))
+        self.assertEqual(mensal.quantidade, 10)
+        self.assertFalse(CotacaoAgregada.objects.filter(periodicidade='quinzenal', inicio=date(2024, 1, 16)).exists())
+
+    def test_remocao_da_moeda_nao_recalcula_candles(self):
+        for dia in range(1, 21):
+            self.criar_cotacao(date(2024, 1, dia), str(100 + dia))
+
+        with patch.object(CotacaoAgregada, 'atualizar') as atualizar, \
+                patch.object(UltimaCotacao, 'reconstruir') as reconstruir:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.moeda.delete()
+
+        atualizar.assert_not_called()
+        reconstruir.assert_not_called()
+        self.assertFalse(CotacaoAgregada.objects.exists())
+
+    def test_serie_com_bordas_calculadas_do_historico(self):
+        for data, fechamento in [(date(2024, 1, 5), '100'), (date(2024, 1, 25), '200'),
+                                 (date(2024, 2, 10), '300'), (date(2024, 3, 3), '400'), (date(2024, 3, 20), '500')]:
+            self.criar_cotacao(data, fechamento)
+
+        serie = CotacaoAgregada.serie(self.moeda.id, 'mensal', date(2024, 1, 20), date(2024, 3, 10))
+
+        self.assertEqual([inicio for inicio, _ in serie], [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)])
+        # Bordas consideram apenas as cotações dentro do intervalo
+        self.assertEqual(serie[0][1]['fechamento_medio'], Decimal('200'))
+        self.assertEqual(serie[1][1]['fechamento_medio'], Decimal('300'))
+        self.assertEqual(serie[2][1]['fechamento_medio'], Decimal('400'))
+
+    def test_comando_reconstruir(self):
+        self.criar_cotacao(date(2024, 1, 2), '100')
+        CotacaoAgregada.objects.all().delete()
+
+        call_command('reconstruir_cotacoes_agregadas', verbosity=0, stdout=open('/dev/null', 'w'))
+
+        self.assertEqual(CotacaoAgregada.objects.filter(moeda=self.moeda).count(), 3)
@@ -0,0 +1,70 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from moeda.models import HistoricoCotacao, Moeda
+from moeda.serializers import HistoricoCotacaoSerializer
+from usuario.models import Usuario
+
+
+class ExportacaoCotacoesTests(APITestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='testpass')
+        self.client.force_authenticate(user=self.usuario)
+        self.moeda = Moeda.objects.create(nome='Bitcoin', token='BTC', usuario=self.usuario)
+        HistoricoCotacao.objects.bulk_create(
+            HistoricoCotacao(moeda=self.moeda, data=date(2024, 1, 1) + timedelta(days=dia), abertura=dia,
+                             fechamento=Decimal('40000.5') + dia, alta=dia, baixa=dia, volume=dia)
+            for dia in range(5)
+        )
+        self.url = reverse('moeda-exportar-cotacoes', args=[self.moeda.id])
+
+    def conteudo(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_exportar_csv(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        linhas = self.conteudo(response).splitlines()
+        self.assertEqual(linhas[0], 'data,abertura,fechamento,alta,baixa,volume')
+        self.assertEqual(len(linhas), 6)
+        self.assertTrue(linhas[1].startswith('2024-01-01,0.0000000000,40000.5000000000,'))
+
+    def test_exportar_ndjson_com_periodo(self):
+        response = self.client.get(self.url, {'formato': 'ndjson', 'data_inicio': '2024-01-02', 'data_fim': '2024-01-03'})
+
+        registros = [json.loads(linha) for linha in self.conteudo(response).splitlines()]
+        self.assertEqual([registro['data'] for registro in registros], ['2024-01-02', '2024-01-03'])
+        self.assertEqual(Decimal(registros[0]['fechamento']), Decimal('40001.5'))
+
+    def test_leitura_em_blocos(self):
+        with patch('moeda.views.TAMANHO_BLOCO_EXPORTACAO', 2):
+            response = self.client.get(self.url, {'formato': 'ndjson'})
+            with self.assertNumQueries(3):
+                linhas = self.conteudo(response).splitlines()
+
+        self.assertEqual(len(linhas), 5)
+
+    def test_formato_invalido(self):
+        response = self.client.get(self.url, {'formato': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_moeda_de_outro_usuario(self):
+        outro = Usuario.objects.create_user(username='outro', password='testpass')
+        self.client.force_authenticate(user=outro)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_serializer_de_historico(self):
+        cotacao = HistoricoCotacao.objects.filter(moeda=self.moeda).first()
+        dados = HistoricoCotacaoSerializer(cotacao).data
+
+        self.assertEqual(set(dados), {'moeda', 'data', 'abertura', 'fechamento', 'alta', 'baixa', 'volume'})
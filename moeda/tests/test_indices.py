@@ -0,0 +1,57 @@
+import re
+from datetime import date
+from unittest import skipUnless
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from django.test import TestCase
+from moeda.models import HistoricoCotacao, Moeda
+
+
+@skipUnless(connection.vendor in ('sqlite', 'mysql'), 'Verificação do plano implementada para SQLite e MySQL')
+class IndicesHistoricoCotacaoTests(TestCase):
+    """
+    Verifica, pelo EXPLAIN, que as consultas das telas ao histórico de cotações usam
+    busca por índice (range/ref) em vez de varrer a tabela.
+    """
+
+    def assertUsaIndice(self, queryset):
+        plano = queryset.explain()
+        if connection.vendor == 'sqlite':
+            # Cada acesso ao histórico deve ser uma busca (SEARCH) por índice, nunca um SCAN da tabela
+            acessos = [linha for linha in plano.splitlines() if 'moeda_historicocotacao' in linha or ' U0 ' in linha]
+            self.assertTrue(acessos, plano)
+            for linha in acessos:
+                self.assertRegex(linha, r'SEARCH .* USING (COVERING )?INDEX', plano)
+        else:
+            # No MySQL, o tipo de acesso ao histórico deve usar um índice (e não ALL/index)
+            for linha in plano.splitlines():
+                if 'historicocotacao' in linha:
+                    self.assertTrue(re.search(r'\b(range|ref|eq_ref|const)\b', linha), plano)
+        return plano
+
+    def test_serie_de_fechamentos_por_periodo(self):
+        # patrimonio.evolucao.carregar_series / patrimonio.valorizacao.carregar_matriz_precos
+        self.assertUsaIndice(HistoricoCotacao.objects.filter(
+            moeda_id__in=[1, 2], data__gte=date(2024, 1, 1)
+        ).order_by('moeda_id', 'data').values_list('moeda_id', 'data', 'fechamento'))
+
+        plano = self.assertUsaIndice(HistoricoCotacao.objects.filter(
+            moeda_id=1, data__range=[date(2024, 1, 1), date(2024, 3, 31)]
+        ).order_by('data').values_list('data', 'fechamento'))
+        if connection.vendor == 'sqlite':
+            # O índice composto cobre a leitura dos fechamentos sem acessar a tabela
+            self.assertIn('COVERING INDEX historico_moeda_data_fech_idx', plano)
+
+    def test_ultima_cotacao_por_moeda(self):
+        # moeda.models.UltimaCotacao.reconstruir e o fechamento anterior da matriz de preços
+        recente = HistoricoCotacao.objects.filter(moeda=OuterRef('pk')).order_by('-data')
+        self.assertUsaIndice(Moeda.objects.annotate(
+            ultima_data=Subquery(recente.values('data')[:1]),
+            ultimo_fechamento=Subquery(recente.values('fechamento')[:1])
+        ).values_list('pk', 'ultima_data', 'ultimo_fechamento'))
+
+    def test_contagem_de_existentes_na_gravacao_em_lote(self):
+        # integracao.historico_service.salvar_cotacoes_em_lote
+        self.assertUsaIndice(HistoricoCotacao.objects.filter(
+            moeda_id=1, data__in=[date(2024, 1, 1), date(2024, 1, 2)]
+        ).values('pk'))
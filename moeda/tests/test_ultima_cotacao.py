@@ -0,0 +1,70 @@
+from decimal import Decimal
+from datetime import date
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from usuario.models import Usuario
+from moeda.models import Moeda, HistoricoCotacao, UltimaCotacao
+from integracao.historico_service import salvar_cotacao, salvar_cotacoes_em_lote
+
+
+class UltimaCotacaoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='testpass')
+        self.moeda = Moeda.objects.create(nome='Bitcoin', token='BTC', usuario=self.usuario)
+
+    def _criar_cotacao(self, data, fechamento):
+        return HistoricoCotacao.objects.create(
+            moeda=self.moeda, data=data, abertura=fechamento, fechamento=fechamento, alta=fechamento, baixa=fechamento, volume=1
+        )
+
+    def test_mantida_ao_gravar_historico(self):
+        self._criar_cotacao(date(2024, 1, 5), Decimal('35000'))
+        self._criar_cotacao(date(2024, 1, 10), Decimal('36000'))
+        # Uma cotação mais antiga não substitui a última
+        self._criar_cotacao(date(2024, 1, 1), Decimal('34000'))
+
+        ultima = UltimaCotacao.objects.get(moeda=self.moeda)
+        self.assertEqual(ultima.data, date(2024, 1, 10))
+        self.assertEqual(ultima.fechamento, Decimal('36000'))
+
+    def test_atualizada_pelo_salvar_cotacao(self):
+        salvar_cotacao(self.moeda, date(2024, 1, 10), 1, 36000, 1, 1, 1)
+        salvar_cotacao(self.moeda, date(2024, 1, 10), 1, 36500, 1, 1, 1)
+
+        self.assertEqual(self.moeda.ultima_cotacao.fechamento, Decimal('36500'))
+
+    def test_atualizada_pela_gravacao_em_lote(self):
+        self._criar_cotacao(date(2024, 1, 5), Decimal('35000'))
+        cotacoes = [
+            {'abertura': 1, 'fechamento': 37000 + dia, 'alta': 1, 'baixa': 1, 'volume': 1, 'data': date(2024, 2, dia)}
+            for dia in range(1, 11)
+        ]
+
+        salvar_cotacoes_em_lote(self.moeda, cotacoes, tamanho_lote=3)
+
+        ultima = UltimaCotacao.objects.get(moeda=self.moeda)
+        self.assertEqual(ultima.data, date(2024, 2, 10))
+        self.assertEqual(ultima.fechamento, Decimal('37010'))
+
+    def test_recalculada_ao_remover_a_mais_recente(self):
+        self._criar_cotacao(date(2024, 1, 5), Decimal('35000'))
+        recente = self._criar_cotacao(date(2024, 1, 10), Decimal('36000'))
+
+        recente.delete()
+
+        self.assertEqual(UltimaCotacao.objects.get(moeda=self.moeda).data, date(2024, 1, 5))
+
+    def test_comando_reconstruir(self):
+        self._criar_cotacao(date(2024, 1, 5), Decimal('35000'))
+        self._criar_cotacao(date(2024, 1, 10), Decimal('36000'))
+        UltimaCotacao.objects.all().delete()
+
+        saida = StringIO()
+        call_command('reconstruir_ultima_cotacao', stdout=saida)
+
+        self.assertIn('1 moeda(s)', saida.getvalue())
+        ultima = UltimaCotacao.objects.get(moeda=self.moeda)
+        self.assertEqual(ultima.data, date(2024, 1, 10))
+        self.assertEqual(ultima.fechamento, Decimal('36000'))
@@ -6,6 +6,10 @@ from rest_framework.permissions import IsAuthenticated  # Certifique-se de que a
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from collections import defaultdict
+from datetime import date, datetime
+from django.http import StreamingHttpResponse
+import csv
+import json
 
 class MoedaViewSet(viewsets.ModelViewSet):
     queryset = Moeda.objects.all()
@@ -22,7 +26,82 @@ class MoedaViewSet(viewsets.ModelViewSet):
         #print('Moeda Serializer: '+str(serializer))
         serializer.save(usuario=self.request.user)
 
+    @action(detail=True, methods=['get'], url_path='exportar-cotacoes')
+    def exportar_cotacoes(self, request, pk=None):
+        """
+        Exporta as cotações diárias da moeda em CSV (padrão) ou NDJSON (?formato=ndjson),
+        opcionalmente entre data_inicio e data_fim. A resposta é gerada em streaming, lendo
+        o histórico em blocos, com memória constante independentemente do tamanho.
+        """
+        moeda = self.get_object()
 
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS_EXPORTACAO:
+            return Response({"error": "Formato inválido. Use 'csv' ou 'ndjson'."}, status=400)
 
+        cotacoes = HistoricoCotacao.objects.filter(moeda=moeda, data__isnull=False)
+        try:
+            if request.query_params.get('data_inicio'):
+                cotacoes = cotacoes.filter(data__gte=datetime.strptime(request.query_params['data_inicio'], '%Y-%m-%d').date())
+            if request.query_params.get('data_fim'):
+                cotacoes = cotacoes.filter(data__lte=datetime.strptime(request.query_params['data_fim'], '%Y-%m-%d').date())
+        except ValueError:
+            return Response({"error": "Formato de data inválido. Use AAAA-MM-DD."}, status=400)
 
+        content_type, gerar_linhas = FORMATOS_EXPORTACAO[formato]
+        response = StreamingHttpResponse(gerar_linhas(_ler_em_blocos(cotacoes)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{moeda.token}_cotacoes.{formato}"'
+        return response
 
+
+CAMPOS_EXPORTACAO = ['data', 'abertura', 'fechamento', 'alta', 'baixa', 'volume']
+TAMANHO_BLOCO_EXPORTACAO = 2000
+
+
+def _ler_em_blocos(cotacoes, tamanho=None):
+    """
+    Percorre as cotações em ordem de data, um bloco por consulta (paginação pela data, usando
+    o índice único de moeda e data). Ao contrário de um único cursor, não depende de o
+    driver do banco suportar cursores no servidor para manter a memória constante.
+    """
+    tamanho = tamanho or TAMANHO_BLOCO_EXPORTACAO
+    ultima_data = None
+    while True:
+        bloco = cotacoes if ultima_data is None else cotacoes.filter(data__gt=ultima_data)
+        linhas = list(bloco.order_by('data').values_list(*CAMPOS_EXPORTACAO)[:tamanho])
+        yield from linhas
+        if len(linhas) < tamanho:
+            return
+        ultima_data = linhas[-1][0]
+
+
+class _Eco:
+    # Buffer mínimo para o csv.writer: devolve a linha formatada em vez de guardá-la
+    def write(self, valor):
+        return valor
+
+
+def _formatar(valor):
+    # Datas em ISO 8601 e decimais em notação fixa (sem expoente, como em 0E-10)
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return format(valor, 'f')
+
+
+def _linhas_csv(cotacoes):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(CAMPOS_EXPORTACAO)
+    for cotacao in cotacoes:
+        yield escritor.writerow([_formatar(valor) for valor in cotacao])
+
+
+def _linhas_ndjson(cotacoes):
+    for cotacao in cotacoes:
+        # Valores decimais como texto, para não perder precisão no JSON
+        yield json.dumps({campo: _formatar(valor) for campo, valor in zip(CAMPOS_EXPORTACAO, cotacao)}) + '\n'
+
+
+FORMATOS_EXPORTACAO = {
+    'csv': ('text/csv', _linhas_csv),
+    'ndjson': ('application/x-ndjson', _linhas_ndjson),
+}
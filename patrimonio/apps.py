@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PatrimonioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patrimonio'
+
+    def ready(self):
+        import patrimonio.signals
@@ -0,0 +1,159 @@
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from integracao.despacho import despachar_apos_commit, valor_despacho_pendente
+
+CHAVE_ACERTOS = 'patrimonio:cache:acertos'
+CHAVE_FALHAS = 'patrimonio:cache:falhas'
+
+
+def _chave_versao(usuario_id):
+    return f'patrimonio:versao:{usuario_id}'
+
+
+def versao_dados(usuario_id):
+    """
+    Versão atual dos dados do usuário (ativos e cotações das suas moedas). Começa com um
+    valor baseado no relógio, para que uma versão perdida no cache não coincida com uma
+    já usada antes.
+    """
+    chave = _chave_versao(usuario_id)
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, time.time_ns(), timeout=None)
+        versao = cache.get(chave)
+    return versao
+
+
+def _nova_versao(usuario_ids):
+    cache.set_many({_chave_versao(usuario_id): time.time_ns() for usuario_id in usuario_ids}, timeout=None)
+
+
+def invalidar_cache_usuarios(usuario_ids):
+    """
+    Troca a versão dos dados dos usuários, invalidando as respostas em cache. A troca é
+    repetida após o commit, para descartar respostas calculadas com os dados anteriores
+    enquanto a transação ainda estava aberta.
+    """
+    usuario_ids = set(usuario_ids)
+    if not usuario_ids:
+        return
+    _nova_versao(usuario_ids)
+    transaction.on_commit(lambda: _nova_versao(usuario_ids))
+
+
+def invalidar_cache_moeda(moeda_id):
+    """
+    Invalida as respostas em cache de todos os usuários afetados pelas cotações da moeda:
+    o dono da moeda e quem possui ativos dela. Dentro de uma transação, os usuários são
+    consultados e a troca pós-commit agendada apenas na primeira chamada para a moeda.
+    """
+    from django.db.models import Q
+    from usuario.models import Usuario
+
+    chave = ('cache_moeda', moeda_id)
+    usuario_ids = valor_despacho_pendente(chave)
+    if usuario_ids is None:
+        usuario_ids = set(Usuario.objects.filter(
+            Q(ativo__moeda_id=moeda_id) | Q(moeda__pk=moeda_id)
+        ).values_list('id', flat=True).distinct())
+        despachar_apos_commit(chave, usuario_ids, _nova_versao, combinar=lambda atual, _: atual)
+    if usuario_ids:
+        _nova_versao(usuario_ids)
+
+
+def _contar(chave):
+    cache.add(chave, 0, timeout=None)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        # A chave expirou entre o add e o incr
+        cache.set(chave, 1, timeout=None)
+
+
+def estatisticas_cache():
+    """
+    Acertos e falhas acumulados do cache de respostas, para acompanhar sua efetividade.
+    """
+    valores = cache.get_many([CHAVE_ACERTOS, CHAVE_FALHAS])
+    acertos = valores.get(CHAVE_ACERTOS, 0)
+    falhas = valores.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    return {
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': acertos / total if total else 0.0,
+    }
+
+
+def chave_resposta(usuario_id, endpoint, parametros, versao):
+    consulta = '&'.join(f'{nome}={valor}' for nome, valor in sorted(parametros.items()))
+    resumo = hashlib.sha1(consulta.encode()).hexdigest()
+    return f'patrimonio:resposta:{usuario_id}:{endpoint}:{versao}:{resumo}'
+
+
+def _parametros(request, kwargs):
+    parametros = dict(request.query_params.lists())
+    parametros.update({f'_{nome}': valor for nome, valor in kwargs.items()})
+    return parametros
+
+
+def cache_resposta(endpoint):
+    """
+    Decorador para as actions dos viewsets de patrimônio: guarda os dados das respostas
+    200 por (usuário, endpoint, parâmetros da requisição, versão dos dados).
+    """
+    def decorador(metodo):
+        @wraps(metodo)
+        def wrapper(viewset, request, *args, **kwargs):
+            usuario_id = request.user.id
+            chave = chave_resposta(usuario_id, endpoint, _parametros(request, kwargs), versao_dados(usuario_id))
+
+            dados = cache.get(chave)
+            if dados is not None:
+                _contar(CHAVE_ACERTOS)
+                return Response(dados)
+
+            _contar(CHAVE_FALHAS)
+            response = metodo(viewset, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(chave, response.data, timeout=getattr(settings, 'PATRIMONIO_CACHE_TIMEOUT', 3600))
+            return response
+        return wrapper
+    return decorador
+
+
+def etag_resposta(endpoint):
+    """
+    Decorador que identifica a resposta por um ETag derivado da versão dos dados do usuário
+    e dos parâmetros da requisição. Se o cliente já tem essa versão (If-None-Match), responde
+    304 sem executar a action; caso contrário, inclui o ETag na resposta 200.
+    """
+    def decorador(metodo):
+        @wraps(metodo)
+        def wrapper(viewset, request, *args, **kwargs):
+            usuario_id = request.user.id
+            chave = chave_resposta(usuario_id, endpoint, _parametros(request, kwargs), versao_dados(usuario_id))
+            etag = quote_etag(hashlib.sha1(chave.encode()).hexdigest())
+
+            etags_cliente = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in etags_cliente or '*' in etags_cliente:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = metodo(viewset, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+
+            response['ETag'] = etag
+            # O navegador pode guardar a resposta, mas deve revalidá-la a cada uso
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorador
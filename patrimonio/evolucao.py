@@ -0,0 +1,113 @@
+from bisect import bisect_left
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+from moeda.models import HistoricoCotacao
+
+AGRUPAMENTOS = ('mensal', 'anual')
+
+
+def chave_periodo(data, agrupamento):
+    if agrupamento == 'mensal':
+        return data.replace(day=1)
+    return data.year
+
+
+def rotulo_periodo(chave, agrupamento):
+    if agrupamento == 'mensal':
+        return chave.strftime('%B %Y')
+    return str(chave)
+
+
+def carregar_series(moeda_ids, data_inicio):
+    """
+    Carrega, em uma única consulta, as séries de fechamento das moedas a partir de data_inicio.
+    Retorna {moeda_id: (datas, fechamentos)} com as datas em ordem crescente.
+    """
+    cotacoes = HistoricoCotacao.objects.filter(
+        moeda_id__in=moeda_ids,
+        data__gte=data_inicio
+    ).order_by('moeda_id', 'data').values_list('moeda_id', 'data', 'fechamento')
+
+    series = {}
+    for moeda_id, linhas in groupby(cotacoes.iterator(), key=lambda linha: linha[0]):
+        datas, fechamentos = [], []
+        for _, data, fechamento in linhas:
+            datas.append(data)
+            fechamentos.append(fechamento)
+        series[moeda_id] = (datas, fechamentos)
+    return series
+
+
+def preco_referencia(datas, fechamentos, data):
+    """
+    Preço de referência de uma compra: o fechamento do dia da compra ou, se não houver,
+    o último fechamento anterior; na falta dele, o primeiro posterior.
+    """
+    if not datas:
+        return None
+    posicao = bisect_left(datas, data)
+    if posicao < len(datas) and datas[posicao] == data:
+        return fechamentos[posicao]
+    if posicao > 0:
+        return fechamentos[posicao - 1]
+    return fechamentos[posicao] if posicao < len(datas) else None
+
+
+def fechamentos_por_periodo(datas, fechamentos, agrupamento):
+    """
+    Último fechamento de cada período, como uma lista de (chave, data, fechamento) em ordem.
+    """
+    periodos = []
+    for data, fechamento in zip(datas, fechamentos):
+        chave = chave_periodo(data, agrupamento)
+        if periodos and periodos[-1][0] == chave:
+            periodos[-1] = (chave, data, fechamento)
+        else:
+            periodos.append((chave, data, fechamento))
+    return periodos
+
+
+def calcular_evolucao(lotes, agrupamento):
+    """
+    Calcula a evolução do patrimônio por período a partir dos lotes (moeda_id, data_compra, quantidade).
+
+    Para cada período e moeda, a evolução é a soma, sobre os lotes comprados até a data da
+    última cotação do período, de (fechamento do período - preço de referência) * quantidade.
+    As séries de preço são carregadas uma única vez; lotes e períodos são percorridos em uma
+    única passagem ordenada por moeda. Retorna {chave_periodo: Decimal} em ordem cronológica.
+    """
+    lotes_por_moeda = defaultdict(list)
+    for moeda_id, data_compra, quantidade in lotes:
+        lotes_por_moeda[moeda_id].append((data_compra, quantidade))
+
+    inicio = min(data_compra for _, data_compra, _ in lotes).replace(day=1)
+    series = carregar_series(list(lotes_por_moeda), inicio)
+
+    soma_periodo = defaultdict(lambda: Decimal('0.00'))
+    for moeda_id, lotes_moeda in lotes_por_moeda.items():
+        datas, fechamentos = series.get(moeda_id, ([], []))
+        if not datas:
+            continue
+
+        # Lotes ordenados por data de compra, já com o preço de referência
+        lotes_moeda = sorted(
+            (data_compra, quantidade, preco_referencia(datas, fechamentos, data_compra))
+            for data_compra, quantidade in lotes_moeda
+        )
+
+        quantidade_total = Decimal('0')
+        custo_total = Decimal('0')
+        proximo_lote = 0
+        for chave, data, fechamento in fechamentos_por_periodo(datas, fechamentos, agrupamento):
+            # Acumula os lotes comprados até a última cotação do período
+            while proximo_lote < len(lotes_moeda) and lotes_moeda[proximo_lote][0] <= data:
+                _, quantidade, referencia = lotes_moeda[proximo_lote]
+                quantidade_total += quantidade
+                custo_total += quantidade * referencia
+                proximo_lote += 1
+
+            if proximo_lote:
+                soma_periodo[chave] += fechamento * quantidade_total - custo_total
+
+    return dict(sorted(soma_periodo.items()))
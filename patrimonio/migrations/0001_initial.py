@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-18 01:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatrimonioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('valor_total', models.DecimalField(decimal_places=10, default=0, max_digits=30)),
+                ('custo_total', models.DecimalField(decimal_places=10, default=0, max_digits=30)),
+                ('composicao', models.JSONField(default=dict)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_patrimonio', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('usuario', 'data')},
+            },
+        ),
+    ]
@@ -1,3 +1,21 @@
 from django.db import models
+from usuario.models import Usuario
 
-# Create your models here.
+
+class PatrimonioSnapshot(models.Model):
+    """
+    Fotografia diária do patrimônio do usuário: valor de mercado, custo de referência
+    dos lotes em carteira e a composição por moeda naquele dia.
+    """
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='snapshots_patrimonio')
+    data = models.DateField()
+    valor_total = models.DecimalField(max_digits=30, decimal_places=10, default=0)
+    custo_total = models.DecimalField(max_digits=30, decimal_places=10, default=0)
+    # {moeda_id: {'quantidade', 'preco', 'valor', 'custo'}}
+    composicao = models.JSONField(default=dict)
+
+    class Meta:
+        unique_together = ('usuario', 'data')  # Um snapshot por usuário por dia
+
+    def __str__(self):
+        return f'{self.usuario.username} - {self.data} - Valor: {self.valor_total}'
@@ -0,0 +1,52 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from ativo.models import Ativo
+from moeda.models import HistoricoCotacao, Moeda
+from moeda.signals import EXCLUSAO_EM_CASCATA, tipo_exclusao_cotacao
+from integracao.historico_service import to_date
+from patrimonio.cache import invalidar_cache_moeda, invalidar_cache_usuarios
+from patrimonio.snapshots import invalidar_snapshots_moeda
+from patrimonio.tasks import agendar_recalculo
+
+
+@receiver(pre_save, sender=Ativo)
+def guardar_data_compra_anterior(sender, instance, **kwargs):
+    # Guarda a data de compra atual para invalidar também o período antigo se ela mudar
+    if instance.pk:
+        instance._data_compra_anterior = Ativo.objects.filter(pk=instance.pk).values_list('data_compra', flat=True).first()
+
+
+@receiver(post_save, sender=Ativo)
+def invalidar_snapshots_apos_salvar_ativo(sender, instance, **kwargs):
+    """
+    Invalida os snapshots do usuário a partir da data de compra do ativo (ou da data
+    anterior, se ela foi alterada para depois) e agenda o recálculo.
+    """
+    datas = [to_date(instance.data_compra)]
+    anterior = getattr(instance, '_data_compra_anterior', None)
+    if anterior is not None:
+        datas.append(anterior)
+    agendar_recalculo(instance.usuario_id, min(datas))
+    invalidar_cache_usuarios([instance.usuario_id])
+
+
+@receiver(post_delete, sender=Ativo)
+def invalidar_snapshots_apos_excluir_ativo(sender, instance, **kwargs):
+    agendar_recalculo(instance.usuario_id, to_date(instance.data_compra))
+    invalidar_cache_usuarios([instance.usuario_id])
+
+
+@receiver(post_save, sender=HistoricoCotacao)
+@receiver(post_delete, sender=HistoricoCotacao)
+def invalidar_cache_apos_cotacao(sender, instance, origin=None, **kwargs):
+    # As respostas e os snapshots que usam as cotações da moeda ficam desatualizados; na exclusão da moeda,
+    # a invalidação é feita uma vez por invalidar_cache_apos_excluir_moeda
+    if tipo_exclusao_cotacao(origin) != EXCLUSAO_EM_CASCATA:
+        invalidar_cache_moeda(instance.moeda_id)
+        invalidar_snapshots_moeda(instance.moeda_id, to_date(instance.data))
+
+
+@receiver(post_delete, sender=Moeda)
+def invalidar_cache_apos_excluir_moeda(sender, instance, **kwargs):
+    # Os ativos da moeda saem em cascata e invalidam seus donos pelo post_delete de Ativo
+    invalidar_cache_usuarios([instance.usuario_id])
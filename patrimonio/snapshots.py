@@ -0,0 +1,218 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Max, Min
+from ativo.models import Ativo
+from integracao.despacho import despachar_apos_commit, valor_despacho_pendente
+from moeda.models import HistoricoCotacao, UltimaCotacao
+from patrimonio.evolucao import carregar_series, chave_periodo
+from patrimonio.models import PatrimonioSnapshot
+from usuario.models import Usuario
+
+
+def _lotes_do_usuario(usuario_id):
+    return list(Ativo.objects.filter(usuario_id=usuario_id).values_list('moeda_id', 'data_compra', 'quantidade'))
+
+
+def _bloquear_usuario(usuario_id):
+    # Serializa os recálculos do usuário: a remoção seguida da regravação, em paralelo,
+    # violaria o unique (usuario, data) dos snapshots
+    list(Usuario.objects.select_for_update().filter(pk=usuario_id).values_list('pk', flat=True))
+
+
+def _avaliar_dias(lotes, series, data_inicio, data_fim, estado_inicial=None):
+    """
+    Avalia a carteira dia a dia com Decimal, pelas mesmas regras de calcular_evolucao: o
+    preço de referência de um lote é o fechamento do dia da compra ou o último anterior (na
+    falta dele, o primeiro posterior), e a moeda entra na avaliação a partir do primeiro dia
+    com um lote comprado e já cotado.
+
+    series vem de carregar_series; as cotações anteriores a data_inicio só definem o preço
+    inicial. estado_inicial ({moeda_id: posicao} de um snapshot) continua uma avaliação
+    anterior: os lotes dessas moedas comprados antes de data_inicio já estão nele.
+    Gera (data, {moeda_id: posicao}) para cada dia, com posicao = {'quantidade', 'custo',
+    'preco', 'cotado'} em texto Decimal exato; 'cotado' indica se houve cotação no dia.
+    """
+    estado_inicial = estado_inicial or {}
+    lotes_por_moeda = defaultdict(list)
+    for moeda_id, data_compra, quantidade in lotes:
+        if moeda_id in estado_inicial and data_compra < data_inicio:
+            continue
+        lotes_por_moeda[moeda_id].append((data_compra, quantidade))
+
+    moedas = {}
+    for moeda_id in sorted(set(lotes_por_moeda) | set(estado_inicial)):
+        estado = estado_inicial.get(moeda_id)
+        moedas[moeda_id] = {
+            'cotacoes': series.get(moeda_id, ([], [])),
+            'proxima_cotacao': 0,
+            'lotes': sorted(lotes_por_moeda[moeda_id]),
+            'proximo_lote': 0,
+            'quantidade': Decimal(estado['quantidade']) if estado else Decimal('0'),
+            'custo': Decimal(estado['custo']) if estado else Decimal('0'),
+            'preco': Decimal(estado['preco']) if estado else None,
+            'em_carteira': estado is not None,
+        }
+
+    data = data_inicio
+    while data <= data_fim:
+        posicoes = {}
+        for moeda_id, moeda in moedas.items():
+            datas, fechamentos = moeda['cotacoes']
+            cotado = False
+            while moeda['proxima_cotacao'] < len(datas) and datas[moeda['proxima_cotacao']] <= data:
+                cotado = datas[moeda['proxima_cotacao']] == data
+                moeda['preco'] = fechamentos[moeda['proxima_cotacao']]
+                moeda['proxima_cotacao'] += 1
+
+            # Sem cotação até a compra, o lote aguarda o primeiro fechamento posterior
+            lotes_moeda = moeda['lotes']
+            while moeda['preco'] is not None and moeda['proximo_lote'] < len(lotes_moeda) and lotes_moeda[moeda['proximo_lote']][0] <= data:
+                quantidade = lotes_moeda[moeda['proximo_lote']][1]
+                moeda['quantidade'] += quantidade
+                moeda['custo'] += quantidade * moeda['preco']
+                moeda['proximo_lote'] += 1
+                moeda['em_carteira'] = True
+
+            if moeda['em_carteira']:
+                posicoes[moeda_id] = {
+                    'quantidade': str(moeda['quantidade']),
+                    'custo': str(moeda['custo']),
+                    'preco': str(moeda['preco']),
+                    'cotado': cotado,
+                }
+        yield data, posicoes
+        data += timedelta(days=1)
+
+
+def _gravar(usuario_id, dias, a_partir_de):
+    snapshots = []
+    for data, posicoes in dias:
+        if data < a_partir_de:
+            continue
+        snapshots.append(PatrimonioSnapshot(
+            usuario_id=usuario_id,
+            data=data,
+            valor_total=sum((Decimal(p['preco']) * Decimal(p['quantidade']) for p in posicoes.values()), Decimal('0')),
+            custo_total=sum((Decimal(p['custo']) for p in posicoes.values()), Decimal('0')),
+            composicao={str(moeda_id): posicao for moeda_id, posicao in posicoes.items()},
+        ))
+    PatrimonioSnapshot.objects.bulk_create(snapshots, batch_size=500)
+    return len(snapshots)
+
+
+def recalcular_snapshots(usuario_id, a_partir_de=None):
+    """
+    Recalcula os snapshots do usuário a partir de uma data (ou todos), avaliando a carteira
+    com Decimal desde a primeira compra. Retorna a quantidade de snapshots gravados.
+    """
+    with transaction.atomic():
+        _bloquear_usuario(usuario_id)
+        existentes = PatrimonioSnapshot.objects.filter(usuario_id=usuario_id)
+        if a_partir_de is not None:
+            existentes = existentes.filter(data__gte=a_partir_de)
+        existentes.delete()
+
+        lotes = _lotes_do_usuario(usuario_id)
+        if not lotes:
+            return 0
+        moeda_ids = sorted({moeda_id for moeda_id, _, _ in lotes})
+        data_inicio = min(data_compra for _, data_compra, _ in lotes)
+        data_fim = HistoricoCotacao.objects.filter(moeda_id__in=moeda_ids).aggregate(fim=Max('data'))['fim']
+        data_fim = max(data_fim or data_inicio, data_inicio)
+
+        # Mesmo trecho de cotações que calcular_evolucao: desde o início do mês da primeira compra
+        series = carregar_series(moeda_ids, data_inicio.replace(day=1))
+        return _gravar(usuario_id, _avaliar_dias(lotes, series, data_inicio, data_fim), a_partir_de or data_inicio)
+
+
+def atualizar_snapshots(usuario_id):
+    """
+    Acrescenta os snapshots dos dias com cotação ainda não processados, partindo da posição
+    do último snapshot (sem reprocessar o histórico). Sem snapshots, ou com compras
+    posteriores ao último, recalcula.
+    """
+    with transaction.atomic():
+        _bloquear_usuario(usuario_id)
+        ultimo = PatrimonioSnapshot.objects.filter(usuario_id=usuario_id).order_by('-data').first()
+        if ultimo is None:
+            return recalcular_snapshots(usuario_id)
+
+        lotes = _lotes_do_usuario(usuario_id)
+        inicio = ultimo.data + timedelta(days=1)
+        if any(data_compra >= inicio for _, data_compra, _ in lotes):
+            return recalcular_snapshots(usuario_id, inicio)
+
+        data_fim = ultima_data_cotacao(usuario_id)
+        if not lotes or data_fim is None or data_fim < inicio:
+            return 0
+
+        estado_inicial = {int(moeda_id): posicao for moeda_id, posicao in ultimo.composicao.items()}
+        series = carregar_series(sorted({moeda_id for moeda_id, _, _ in lotes}), inicio)
+        return _gravar(usuario_id, _avaliar_dias(lotes, series, inicio, data_fim, estado_inicial), inicio)
+
+
+def invalidar_snapshots(usuario_id, a_partir_de):
+    """
+    Remove os snapshots a partir da data (ficam desatualizados após uma mudança nos ativos
+    ou nas cotações). Até o recálculo, as leituras usam o cálculo direto.
+    """
+    PatrimonioSnapshot.objects.filter(usuario_id=usuario_id, data__gte=a_partir_de).delete()
+
+
+def _remover_snapshots_moeda(moeda_id, a_partir_de):
+    PatrimonioSnapshot.objects.filter(usuario__ativo__moeda_id=moeda_id, data__gte=a_partir_de).delete()
+
+
+def invalidar_snapshots_moeda(moeda_id, a_partir_de):
+    """
+    Remove, a partir da data, os snapshots dos usuários com ativos da moeda, após uma
+    mudança nas suas cotações. A remoção é repetida após o commit, para descartar snapshots
+    recalculados com as cotações anteriores enquanto a transação estava aberta; dentro da
+    transação, só uma data anterior à já tratada para a moeda gera nova remoção.
+    """
+    tratada = valor_despacho_pendente(('snapshots_moeda', moeda_id))
+    if tratada is not None and tratada <= a_partir_de:
+        return
+    _remover_snapshots_moeda(moeda_id, a_partir_de)
+    despachar_apos_commit(('snapshots_moeda', moeda_id), a_partir_de, lambda data: _remover_snapshots_moeda(moeda_id, data))
+
+
+def ultima_data_cotacao(usuario_id):
+    return UltimaCotacao.objects.filter(
+        moeda__ativo__usuario_id=usuario_id
+    ).aggregate(ultima=Max('data'))['ultima']
+
+
+def snapshots_cobrem_carteira(usuario_id, lotes):
+    """
+    Indica se os snapshots cobrem todo o período da carteira: da primeira compra até a
+    cotação mais recente das moedas do usuário.
+    """
+    cobertura = PatrimonioSnapshot.objects.filter(usuario_id=usuario_id).aggregate(inicio=Min('data'), fim=Max('data'))
+    if cobertura['inicio'] is None:
+        return False
+    ultima = ultima_data_cotacao(usuario_id)
+    primeira_compra = min(data_compra for _, data_compra, _ in lotes)
+    return cobertura['inicio'] <= primeira_compra and (ultima is None or cobertura['fim'] >= ultima)
+
+
+def evolucao_por_snapshots(usuario_id, agrupamento):
+    """
+    Evolução por período lida dos snapshots, igual à de calcular_evolucao: para cada moeda,
+    o resultado (fechamento * quantidade - custo) do último dia cotado do período, somado
+    entre as moedas. Retorna {chave_periodo: Decimal} em ordem cronológica.
+    """
+    resultados = {}
+    snapshots = PatrimonioSnapshot.objects.filter(usuario_id=usuario_id).order_by('data').values_list('data', 'composicao')
+    for data, composicao in snapshots.iterator():
+        chave = chave_periodo(data, agrupamento)
+        for moeda_id, posicao in composicao.items():
+            if posicao['cotado']:
+                resultados[chave, moeda_id] = Decimal(posicao['preco']) * Decimal(posicao['quantidade']) - Decimal(posicao['custo'])
+
+    soma_periodo = defaultdict(lambda: Decimal('0.00'))
+    for (chave, _), resultado in resultados.items():
+        soma_periodo[chave] += resultado
+    return dict(sorted(soma_periodo.items()))
@@ -0,0 +1,41 @@
+# patrimonio/tasks.py
+from celery import shared_task
+from ativo.models import Ativo
+from integracao.despacho import despachar_apos_commit
+from integracao.historico_service import to_date
+from .snapshots import atualizar_snapshots, invalidar_snapshots, recalcular_snapshots
+
+
+@shared_task
+def recalcular_snapshots_task(usuario_id, a_partir_de=None):
+    """
+    Recalcula os snapshots diários do patrimônio do usuário a partir da data informada
+    (todos, se não for informada).
+    """
+    a_partir_de = to_date(a_partir_de) if a_partir_de else None
+    return recalcular_snapshots(usuario_id, a_partir_de)
+
+
+@shared_task
+def atualizar_snapshots_task():
+    """
+    Tarefa noturna: acrescenta os snapshots dos novos dias de cotação de todos os
+    usuários com ativos, sem reprocessar o histórico.
+    """
+    usuario_ids = Ativo.objects.values_list('usuario_id', flat=True).distinct()
+    return {usuario_id: atualizar_snapshots(usuario_id) for usuario_id in usuario_ids}
+
+
+def agendar_recalculo(usuario_id, a_partir_de):
+    """
+    Invalida os snapshots do usuário a partir da data e agenda o recálculo para depois do
+    commit. Várias alterações na mesma transação geram um único recálculo por usuário,
+    a partir da menor data.
+    """
+    a_partir_de = to_date(a_partir_de)
+    invalidar_snapshots(usuario_id, a_partir_de)
+    despachar_apos_commit(
+        ('recalculo_snapshots', usuario_id),
+        a_partir_de,
+        lambda data: recalcular_snapshots_task.delay(usuario_id, data.isoformat())
+    )
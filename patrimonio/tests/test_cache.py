@@ -0,0 +1,114 @@
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from ativo.models import Ativo
+from integracao.despacho import _DespachoPendente
+from moeda.models import Moeda, HistoricoCotacao
+from patrimonio.cache import estatisticas_cache, versao_dados
+from usuario.models import Usuario
+
+
+@patch('ativo.signals.buscar_cotacoes_task.delay')
+class CachePatrimonioTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username='testuser', password='testpass')
+        self.moeda = Moeda.objects.create(nome='Bitcoin', token='BTC', usuario=self.usuario)
+        HistoricoCotacao.objects.create(moeda=self.moeda, data=date(2024, 1, 10), abertura=1, fechamento=Decimal('40000'), alta=1, baixa=1, volume=1)
+        Ativo.objects.create(usuario=self.usuario, moeda=self.moeda, data_compra=date(2024, 1, 10), quantidade=Decimal('0.5'), valor_compra=20000)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.usuario)
+        self.url = reverse('dashboard-grafico-distribuicao-ativos')
+
+    def test_segunda_requisicao_vem_do_cache(self, mock_delay):
+        primeira = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.url)
+
+        self.assertEqual(segunda.status_code, status.HTTP_200_OK)
+        self.assertEqual(segunda.data, primeira.data)
+        self.assertEqual(estatisticas_cache(), {'acertos': 1, 'falhas': 1, 'taxa_acerto': 0.5})
+
+    def test_nova_cotacao_invalida_o_cache(self, mock_delay):
+        self.client.get(self.url)
+        versao = versao_dados(self.usuario.id)
+
+        HistoricoCotacao.objects.create(moeda=self.moeda, data=date(2024, 1, 11), abertura=1, fechamento=Decimal('42000'), alta=1, baixa=1, volume=1)
+        response = self.client.get(self.url)
+
+        self.assertNotEqual(versao_dados(self.usuario.id), versao)
+        self.assertEqual(response.data['valor_total_carteira'], Decimal('21000'))
+        self.assertEqual(estatisticas_cache()['acertos'], 0)
+
+    def test_alteracao_de_ativo_invalida_o_cache(self, mock_delay):
+        self.client.get(self.url)
+
+        Ativo.objects.create(usuario=self.usuario, moeda=self.moeda, data_compra=date(2024, 1, 10), quantidade=Decimal('0.5'), valor_compra=20000)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data['distribuicao'][0]['quantidade_total'], Decimal('1'))
+
+    def test_parametros_e_usuario_fazem_parte_da_chave(self, mock_delay):
+        url = reverse('patrimonio-evolucao-evolucao-patrimonio')
+        self.client.get(url, {'agrupamento': 'mensal'})
+        self.client.get(url, {'agrupamento': 'anual'})
+
+        outro = Usuario.objects.create_user(username='outro', password='testpass')
+        self.client.force_authenticate(user=outro)
+        response = self.client.get(url, {'agrupamento': 'mensal'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(estatisticas_cache()['acertos'], 0)
+
+    def test_etag_responde_304_sem_calcular(self, mock_delay):
+        primeira = self.client.get(self.url)
+        etag = primeira['ETag']
+
+        with patch('patrimonio.views.Ativo.objects.filter') as mock_filter, self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        mock_filter.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_muda_com_nova_cotacao(self, mock_delay):
+        url = reverse('ativo-detalhe-historico-preco', args=[self.moeda.id])
+        etag = self.client.get(url)['ETag']
+
+        HistoricoCotacao.objects.create(moeda=self.moeda, data=date(2024, 1, 11), abertura=1, fechamento=Decimal('42000'), alta=1, baixa=1, volume=1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['historico'][0]['preco'], Decimal('41000'))
+
+    def test_exclusao_em_lote_consulta_usuarios_uma_vez_por_moeda(self, mock_delay):
+        for dia in range(11, 21):
+            HistoricoCotacao.objects.create(moeda=self.moeda, data=date(2024, 1, dia), abertura=1, fechamento=Decimal('42000'), alta=1, baixa=1, volume=1)
+        versao = versao_dados(self.usuario.id)
+
+        with patch('usuario.models.Usuario.objects.filter', wraps=Usuario.objects.filter) as mock_filter:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    HistoricoCotacao.objects.filter(moeda=self.moeda, data__gte=date(2024, 1, 11)).delete()
+
+        self.assertEqual(mock_filter.call_count, 1)
+        self.assertEqual(len([c for c in callbacks if isinstance(c, _DespachoPendente) and c.chave == ('cache_moeda', self.moeda.id)]), 1)
+        self.assertNotEqual(versao_dados(self.usuario.id), versao)
+
+    def test_exclusao_da_moeda_invalida_o_dono_sem_consultar_por_cotacao(self, mock_delay):
+        versao = versao_dados(self.usuario.id)
+
+        with patch('patrimonio.signals.invalidar_cache_moeda') as mock_invalidar:
+            self.moeda.delete()
+
+        mock_invalidar.assert_not_called()
+        self.assertNotEqual(versao_dados(self.usuario.id), versao)
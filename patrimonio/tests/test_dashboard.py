@@ -9,6 +9,8 @@ from decimal import Decimal
 from datetime import date  # Importante para definir a data de compra
 from ativo.signals import iniciar_busca_apos_criacao_ativo
 from django.db.models.signals import post_save
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 class DashboardViewSetTests(TestCase):
 
@@ -155,3 +157,22 @@ class DashboardViewSetTests(TestCase):
         # Verificar se o status da resposta é 401 Unauthorized
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_grafico_distribuicao_ativos_numero_de_consultas_constante(self):
+        url = '/api/v1/dashboard/grafico_distribuicao_ativos/'
+        with CaptureQueriesContext(connection) as consultas_iniciais:
+            self.client.get(url)
+
+        # Adiciona vários lotes das mesmas moedas
+        for dia in range(1, 21):
+            Ativo.objects.create(moeda=self.moeda_btc, quantidade=Decimal('0.1'), valor_compra=Decimal('100.00'), data_compra=date(2024, 2, dia), usuario=self.usuario)
+            Ativo.objects.create(moeda=self.moeda_eth, quantidade=Decimal('1'), valor_compra=Decimal('100.00'), data_compra=date(2024, 2, dia), usuario=self.usuario)
+
+        with self.assertNumQueries(len(consultas_iniciais)):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for ativo in response.data['distribuicao']:
+            if ativo['moeda'] == 'Bitcoin':
+                self.assertEqual(ativo['quantidade_total'], Decimal('3.5'))
+            elif ativo['moeda'] == 'Ethereum':
+                self.assertEqual(ativo['quantidade_total'], Decimal('30'))
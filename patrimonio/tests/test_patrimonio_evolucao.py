@@ -8,6 +8,8 @@ from moeda.models import Moeda, HistoricoCotacao
 from ativo.models import Ativo
 from corretora.models import CorretoraConfig, CorretoraUsuario, TipoOperacao
 from unittest.mock import patch 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 class PatrimonioEvolucaoViewSetTests(APITestCase):
 
@@ -185,4 +187,32 @@ class PatrimonioEvolucaoViewSetTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_evolucao_patrimonio_sem_cotacao_na_data_da_compra(self):
+        # Compra em uma data sem cotação: usa o último fechamento anterior como referência
+        Ativo.objects.create(usuario=self.usuario, moeda=self.moeda_eth, quantidade=Decimal('2.0'), valor_compra=Decimal('3000.00'), data_compra=date(2022, 1, 20))
 
+        response = self.client.get(reverse('patrimonio-evolucao-evolucao-patrimonio'), {'agrupamento': 'mensal'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # ETH: referência 3050 (15/01); janeiro (3030 - 3050) * 2 = -40; fevereiro (3150 - 3050) * 2 = 200; março (3120 - 3050) * 2 = 140
+        esperado = {'March 2022': Decimal('2890'), 'February 2022': Decimal('-650'), 'January 2022': Decimal('-190')}
+        resultado = {item['periodo']: Decimal(item['valor']) for item in response.data['results']}
+        self.assertEqual(resultado, esperado)
+
+    def test_evolucao_patrimonio_numero_de_consultas_constante(self):
+        url = reverse('patrimonio-evolucao-evolucao-patrimonio')
+        with CaptureQueriesContext(connection) as consultas_iniciais:
+            self.client.get(url, {'agrupamento': 'mensal'})
+
+        # Mais lotes e mais histórico não aumentam o número de consultas
+        for dia in range(1, 28):
+            Ativo.objects.create(usuario=self.usuario, moeda=self.moeda_eth, quantidade=Decimal('0.1'), valor_compra=Decimal('100.00'), data_compra=date(2022, 1, dia))
+            HistoricoCotacao.objects.create(moeda=self.moeda_eth, data=date(2022, 4, dia), abertura=1, fechamento=3000, alta=1, baixa=1, volume=1)
+
+        with self.assertNumQueries(len(consultas_iniciais)):
+            response = self.client.get(url, {'agrupamento': 'mensal'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_evolucao_patrimonio_agrupamento_invalido(self):
+        response = self.client.get(reverse('patrimonio-evolucao-evolucao-patrimonio'), {'agrupamento': 'diario'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
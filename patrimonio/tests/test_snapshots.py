@@ -0,0 +1,153 @@
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+from django.db import transaction
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from ativo.models import Ativo
+from integracao.historico_service import salvar_cotacao, salvar_cotacoes_em_lote
+from moeda.models import Moeda, HistoricoCotacao
+from patrimonio.evolucao import AGRUPAMENTOS, calcular_evolucao
+from patrimonio.models import PatrimonioSnapshot
+from patrimonio.snapshots import atualizar_snapshots, evolucao_por_snapshots, recalcular_snapshots, snapshots_cobrem_carteira
+from usuario.models import Usuario
+
+
+@patch('ativo.signals.buscar_cotacoes_task.delay')
+class PatrimonioSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='testuser', password='testpass')
+        self.moeda_btc = Moeda.objects.create(nome='Bitcoin', token='BTC', usuario=self.usuario)
+        self.moeda_eth = Moeda.objects.create(nome='Ethereum', token='ETH', usuario=self.usuario)
+
+        for moeda, data, fechamento in [
+            (self.moeda_btc, date(2022, 1, 10), '40500'),
+            (self.moeda_btc, date(2022, 1, 31), '40200'),
+            (self.moeda_btc, date(2022, 2, 11), '40000'),
+            (self.moeda_btc, date(2022, 2, 28), '39500'),
+            (self.moeda_btc, date(2022, 3, 30), '42500'),
+            (self.moeda_eth, date(2022, 1, 15), '3050'),
+            (self.moeda_eth, date(2022, 2, 28), '3150'),
+            (self.moeda_eth, date(2022, 3, 30), '3100'),
+        ]:
+            HistoricoCotacao.objects.create(moeda=moeda, data=data, abertura=1, fechamento=Decimal(fechamento), alta=1, baixa=1, volume=1)
+
+        # Simula o commit das compras iniciais, para que os recálculos agendados por elas não se
+        # somem aos dos testes (dentro do TestCase o commit nunca ocorre)
+        with patch('ativo.signals.buscar_cotacoes_task.delay'), \
+                patch('patrimonio.tasks.recalcular_snapshots_task.delay'), \
+                self.captureOnCommitCallbacks(execute=True):
+            for moeda, data_compra, quantidade in [
+                (self.moeda_btc, date(2022, 1, 10), Decimal('0.5')),
+                (self.moeda_btc, date(2022, 2, 11), Decimal('0.7')),
+                (self.moeda_eth, date(2022, 1, 20), Decimal('2.0')),
+            ]:
+                Ativo.objects.create(usuario=self.usuario, moeda=moeda, data_compra=data_compra, quantidade=quantidade, valor_compra=1)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.usuario)
+
+    def test_recalcular_snapshots(self, mock_delay):
+        self.assertEqual(recalcular_snapshots(self.usuario.id), 80)
+
+        snapshot = PatrimonioSnapshot.objects.get(usuario=self.usuario, data=date(2022, 3, 30))
+        self.assertAlmostEqual(snapshot.valor_total, Decimal('1.2') * 42500 + 2 * 3100, places=6)
+        self.assertAlmostEqual(snapshot.custo_total, Decimal('0.5') * 40500 + Decimal('0.7') * 40000 + 2 * 3050, places=6)
+        self.assertEqual(Decimal(snapshot.composicao[str(self.moeda_eth.id)]['quantidade']), Decimal('2'))
+
+    def test_evolucao_lida_dos_snapshots(self, mock_delay):
+        recalcular_snapshots(self.usuario.id)
+        lotes = list(Ativo.objects.values_list('moeda_id', 'data_compra', 'quantidade'))
+        self.assertTrue(snapshots_cobrem_carteira(self.usuario.id, lotes))
+
+        with patch('patrimonio.views.calcular_evolucao') as mock_calcular:
+            response = self.client.get(reverse('patrimonio-evolucao-evolucao-patrimonio'), {'agrupamento': 'mensal'})
+        mock_calcular.assert_not_called()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Mesmos valores do cálculo direto a partir das cotações
+        esperado = [('March 2022', '2850'), ('February 2022', '-650'), ('January 2022', '-150')]
+        self.assertEqual(len(response.data['results']), len(esperado))
+        for item, (periodo, valor) in zip(response.data['results'], esperado):
+            self.assertEqual(item['periodo'], periodo)
+            self.assertAlmostEqual(Decimal(item['valor']), Decimal(valor), places=6)
+
+    def test_evolucao_dos_snapshots_igual_ao_calculo_direto(self, mock_delay):
+        # Lote anterior à primeira cotação da moeda, mês sem cotação de uma das moedas e
+        # compra depois da última cotação do mês
+        moeda_sol = Moeda.objects.create(nome='Solana', token='SOL', usuario=self.usuario)
+        for data, fechamento in [(date(2022, 2, 5), '101.1234567891'), (date(2022, 2, 20), '98.5'), (date(2022, 4, 3), '120.25')]:
+            HistoricoCotacao.objects.create(moeda=moeda_sol, data=data, abertura=1, fechamento=Decimal(fechamento), alta=1, baixa=1, volume=1)
+        HistoricoCotacao.objects.create(moeda=self.moeda_btc, data=date(2022, 4, 1), abertura=1, fechamento=Decimal('45000.5'), alta=1, baixa=1, volume=1)
+        for data_compra, quantidade in [(date(2022, 1, 25), Decimal('3.3333333333')), (date(2022, 2, 25), Decimal('1.5'))]:
+            Ativo.objects.create(usuario=self.usuario, moeda=moeda_sol, data_compra=data_compra, quantidade=quantidade, valor_compra=1)
+        recalcular_snapshots(self.usuario.id)
+        lotes = list(Ativo.objects.values_list('moeda_id', 'data_compra', 'quantidade'))
+
+        for agrupamento in AGRUPAMENTOS:
+            esperado = calcular_evolucao(lotes, agrupamento)
+            evolucao = evolucao_por_snapshots(self.usuario.id, agrupamento)
+            self.assertEqual(list(evolucao), list(esperado))
+            self.assertEqual([str(valor) for valor in evolucao.values()], [str(valor) for valor in esperado.values()])
+
+    def test_nova_cotacao_invalida_snapshots_dos_usuarios_da_moeda(self, mock_delay):
+        recalcular_snapshots(self.usuario.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                salvar_cotacao(self.moeda_eth, date(2022, 2, 28), 1, Decimal('3200'), 1, 1, 1)
+
+        self.assertFalse(PatrimonioSnapshot.objects.filter(data__gte=date(2022, 2, 28)).exists())
+        self.assertTrue(PatrimonioSnapshot.objects.filter(data__lt=date(2022, 2, 28)).exists())
+
+    def test_gravacao_em_lote_invalida_snapshots(self, mock_delay):
+        recalcular_snapshots(self.usuario.id)
+
+        salvar_cotacoes_em_lote(self.moeda_btc, [
+            {'data': '2022-03-15', 'abertura': 1, 'fechamento': Decimal('41000'), 'alta': 1, 'baixa': 1, 'volume': 1},
+            {'data': '2022-03-16', 'abertura': 1, 'fechamento': Decimal('41500'), 'alta': 1, 'baixa': 1, 'volume': 1},
+        ])
+
+        self.assertFalse(PatrimonioSnapshot.objects.filter(data__gte=date(2022, 3, 15)).exists())
+        self.assertEqual(PatrimonioSnapshot.objects.filter(data__lt=date(2022, 3, 15)).count(), 64)
+
+    def test_recalculo_bloqueia_o_usuario(self, mock_delay):
+        with patch.object(Usuario.objects, 'select_for_update', wraps=Usuario.objects.select_for_update) as mock_bloquear:
+            recalcular_snapshots(self.usuario.id)
+            atualizar_snapshots(self.usuario.id)
+
+        self.assertEqual(mock_bloquear.call_count, 2)
+
+    def test_sem_snapshots_usa_calculo_direto(self, mock_delay):
+        response = self.client.get(reverse('patrimonio-evolucao-evolucao-patrimonio'), {'agrupamento': 'anual'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(Decimal(response.data['results'][0]['valor']), Decimal('2850'), places=6)
+        self.assertFalse(PatrimonioSnapshot.objects.exists())
+
+    def test_alteracao_de_ativo_invalida_snapshots(self, mock_delay):
+        recalcular_snapshots(self.usuario.id)
+
+        with patch('patrimonio.tasks.recalcular_snapshots_task.delay') as mock_recalcular, \
+                self.captureOnCommitCallbacks(execute=True):
+            Ativo.objects.create(usuario=self.usuario, moeda=self.moeda_eth, data_compra=date(2022, 3, 1), quantidade=1, valor_compra=1)
+
+        # Os snapshots a partir da compra são removidos e a leitura volta ao cálculo direto
+        self.assertFalse(PatrimonioSnapshot.objects.filter(data__gte=date(2022, 3, 1)).exists())
+        self.assertTrue(PatrimonioSnapshot.objects.filter(data__lt=date(2022, 3, 1)).exists())
+        mock_recalcular.assert_called_once_with(self.usuario.id, '2022-03-01')
+
+    def test_atualizacao_incremental(self, mock_delay):
+        recalcular_snapshots(self.usuario.id)
+        HistoricoCotacao.objects.create(moeda=self.moeda_btc, data=date(2022, 4, 2), abertura=1, fechamento=Decimal('45000'), alta=1, baixa=1, volume=1)
+
+        self.assertEqual(atualizar_snapshots(self.usuario.id), 3)
+
+        # 01/04 usa o último fechamento do ETH (30/03) e o do BTC (30/03); 02/04, o novo fechamento do BTC
+        snapshot = PatrimonioSnapshot.objects.get(usuario=self.usuario, data=date(2022, 4, 2))
+        self.assertAlmostEqual(snapshot.valor_total, Decimal('1.2') * 45000 + 2 * 3100, places=6)
+        self.assertAlmostEqual(snapshot.custo_total, Decimal('0.5') * 40500 + Decimal('0.7') * 40000 + 2 * 3050, places=6)
+        self.assertEqual(atualizar_snapshots(self.usuario.id), 0)
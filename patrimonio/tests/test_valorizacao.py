@@ -0,0 +1,77 @@
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+import numpy as np
+from ativo.models import Ativo
+from ativo.signals import iniciar_busca_apos_criacao_ativo
+from django.db.models.signals import post_save
+from moeda.models import Moeda, HistoricoCotacao
+from patrimonio.valorizacao import avaliar_carteira, reconciliar
+from usuario.models import Usuario
+
+
+class ValorizacaoTests(TestCase):
+
+    def setUp(self):
+        post_save.disconnect(iniciar_busca_apos_criacao_ativo, sender=Ativo)
+        self.usuario = Usuario.objects.create_user(username='testuser', password='testpass')
+        self.moeda_btc = Moeda.objects.create(nome='Bitcoin', token='BTC', usuario=self.usuario)
+        self.moeda_eth = Moeda.objects.create(nome='Ethereum', token='ETH', usuario=self.usuario)
+
+        for moeda, data, fechamento in [
+            (self.moeda_btc, date(2022, 1, 10), '40500'),
+            (self.moeda_btc, date(2022, 1, 31), '40200'),
+            (self.moeda_btc, date(2022, 2, 11), '40000'),
+            (self.moeda_btc, date(2022, 2, 28), '39500'),
+            (self.moeda_btc, date(2022, 3, 30), '42500'),
+            (self.moeda_eth, date(2022, 1, 15), '3050'),
+            (self.moeda_eth, date(2022, 2, 28), '3150'),
+            (self.moeda_eth, date(2022, 3, 30), '3120.10'),
+        ]:
+            HistoricoCotacao.objects.create(moeda=moeda, data=data, abertura=1, fechamento=Decimal(fechamento), alta=1, baixa=1, volume=1)
+
+        self.lotes = [
+            (self.moeda_btc.id, date(2022, 1, 10), Decimal('0.5')),
+            (self.moeda_btc.id, date(2022, 2, 11), Decimal('0.7')),
+            (self.moeda_eth.id, date(2022, 1, 20), Decimal('2.0')),
+        ]
+
+    def test_matriz_diaria_preenchida(self):
+        valorizacao = avaliar_carteira(self.lotes)
+
+        self.assertEqual(str(valorizacao.datas[0]), '2022-01-10')
+        self.assertEqual(str(valorizacao.datas[-1]), '2022-03-30')
+        # Em 05/02 o BTC vale o último fechamento (31/01) e apenas o primeiro lote está em carteira
+        indice = (date(2022, 2, 5) - date(2022, 1, 10)).days
+        linha_btc = valorizacao.moeda_ids.index(self.moeda_btc.id)
+        self.assertAlmostEqual(valorizacao.quantidades[linha_btc, indice], 0.5)
+        self.assertAlmostEqual(valorizacao.valores[linha_btc, indice], 0.5 * 40200)
+
+    def test_reconciliacao_exata(self):
+        valorizacao = avaliar_carteira(self.lotes)
+        valor_total, custo_total, por_moeda = reconciliar(self.lotes, valorizacao.matriz, date(2022, 3, 30))
+
+        self.assertEqual(por_moeda[self.moeda_eth.id], Decimal('6240.20'))
+        self.assertEqual(valor_total, Decimal('1.2') * Decimal('42500') + Decimal('6240.20'))
+        self.assertEqual(custo_total, Decimal('0.5') * 40500 + Decimal('0.7') * 40000 + 2 * 3050)
+        self.assertAlmostEqual(float(valor_total), valorizacao.valor_total[-1], places=6)
+
+    def test_sem_lotes(self):
+        self.assertIsNone(avaliar_carteira([]))
+
+    def test_endpoint_valor_diario(self):
+        for moeda_id, data_compra, quantidade in self.lotes:
+            Ativo.objects.create(usuario=self.usuario, moeda_id=moeda_id, data_compra=data_compra, quantidade=quantidade, valor_compra=1)
+        client = APIClient()
+        client.force_authenticate(user=self.usuario)
+
+        response = client.get(reverse('patrimonio-evolucao-valor-diario'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['datas']), len(response.data['valores']))
+        self.assertEqual(response.data['datas'][0], '2022-01-10')
+        self.assertEqual(response.data['valor_final'], Decimal('51000') + Decimal('6240.20'))
+        self.assertTrue(np.isclose(response.data['valores'][-1], 57240.20))
@@ -0,0 +1,191 @@
+from bisect import bisect_right
+from decimal import Decimal
+from typing import NamedTuple
+import numpy as np
+from django.db.models import OuterRef, Q, Subquery
+from moeda.arquivo import ler_arquivo
+from moeda.models import HistoricoCotacao, Moeda
+
+
+class MatrizPrecos(NamedTuple):
+    datas: np.ndarray  # datetime64[D], um elemento por dia do período
+    moeda_ids: list  # moeda de cada linha da matriz
+    precos: np.ndarray  # float64 (moedas x datas), fechamento do dia ou o último anterior; NaN antes da primeira cotação
+    cotacoes: dict  # {moeda_id: (datas, fechamentos)} com os valores Decimal originais, para reconciliação
+
+
+class Valorizacao(NamedTuple):
+    datas: np.ndarray
+    moeda_ids: list
+    quantidades: np.ndarray  # quantidade em carteira (moedas x datas)
+    custos: np.ndarray  # custo de referência acumulado (moedas x datas)
+    valores: np.ndarray  # valor de mercado por moeda (moedas x datas)
+    valor_total: np.ndarray  # valor de mercado da carteira por data
+    resultado: np.ndarray  # valor de mercado - custo de referência, por data
+    matriz: MatrizPrecos
+
+
+def carregar_matriz_precos(moeda_ids, data_inicio, data_fim):
+    """
+    Carrega os fechamentos das moedas entre data_inicio e data_fim em uma matriz
+    alinhada (moedas x dias), preenchendo os dias sem cotação com o último fechamento
+    conhecido (inclusive o anterior a data_inicio). Usa duas consultas ao banco; o trecho
+    já exportado para o arquivo colunar é lido dos arrays mapeados em memória.
+    """
+    moeda_ids = list(moeda_ids)
+    datas = np.arange(np.datetime64(data_inicio, 'D'), np.datetime64(data_fim, 'D') + 1)
+    precos = np.full((len(moeda_ids), len(datas)), np.nan)
+    linha_por_moeda = {moeda_id: linha for linha, moeda_id in enumerate(moeda_ids)}
+    cotacoes = {moeda_id: ([], []) for moeda_id in moeda_ids}
+
+    # Último fechamento anterior ao período, para iniciar o preenchimento
+    anterior = HistoricoCotacao.objects.filter(moeda=OuterRef('pk'), data__lt=data_inicio).order_by('-data')
+    iniciais = Moeda.objects.filter(pk__in=moeda_ids).annotate(
+        data_anterior=Subquery(anterior.values('data')[:1]),
+        fechamento_anterior=Subquery(anterior.values('fechamento')[:1])
+    ).filter(data_anterior__isnull=False).values_list('pk', 'data_anterior', 'fechamento_anterior')
+    for moeda_id, data, fechamento in iniciais:
+        precos[linha_por_moeda[moeda_id], 0] = float(fechamento)
+        cotacoes[moeda_id][0].append(data)
+        cotacoes[moeda_id][1].append(fechamento)
+
+    # Trecho arquivado: fatias dos arrays mapeados, sem consulta ao banco
+    filtro_banco = Q()
+    for moeda_id in moeda_ids:
+        arquivo = ler_arquivo(moeda_id)
+        if arquivo is None or arquivo.ate < data_inicio or 'fechamento' not in arquivo.colunas:
+            filtro_banco |= Q(moeda_id=moeda_id)
+            continue
+        datas_arquivo, colunas = arquivo.fatia(data_inicio, min(arquivo.ate, data_fim))
+        fechamentos = colunas['fechamento']
+        precos[linha_por_moeda[moeda_id], (datas_arquivo - datas[0]).astype(int)] = arquivo.valores_float('fechamento', fechamentos)
+        cotacoes[moeda_id][0].extend(datas_arquivo.astype(object).tolist())
+        cotacoes[moeda_id][1].extend(arquivo.valores_decimal('fechamento', fechamentos))
+        filtro_banco |= Q(moeda_id=moeda_id, data__gt=arquivo.ate)
+
+    linhas = HistoricoCotacao.objects.filter(
+        filtro_banco,
+        moeda_id__in=moeda_ids,
+        data__range=[data_inicio, data_fim]
+    ).order_by('moeda_id', 'data').values_list('moeda_id', 'data', 'fechamento')
+    for moeda_id, data, fechamento in linhas.iterator():
+        precos[linha_por_moeda[moeda_id], (data - data_inicio).days] = float(fechamento)
+        cotacoes[moeda_id][0].append(data)
+        cotacoes[moeda_id][1].append(fechamento)
+
+    return MatrizPrecos(datas, moeda_ids, _preencher_adiante(precos), cotacoes)
+
+
+def _preencher_adiante(matriz):
+    # Para cada posição, o índice da última coluna preenchida (forward fill sem laços em Python)
+    preenchidos = ~np.isnan(matriz)
+    indices = np.where(preenchidos, np.arange(matriz.shape[1]), 0)
+    np.maximum.accumulate(indices, axis=1, out=indices)
+    resultado = np.take_along_axis(matriz, indices, axis=1)
+    # Antes da primeira cotação o valor continua indefinido
+    resultado[~np.maximum.accumulate(preenchidos, axis=1)] = np.nan
+    return resultado
+
+
+def _indice_referencia(precos_moeda, indice_compra):
+    """
+    Coluna do preço de referência de uma compra: o dia da compra (já preenchido com o último
+    fechamento anterior) ou, se ainda não houver cotação, o primeiro fechamento posterior.
+    """
+    if not np.isnan(precos_moeda[indice_compra]):
+        return indice_compra
+    posteriores = np.flatnonzero(~np.isnan(precos_moeda[indice_compra:]))
+    return indice_compra + posteriores[0] if len(posteriores) else None
+
+
+def matrizes_de_lotes(lotes, matriz):
+    """
+    Representa os lotes (moeda_id, data_compra, quantidade) como funções degrau:
+    a quantidade em carteira e o custo de referência acumulado de cada moeda por dia.
+    """
+    linha_por_moeda = {moeda_id: linha for linha, moeda_id in enumerate(matriz.moeda_ids)}
+    variacao_quantidade = np.zeros(matriz.precos.shape)
+    variacao_custo = np.zeros(matriz.precos.shape)
+    inicio = matriz.datas[0]
+
+    for moeda_id, data_compra, quantidade in lotes:
+        linha = linha_por_moeda[moeda_id]
+        indice = max(0, int((np.datetime64(data_compra, 'D') - inicio).astype(int)))
+        if indice >= len(matriz.datas):
+            continue
+        referencia = _indice_referencia(matriz.precos[linha], indice)
+        if referencia is None:
+            continue
+        # Sem cotação até a compra, o lote passa a contar a partir do primeiro fechamento
+        variacao_quantidade[linha, referencia] += float(quantidade)
+        variacao_custo[linha, referencia] += float(quantidade) * matriz.precos[linha, referencia]
+
+    return np.cumsum(variacao_quantidade, axis=1), np.cumsum(variacao_custo, axis=1)
+
+
+def avaliar_carteira(lotes, data_inicio=None, data_fim=None, estado_inicial=None):
+    """
+    Avalia a carteira dia a dia, por padrão a partir da primeira compra. Retorna valor de
+    mercado e resultado (valor - custo de referência) por moeda e total, calculados como
+    operações de matriz. Retorna None se não houver lotes.
+
+    Com data_inicio, apenas os lotes comprados a partir dessa data entram nas matrizes; a
+    posição anterior vem de estado_inicial ({moeda_id: (quantidade, custo)}), o que permite
+    estender uma avaliação já calculada sem reprocessar o histórico.
+    """
+    lotes = list(lotes)
+    if not lotes:
+        return None
+    moeda_ids = sorted({moeda_id for moeda_id, _, _ in lotes})
+    if data_inicio is None:
+        data_inicio = min(data_compra for _, data_compra, _ in lotes)
+    else:
+        lotes = [lote for lote in lotes if lote[1] >= data_inicio]
+    if data_fim is None:
+        data_fim = HistoricoCotacao.objects.filter(moeda_id__in=moeda_ids).order_by('-data').values_list('data', flat=True).first()
+        data_fim = max(data_fim or data_inicio, data_inicio)
+
+    matriz = carregar_matriz_precos(moeda_ids, data_inicio, data_fim)
+    quantidades, custos = matrizes_de_lotes(lotes, matriz)
+    for moeda_id, (quantidade, custo) in (estado_inicial or {}).items():
+        if moeda_id in moeda_ids:
+            linha = moeda_ids.index(moeda_id)
+            quantidades[linha] += float(quantidade)
+            custos[linha] += float(custo)
+
+    valores = np.nan_to_num(matriz.precos) * quantidades
+    return Valorizacao(
+        datas=matriz.datas,
+        moeda_ids=moeda_ids,
+        quantidades=quantidades,
+        custos=custos,
+        valores=valores,
+        valor_total=valores.sum(axis=0),
+        resultado=(valores - custos).sum(axis=0),
+        matriz=matriz,
+    )
+
+
+def reconciliar(lotes, matriz, data):
+    """
+    Modo exato: recalcula com Decimal o valor de mercado e o custo de referência da carteira
+    em uma data, usando as cotações originais. Usado para os valores finais exibidos,
+    enquanto as séries completas ficam em ponto flutuante.
+    Retorna (valor_total, custo_total, {moeda_id: valor}).
+    """
+    valores = {moeda_id: Decimal('0') for moeda_id in matriz.moeda_ids}
+    custo_total = Decimal('0')
+    for moeda_id, data_compra, quantidade in lotes:
+        if data_compra > data:
+            continue
+        datas, fechamentos = matriz.cotacoes[moeda_id]
+        posicao_compra = bisect_right(datas, data_compra) - 1
+        if posicao_compra < 0:
+            # Sem cotação até a compra: usa o primeiro fechamento posterior (se já existir na data)
+            if not datas or datas[0] > data:
+                continue
+            posicao_compra = 0
+        posicao = bisect_right(datas, data) - 1
+        valores[moeda_id] += quantidade * fechamentos[posicao]
+        custo_total += quantidade * fechamentos[posicao_compra]
+    return sum(valores.values(), Decimal('0')), custo_total, valores
@@ -1,17 +1,20 @@
 from rest_framework import viewsets, status
 from rest_framework.viewsets import GenericViewSet
 from ativo.models import Ativo
-from moeda.models import Moeda, HistoricoCotacao
+from moeda.agregacao import quinzena
+from moeda.models import CotacaoAgregada, Moeda, HistoricoCotacao
 from moeda.serializers import HistoricoCotacaoSerializer
 from rest_framework.permissions import IsAuthenticated  # Certifique-se de que a autenticação é obrigatória
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from collections import defaultdict
 from datetime import datetime
-from decimal import Decimal
-from django.db.models.functions import TruncWeek, TruncMonth, Floor, ExtractDay, TruncYear
-from django.db.models import Avg, ExpressionWrapper, IntegerField, F, Max, Min
+from django.db.models import F, Sum
 from rest_framework.pagination import PageNumberPagination
+from patrimonio.cache import cache_resposta, etag_resposta
+from patrimonio.evolucao import AGRUPAMENTOS, calcular_evolucao, rotulo_periodo
+from patrimonio.snapshots import evolucao_por_snapshots, snapshots_cobrem_carteira
+from patrimonio.valorizacao import avaliar_carteira, reconciliar
+import numpy as np
 
 
 
@@ -24,46 +27,41 @@ class DashboardViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['get'])
+    @etag_resposta('grafico_distribuicao_ativos')
+    @cache_resposta('grafico_distribuicao_ativos')
     def grafico_distribuicao_ativos(self, request):
         user = request.user  # Obter o usuário autenticado
 
-        # Passo 1: Recuperar os ativos comprados pelo usuário
-        ativos = Ativo.objects.filter(usuario=user)
-
-        # Dicionário para agrupar ativos por moeda
-        ativos_agrupados = defaultdict(lambda: {'quantidade_total': 0, 'valor_total_compra': 0})
-
-        # Passo 2: Para cada ativo, agrupar por moeda e somar as quantidades
-        for ativo in ativos:
-            moeda = ativo.moeda
-            ativos_agrupados[moeda]['quantidade_total'] += ativo.quantidade
-            ativos_agrupados[moeda]['valor_total_compra'] += ativo.valor_compra
+        # Passo 1: Agrupar os ativos do usuário por moeda, somando quantidades e valores de compra,
+        # junto com a última cotação de cada moeda (uma única consulta, independente do número de ativos)
+        ativos_agrupados = Ativo.objects.filter(usuario=user).values(
+            'moeda', 'moeda__nome', valor_atual=F('moeda__ultima_cotacao__fechamento')
+        ).annotate(
+            quantidade_total=Sum('quantidade'),
+            valor_total_compra=Sum('valor_compra')
+        ).order_by('moeda')
 
         distribuicao = []
         valor_total_carteira = 0
 
-        # Passo 3: Calcular o valor total de cada ativo com base na última cotação
-        for moeda, dados in ativos_agrupados.items():
-            # Buscar a última cotação da moeda
-            cotacao_atual = HistoricoCotacao.objects.filter(moeda=moeda).order_by('-data').first()
-
-            if cotacao_atual:
-                valor_atual = cotacao_atual.fechamento
+        # Passo 2: Calcular o valor total de cada ativo com base na última cotação
+        for dados in ativos_agrupados:
+            if dados['valor_atual'] is not None:
                 quantidade_total = dados['quantidade_total']
-                valor_total = valor_atual * quantidade_total
+                valor_total = dados['valor_atual'] * quantidade_total
                 valor_total_carteira += valor_total
 
                 distribuicao.append({
-                    'moeda': moeda.nome,
+                    'moeda': dados['moeda__nome'],
                     'valor_total': valor_total,
                     'quantidade_total': quantidade_total
                 })
 
-        # Passo 4: Calcular a distribuição percentual com base no valor total da carteira
+        # Passo 3: Calcular a distribuição percentual com base no valor total da carteira
         for ativo in distribuicao:
             ativo['percentual'] = (ativo['valor_total'] / valor_total_carteira) * 100
 
-        # Passo 5: Retornar os dados formatados para o frontend
+        # Passo 4: Retornar os dados formatados para o frontend
         return Response({
             'valor_total_carteira': valor_total_carteira,
             'distribuicao': distribuicao
@@ -73,6 +71,8 @@ class AtivoDetalheViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     @action(detail=True, methods=['get'])
+    @etag_resposta('historico_preco')
+    @cache_resposta('historico_preco')
     def historico_preco(self, request, pk=None):
         """
         Este endpoint retorna o histórico de preços para um ativo específico (moeda),
@@ -98,6 +98,7 @@ class AtivoDetalheViewSet(viewsets.ViewSet):
             data_fim_str = request.query_params.get('data_fim')
 
             # Filtrar cotações por período, se especificado
+            data_inicio = data_fim = None
             if data_inicio_str and data_fim_str:
                 # Converter strings para objetos date
                 try:
@@ -105,58 +106,25 @@ class AtivoDetalheViewSet(viewsets.ViewSet):
                     data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
                 except ValueError:
                     return Response({"error": "Formato de data inválido. Use AAAA-MM-DD."}, status=400)
-                
-                historico_cotacoes = HistoricoCotacao.objects.filter(
-                    moeda=moeda,
-                    data__range=[data_inicio, data_fim]
-                )
-            else:
-                # Se não houver filtro de período, retorna todas as cotações
-                historico_cotacoes = HistoricoCotacao.objects.filter(moeda=moeda)
-
-            # **Aqui está o ajuste de indentação**
-            # Agrupar os dados conforme o tipo de agrupamento
-            if agrupamento == 'semanal':
-                historico_agrupado = historico_cotacoes.annotate(
-                    periodo=TruncWeek('data')
-                ).values('periodo').annotate(
-                    preco_medio=Avg('fechamento')
-                ).order_by('periodo')
 
-            elif agrupamento == 'quinzenal':
-                # Calcular a quinzena com base no dia do mês
-                historico_agrupado = historico_cotacoes.annotate(
-                    dia=ExtractDay('data'),
-                    quinzena=ExpressionWrapper(
-                        Floor((F('dia') - 1) / 15) + 1,
-                        output_field=IntegerField()
-                    ),
-                    mes=TruncMonth('data')
-                ).values('mes', 'quinzena').annotate(
-                    preco_medio=Avg('fechamento')
-                ).order_by('mes', 'quinzena')
-
-            else:  # Agrupamento mensal
-                historico_agrupado = historico_cotacoes.annotate(
-                    periodo=TruncMonth('data')
-                ).values('periodo').annotate(
-                    preco_medio=Avg('fechamento')
-                ).order_by('periodo')
+            # Candles já agregados por período (apenas os períodos nas bordas do filtro
+            # são calculados a partir das cotações diárias)
+            candles = CotacaoAgregada.serie(moeda.id, agrupamento, data_inicio, data_fim)
 
             # Formatar a resposta
             historico = []
             if agrupamento == 'quinzenal':
-                for cotacao in historico_agrupado:
+                for inicio, candle in candles:
                     historico.append({
-                        'mes': cotacao['mes'],
-                        'quinzena': cotacao['quinzena'],
-                        'preco': cotacao['preco_medio']
+                        'mes': inicio.replace(day=1),
+                        'quinzena': quinzena(inicio),
+                        'preco': candle['fechamento_medio']
                     })
             else:
-                for cotacao in historico_agrupado:
+                for inicio, candle in candles:
                     historico.append({
-                        'data': cotacao['periodo'],
-                        'preco': cotacao['preco_medio']
+                        'data': inicio,
+                        'preco': candle['fechamento_medio']
                     })
 
             return Response({
@@ -177,87 +145,58 @@ class PatrimonioEvolucaoViewSet(GenericViewSet):
     pagination_class = PatrimonioEvolucaoPagination
 
     @action(detail=False, methods=['get'], url_path='geral')
+    @cache_resposta('evolucao_patrimonio')
     def evolucao_patrimonio(self, request):
         user = request.user
 
-        # Consulta todos os ativos do usuário diretamente
-        ativos = Ativo.objects.filter(usuario=user)
-        if not ativos.exists():
+        # Consulta todos os ativos do usuário diretamente (apenas os campos usados no cálculo)
+        lotes = list(Ativo.objects.filter(usuario=user).values_list('moeda_id', 'data_compra', 'quantidade'))
+        if not lotes:
             return Response({'error': 'O usuário não possui ativos'}, status=status.HTTP_404_NOT_FOUND)
 
-        patrimonio = {}
-        soma_periodo = {}
-
-        for ativo in ativos:
-            moeda = ativo.moeda  # Obtém a moeda diretamente do ativo
-
-            # Adiciona moeda ao patrimônio, se ainda não existir
-            if moeda.nome not in patrimonio:
-                patrimonio[moeda.nome] = {'token': moeda.token, 'ativos': {}}
-
-            data_compra = ativo.data_compra
-            historio = HistoricoCotacao.objects.filter(data=data_compra, moeda=moeda).first()
-            valor_ativo = ativo.quantidade * historio.fechamento
-            patrimonio[moeda.nome]['ativos'][str(ativo)] = {'cotacoes': []}
-
-            agrupamento = request.query_params.get('agrupamento', 'mensal')
-
-            if agrupamento == 'mensal':
-                data_inicio = data_compra.replace(day=1)
-                cotacoes = HistoricoCotacao.objects.filter(
-                    moeda=moeda, 
-                    data__gte=data_inicio
-                ).annotate(
-                    mes=TruncMonth('data')
-                ).values('mes').annotate(
-                    ultimo_dia=Max('data')
-                ).order_by('mes', 'ultimo_dia')
-
-                primeira_cotacao = HistoricoCotacao.objects.filter(data=data_compra, moeda=moeda).first()
-
-                for cotacao in cotacoes:
-                    periodo = cotacao['mes'].strftime('%B %Y')
-                    ultima_cotacao = HistoricoCotacao.objects.filter(moeda=moeda, data=cotacao['ultimo_dia']).first()
-
-                    if primeira_cotacao == ultima_cotacao:
-                        evolucao_mensal = primeira_cotacao.fechamento * ativo.quantidade
-                    else:
-                        evolucao_mensal = (ultima_cotacao.fechamento - primeira_cotacao.fechamento) * ativo.quantidade
-
-                    soma_periodo[periodo] = soma_periodo.get(periodo, Decimal('0.00')) + evolucao_mensal
-
-            elif agrupamento == 'anual':
-                cotacoes = HistoricoCotacao.objects.filter(moeda=moeda, data__gte=data_compra).annotate(
-                    ano=TruncYear('data')
-                ).values('ano').annotate(
-                    ultimo_dia=Max('data')
-                ).order_by('-ano', 'ultimo_dia')
+        agrupamento = request.query_params.get('agrupamento', 'mensal')
+        if agrupamento not in AGRUPAMENTOS:
+            return Response({"error": "Agrupamento inválido."}, status=400)
 
-                for cotacao in cotacoes:
-                    periodo = cotacao['ano'].strftime('%Y')
-                    primeira_cotacao = HistoricoCotacao.objects.filter(data=data_compra, moeda=moeda).first()
-                    ultima_cotacao = HistoricoCotacao.objects.filter(moeda=moeda, data__year=cotacao['ano'].year).order_by('-data').first()
+        # Lê dos snapshots diários quando cobrem toda a carteira; caso contrário (ainda não
+        # calculados ou invalidados por uma alteração), calcula a partir das cotações
+        if snapshots_cobrem_carteira(user.id, lotes):
+            evolucao = evolucao_por_snapshots(user.id, agrupamento)
+        else:
+            evolucao = calcular_evolucao(lotes, agrupamento)
 
-                    evolucao_anual = (ultima_cotacao.fechamento - primeira_cotacao.fechamento) * ativo.quantidade
-                    soma_periodo[periodo] = soma_periodo.get(periodo, Decimal('0.00')) + evolucao_anual
-
-            else:
-                return Response({"error": "Agrupamento inválido."}, status=400)
-
-        soma_periodo_list = list(reversed([{'periodo': periodo, 'valor': str(valor)} for periodo, valor in soma_periodo.items()]))
+        # Mensal: do período mais recente para o mais antigo; anual: em ordem cronológica
+        periodos = reversed(list(evolucao)) if agrupamento == 'mensal' else evolucao
+        soma_periodo_list = [{'periodo': rotulo_periodo(chave, agrupamento), 'valor': str(evolucao[chave])} for chave in periodos]
         paginated_response = self.paginate_queryset(soma_periodo_list)
         
         return self.get_paginated_response(paginated_response)
-        
-                
-
-
-        
-
-
-
-
-
 
+    @action(detail=False, methods=['get'], url_path='diario')
+    @cache_resposta('valor_diario')
+    def valor_diario(self, request):
+        """
+        Série diária do valor de mercado da carteira desde a primeira compra, calculada de
+        forma vetorizada. Os valores finais (total, resultado e por moeda) são reconciliados
+        com Decimal a partir das cotações originais.
+        """
+        lotes = list(Ativo.objects.filter(usuario=request.user).values_list('moeda_id', 'data_compra', 'quantidade'))
+        if not lotes:
+            return Response({'error': 'O usuário não possui ativos'}, status=status.HTTP_404_NOT_FOUND)
 
+        valorizacao = avaliar_carteira(lotes)
+        data_final = valorizacao.datas[-1].astype(object)
+        valor_total, custo_total, valores_por_moeda = reconciliar(lotes, valorizacao.matriz, data_final)
+        nomes = dict(Moeda.objects.filter(pk__in=valorizacao.moeda_ids).values_list('pk', 'nome'))
 
+        return Response({
+            'datas': np.datetime_as_string(valorizacao.datas).tolist(),
+            'valores': np.round(valorizacao.valor_total, 2).tolist(),
+            'data_final': data_final,
+            'valor_final': valor_total,
+            'resultado_final': valor_total - custo_total,
+            'por_moeda': [
+                {'moeda': nomes[moeda_id], 'valor': valor}
+                for moeda_id, valor in valores_por_moeda.items()
+            ]
+        })